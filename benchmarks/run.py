@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+"""
+Benchmarks for pysilverpop's request serialization, response parsing and
+client throughput.
+
+Run from the repository root::
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --quick --filter parse
+    python benchmarks/run.py --output new.json --compare old.json
+
+Each benchmark is timed over several rounds. The results (with the package
+version and interpreter they were measured on) are written as JSON so runs
+of different versions can be compared with ``--compare``.
+"""
+from __future__ import print_function
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from silverpop import xmlbackend  # noqa: E402
+from silverpop.api import (  # noqa: E402
+    ApiResponse, LazyApiResponse, Silverpop, StreamingApiResponse)
+from silverpop.fakeserver import FakeSilverpopServer  # noqa: E402
+from silverpop.metrics import timer  # noqa: E402
+from silverpop.utils import map_to_xml, replace_in_nested_mapping  # noqa: E402
+
+BENCHMARKS = []
+
+
+def benchmark(name, **params):
+    """
+    Register a benchmark. The decorated function is called once to set up
+    and returns a ``(func, operations)`` pair: ``func`` is what gets timed,
+    and each call performs ``operations`` operations. It may also return a
+    third item, a function called once the benchmark is done to release what
+    the setup acquired.
+    """
+    def decorator(setup):
+        BENCHMARKS.append((name, params, setup))
+        return setup
+    return decorator
+
+
+def make_columns(count):
+    return dict(("COLUMN_%d" % i, "value %d <&>" % i) for i in range(count))
+
+
+# Serialization
+
+ADD_RECIPIENT = Silverpop.add_recipient.api_method
+
+for width in (5, 500):
+    @benchmark("serialize.map_to_xml", columns=width)
+    def legacy_add_recipient(columns=width):
+        values = {"list_id": 1, "created_from": 1, "columns": make_columns(columns)}
+
+        def func():
+            map_to_xml(
+                replace_in_nested_mapping(ADD_RECIPIENT.definition, values),
+                command=ADD_RECIPIENT.cmd_name)
+        return func, 1
+
+    @benchmark("serialize.build_tree", columns=width)
+    def compiled_add_recipient(columns=width):
+        values = {"list_id": 1, "created_from": 1, "columns": make_columns(columns)}
+
+        def func():
+            ADD_RECIPIENT._build_tree(**values)
+        return func, 1
+
+RELATIONAL_TABLE = Silverpop.insert_update_relational_table.api_method
+
+for row_count in (1000, 100000):
+    @benchmark("serialize.relational_table", rows=row_count)
+    def relational_table(rows=row_count):
+        table = [make_columns(10) for i in range(rows)]
+
+        def func():
+            RELATIONAL_TABLE._build_tree(table_id="1", rows=table)
+        return func, rows
+
+
+# Parsing
+
+def lists_response(count):
+    rows = b"".join(
+        b"<LIST><ID>%d</ID><NAME>List %d</NAME><TYPE>0</TYPE><SIZE>100</SIZE>"
+        b"<LAST_MODIFIED>01/01/20 12:00 AM</LAST_MODIFIED><VISIBILITY>1</VISIBILITY></LIST>"
+        % (i, i) for i in range(count))
+    return (b"<Envelope><Body><RESULT><SUCCESS>TRUE</SUCCESS>" + rows +
+            b"</RESULT></Body></Envelope>")
+
+
+class BufferResponse(object):
+    status_code = 200
+    encoding = "utf-8"
+
+    def __init__(self, content):
+        self.content = content
+
+    @property
+    def raw(self):
+        return io.BytesIO(self.content)
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8")
+
+    def close(self):
+        pass
+
+
+XML_BACKENDS = ["stdlib"] + (["lxml"] if xmlbackend.lxml_installed() else [])
+
+
+def with_backend(name, func):
+    parser = xmlbackend.get_backend(name)
+
+    def wrapped():
+        previous, xmlbackend.backend = xmlbackend.backend, parser
+        try:
+            func()
+        finally:
+            xmlbackend.backend = previous
+    return wrapped
+
+
+for list_count in (100, 10000):
+    # ApiResponse always parses with ElementTree, so the backend set makes no
+    # difference to it.
+    @benchmark("parse.api_response", lists=list_count)
+    def parse_api_response(lists=list_count):
+        content = lists_response(lists)
+        return lambda: ApiResponse(BufferResponse(content)), 1
+
+    for backend_name in XML_BACKENDS:
+        @benchmark("parse.lazy_api_response", lists=list_count, backend=backend_name)
+        def parse_lazy_api_response(lists=list_count, backend=backend_name):
+            content = lists_response(lists)
+            return with_backend(backend, lambda: LazyApiResponse(BufferResponse(content))), 1
+
+        @benchmark("parse.streaming_api_response", lists=list_count, backend=backend_name)
+        def parse_streaming_api_response(lists=list_count, backend=backend_name):
+            content = lists_response(lists)
+
+            def func():
+                for record in StreamingApiResponse(BufferResponse(content), "LIST"):
+                    pass
+            return with_backend(backend, func), 1
+
+
+# Throughput against the local fake server
+
+for worker_count in (1, 4, 16):
+    for server_latency in (0, 0.01):
+        @benchmark("client.throughput", workers=worker_count, latency=server_latency,
+                   calls=200)
+        def client_throughput(workers=worker_count, latency=server_latency, calls=200):
+            server = FakeSilverpopServer(latency=latency).start()
+            client = server.client(max_workers=workers)
+            items = [{"list_id": 1, "created_from": 1, "columns": make_columns(5)}
+                     for i in range(calls)]
+            client.add_recipient(**items[0])
+
+            def func():
+                for result in client.map("add_recipient", items):
+                    if not result.ok:
+                        raise result.exception
+
+            def teardown():
+                client.shutdown()
+                client.session.close()
+                server.stop()
+            return func, calls, teardown
+
+
+def measure(setup, params, rounds, min_time):
+    prepared = setup(**params)
+    func, operations = prepared[:2]
+    teardown = prepared[2] if len(prepared) > 2 else None
+
+    times = []
+    try:
+        func()
+        started = timer()
+        while len(times) < rounds or timer() - started < min_time:
+            start = timer()
+            func()
+            times.append(timer() - start)
+            if len(times) >= rounds * 10:
+                break
+    finally:
+        if teardown is not None:
+            teardown()
+
+    times.sort()
+    median = times[len(times) // 2]
+    return {
+        "rounds": len(times),
+        "operations": operations,
+        "min": times[0],
+        "median": median,
+        "mean": sum(times) / len(times),
+        "max": times[-1],
+        "ops_per_second": operations / median if median else None,
+    }
+
+
+def package_version():
+    try:
+        import pkg_resources
+        return pkg_resources.get_distribution("pysilverpop").version
+    except Exception:
+        return None
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(__file__),
+            stderr=subprocess.STDOUT).decode("ascii").strip()
+    except Exception:
+        return None
+
+
+def key(result):
+    return "%s[%s]" % (result["name"], ",".join(
+        "%s=%s" % item for item in sorted(result["params"].items())))
+
+
+def run(args):
+    results = []
+    for name, params, setup in BENCHMARKS:
+        if args.filter and args.filter not in name:
+            continue
+        if args.quick and params.get("rows", 0) > 1000:
+            continue
+        result = {"name": name, "params": params}
+        result.update(measure(setup, params, args.rounds, args.min_time))
+        results.append(result)
+        print("%-60s %12.6fs %14.1f ops/s" % (
+            key(result), result["median"], result["ops_per_second"] or 0))
+    return results
+
+
+def compare(results, path):
+    with open(path) as f:
+        baseline = dict((key(result), result) for result in json.load(f)["results"])
+
+    print("\nCompared with %s (median, lower is better):" % path)
+    for result in results:
+        old = baseline.get(key(result))
+        if old is None:
+            continue
+        print("%-60s %8.2fx" % (key(result), result["median"] / old["median"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="Compare against the results in this JSON file.")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this.")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.5,
+                        help="Keep timing each benchmark for at least this many seconds.")
+    parser.add_argument("--quick", action="store_true",
+                        help="Skip the largest payloads.")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "version": package_version(),
+                "revision": git_revision(),
+                "python": platform.python_version(),
+                "implementation": platform.python_implementation(),
+                "platform": platform.platform(),
+                "timestamp": time.time(),
+                "results": results,
+            }, f, indent=2, sort_keys=True)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
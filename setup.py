@@ -1,6 +1,11 @@
 #!/usr/bin/env python
+import sys
+
 from setuptools import setup, find_packages
 
+# The asyncio client uses syntax older Pythons can't byte-compile.
+exclude = ["silverpop.aio"] if sys.version_info < (3, 5) else []
+
 setup(
     name='pysilverpop',
     version='0.2.6',
@@ -8,7 +13,7 @@ setup(
     author_email='programmers@theatlantic.com',
     url='https://github.com/theatlantic/pysilverpop',
     description='Python wrapper for Acoustic (formerly Silverpop).',
-    packages=find_packages(),
+    packages=find_packages(exclude=exclude),
     include_package_data=True,
     license='BSD',
     platforms='any',
@@ -18,7 +23,12 @@ setup(
         'six',
         'requests',
         'requests_oauthlib',
+        'futures; python_version < "3.2"',
     ],
+    extras_require={
+        'async': ['aiohttp; python_version >= "3.5"'],
+        'lxml': ['lxml'],
+    },
     classifiers=[
         'Development Status :: 5 - Production/Stable',
         'Intended Audience :: Developers',
@@ -0,0 +1,360 @@
+"""
+An asyncio flavour of the :class:`silverpop.api.Silverpop` client.
+
+Requires Python 3.5+ and ``aiohttp`` (``pip install pysilverpop[async]``).
+This subpackage is left out of installs on older Pythons, which can't parse
+it.
+"""
+import asyncio
+import logging
+import time
+
+import six
+
+from ..api import Silverpop, iter_api_methods, lazy_api_method
+from ..bulk import BulkResult, RELATIONAL_TABLE_MAX_ROWS, chunked
+from ..metrics import timer
+from ..tokens import MemoryTokenStore, token_key
+from ..utils import iter_form_field
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedResponse(object):
+    """
+    The parts of a ``requests.Response`` that :class:`ApiResponse` reads,
+    filled in from a fully read aiohttp response.
+    """
+
+    def __init__(self, status_code, content, encoding="utf-8"):
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8", "replace")
+
+
+class AsyncSilverpop(object):
+    """
+    :param str client_id: Silverpop OAuth client id.
+    :param str client_secret: Silverpop OAuth client secret.
+    :param str refresh_token: Silverpop OAuth refresh token.
+    :param int server_number: Silverpop auth server number. Interpolated into API subdomain.
+    :param session: An optional ``aiohttp.ClientSession`` to send requests
+        with. By default one is created on first use and closed by `close`.
+    :param int connection_limit: The connection pool size of the session
+        created by default.
+    :param token_store: A :class:`silverpop.tokens.TokenStore` to share
+        access tokens through, with other async or sync clients. Defaults to
+        a store private to this client.
+    :param rate_limiter: A :class:`silverpop.ratelimit.RateLimiter`. Waiting
+        for it yields to the event loop.
+    :param retry_policy: A :class:`silverpop.retry.RetryPolicy` deciding
+        whether failed calls are retried.
+    :param bool lazy_responses: Return :class:`silverpop.api.LazyApiResponse`
+        objects.
+    :param bool typed_results: Return compact result records where methods
+        declare them.
+    :param cache: A :class:`silverpop.cache.ResponseCache`.
+    :param bool coalesce_reads: Let identical concurrent calls to read-only
+        methods share one request. Each caller awaits the same task, so
+        cancelling one of them does not cancel the request for the others.
+    :param list hooks: Callables passed a :class:`silverpop.metrics.CallEvent`
+        after every API call.
+
+    Every API method of :class:`silverpop.api.Silverpop` is available here
+    with the same arguments, but returns an awaitable::
+
+        async with AsyncSilverpop(client_id, secret, refresh_token, 2) as client:
+            response = await client.get_list_meta_data(list_id)
+
+    The access token is refreshed when it is missing or about to expire,
+    unless the token store holds a valid one. Only one refresh runs at a
+    time; concurrent calls wait for it.
+
+    The helpers of the sync client built on its thread pool or on blocking
+    calls (``submit``, ``map``, ``iter_records``, ``fetch_table``,
+    ``import_recipients``, ``write_behind``) have no counterpart here.
+    """
+    oauth_endpoint = Silverpop.oauth_endpoint
+    api_endpoint = Silverpop.api_endpoint
+    refresh_margin = Silverpop.refresh_margin
+
+    hooks = ()
+
+    # None of these touch the network, and they only read attributes this
+    # class sets too.
+    _emit = Silverpop._emit
+    _make_response = Silverpop._make_response
+    _token_expired = Silverpop._token_expired
+
+    def __init__(self, client_id, client_secret, refresh_token, server_number,
+                 session=None, connection_limit=100, token_store=None, rate_limiter=None,
+                 retry_policy=None, lazy_responses=False, typed_results=False,
+                 cache=None, coalesce_reads=False, hooks=None):
+        self.oauth_endpoint = self.oauth_endpoint % server_number
+        self.api_endpoint = self.api_endpoint % server_number
+
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.token = {"refresh_token": refresh_token}
+        self.token_store = token_store if token_store is not None else MemoryTokenStore()
+        self.token_key = token_key(client_id, refresh_token, server_number)
+
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.lazy_responses = lazy_responses
+        self.typed_results = typed_results
+        self.cache = cache
+        self._flights = {} if coalesce_reads else None
+        self.hooks = list(hooks or ())
+        self.session = session
+        self.connection_limit = connection_limit
+        self._owns_session = session is None
+        self._refresh_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self._owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _get_session(self):
+        if self.session is None:
+            import aiohttp
+
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connection_limit))
+        return self.session
+
+    async def refresh_access_token(self):
+        """
+        Exchange the refresh token for a new access token and save it in the
+        token store.
+        """
+        data = {
+            "grant_type": "refresh_token",
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "refresh_token": self.token["refresh_token"],
+        }
+        async with self._get_session().post(self.oauth_endpoint, data=data) as response:
+            response.raise_for_status()
+            token = await response.json()
+
+        token.setdefault("refresh_token", self.token["refresh_token"])
+        token["expires_at"] = time.time() + int(token.get("expires_in", 0))
+        self.token_store.set(self.token_key, token)
+        self.token = token
+        return token
+
+    async def _ensure_token(self):
+        if not self._token_expired(self.token):
+            return self.token
+
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            # Another task may have refreshed while we were waiting.
+            if not self._token_expired(self.token):
+                return self.token
+
+            # As in `silverpop.api.Silverpop`: another client (or process)
+            # sharing the store may already have a valid token, and the
+            # refresh we wait on for the store's lock may be for this key.
+            token = self.token_store.get(self.token_key)
+            if self._token_expired(token):
+                store_lock = self.token_store.lock(self.token_key)
+                await _enter_in_thread(store_lock)
+                try:
+                    token = self.token_store.get(self.token_key)
+                    if self._token_expired(token):
+                        token = await self.refresh_access_token()
+                finally:
+                    store_lock.__exit__(None, None, None)
+            self.token = token
+        return self.token
+
+    async def _call(self, xml, method=None, values=None, event=None):
+        if event is None:
+            return await self._call_cached(xml, method, values)
+        try:
+            response = await self._call_cached(xml, method, values, event)
+        except Exception as e:
+            self._emit(event.finish(e))
+            raise
+        self._emit(event.finish())
+        return response
+
+    async def _call_cached(self, xml, method=None, values=None, event=None):
+        cache = self.cache
+        if cache is None or method is None:
+            return await self._call_api(xml, method, event)
+
+        # `silverpop.cache.ResponseCache.call`, awaiting the call.
+        key, response = cache.lookup(self.token_key, method, xml, values)
+        if response is not None:
+            return response
+        try:
+            response = await self._call_api(xml, method, event)
+        finally:
+            cache.finish(self.token_key, method, key, values, response)
+        return response
+
+    async def _call_api(self, xml, method=None, event=None):
+        if (self._flights is None or method is None or not method.read_only or
+                not isinstance(xml, six.binary_type)):
+            return await self._call_retrying(xml, method, event)
+
+        task = self._flights.get(xml)
+        if task is None:
+            task = asyncio.ensure_future(self._call_retrying(xml, method, event))
+            self._flights[xml] = task
+
+            def done(task):
+                if self._flights.get(xml) is task:
+                    del self._flights[xml]
+            task.add_done_callback(done)
+        return await asyncio.shield(task)
+
+    async def _call_retrying(self, xml, method=None, event=None):
+        policy = self.retry_policy
+        # A streamed body can only be sent once.
+        if policy is None or not isinstance(xml, six.binary_type):
+            return await self._send(xml, method, event)
+
+        # `silverpop.retry.RetryPolicy.run`, sleeping on the event loop.
+        policy.start()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await self._send(xml, method, event)
+            except Exception as e:
+                delay = policy.retry_delay(e, attempt, method)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    async def _send(self, xml, method=None, event=None):
+        token = await self._ensure_token()
+        if self.rate_limiter is not None:
+            wait = self.rate_limiter.reserve(method.cmd_name if method is not None else None)
+            if wait:
+                await asyncio.sleep(wait)
+        headers = {"Authorization": "Bearer %s" % token["access_token"]}
+
+        if isinstance(xml, six.binary_type):
+            logger.debug("Request: %s", xml)
+            data = {"xml": xml.decode("utf-8")}
+        else:
+            logger.debug("Request: <streamed body>")
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+            data = _aiter(iter_form_field("xml", xml))
+
+        start = timer()
+        async with self._get_session().post(
+                self.api_endpoint, data=data, headers=headers) as response:
+            content = await response.read()
+            buffered = BufferedResponse(response.status, content, response.charset)
+        if event is None:
+            return self._make_response(buffered, method)
+
+        event.attempts += 1
+        event.network_time += timer() - start
+        event.response_bytes = len(content)
+        start = timer()
+        try:
+            return self._make_response(buffered, method)
+        finally:
+            event.parse_time += timer() - start
+
+    async def insert_update_relational_table_bulk(
+            self, table_id, rows, batch_size=RELATIONAL_TABLE_MAX_ROWS, max_workers=4):
+        """
+        The asyncio counterpart of
+        :meth:`silverpop.api.Silverpop.insert_update_relational_table_bulk`,
+        keeping up to ``max_workers`` batches in flight on the event loop.
+        """
+        if not 0 < batch_size <= RELATIONAL_TABLE_MAX_ROWS:
+            raise ValueError("batch_size must be between 1 and %d, got %r" % (
+                RELATIONAL_TABLE_MAX_ROWS, batch_size))
+
+        result = BulkResult()
+        pending = {}
+        batches = enumerate(chunked(rows, batch_size))
+        exhausted = False
+
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_workers:
+                try:
+                    index, batch = next(batches)
+                except StopIteration:
+                    exhausted = True
+                    break
+                task = asyncio.ensure_future(
+                    self.insert_update_relational_table(table_id, batch))
+                pending[task] = (index, batch)
+
+            if not pending:
+                break
+
+            done, _ = await asyncio.wait(list(pending), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index, batch = pending.pop(task)
+                try:
+                    result.add_response(index, batch, task.result())
+                except Exception as e:
+                    result.add_failure(index, batch, e)
+
+        return result
+
+
+# The API methods of the sync client. Their wrappers hand the request to
+# `_call`, which is a coroutine here.
+for _name, _method in iter_api_methods(Silverpop):
+    if _name not in vars(AsyncSilverpop):
+        setattr(AsyncSilverpop, _name, lazy_api_method(
+            _method, _name, _method.argnames, _method.defaults, _method.doc))
+del _name, _method
+
+
+async def _enter_in_thread(context):
+    # Token stores' locks block, so they are waited for on a worker thread
+    # rather than on the event loop.
+    future = asyncio.get_event_loop().run_in_executor(None, context.__enter__)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        def leave(entered):
+            # Nothing else will release it once the thread gets it.
+            if not entered.cancelled() and entered.exception() is None:
+                context.__exit__(None, None, None)
+        future.add_done_callback(leave)
+        raise
+
+
+class _aiter(object):
+    """
+    An async iterator over ``iterable``, for aiohttp to stream a request
+    body from. Not an async generator, which Python 3.5 lacks.
+    """
+
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            raise StopAsyncIteration
@@ -1,19 +1,56 @@
-import inspect
 import logging
+import threading
+import time
+
 import six
-from xml.etree import ElementTree
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 from requests_oauthlib import OAuth2Session
 
-from .utils import replace_in_nested_mapping, map_to_xml, get_envelope
+from . import xmlbackend
+from .bulk import RELATIONAL_TABLE_MAX_ROWS, insert_update_relational_table_bulk, map_calls
+from .coalesce import Coalescer
+from .imports import import_recipients
+from .metrics import CallEvent, timer
+from .records import RecordTable, record_class
+from .tokens import MemoryTokenStore, token_key
+from .utils import compile_mapping, escape_attrib, iter_form_field, text_element
+from .writebehind import WriteBehindBuffer
 
 logger = logging.getLogger(__name__)
 
 
+def is_http_error(status_code):
+    """
+    Whether an HTTP status means the API did not answer with an XML
+    response: throttling (429) or any server error (5xx), whose body may be
+    an HTML error page.
+    """
+    return status_code == 429 or status_code >= 500
+
+
 class api_method(object):
     """
     :param str cmd_name: The name of the XML method in the Silverpop API.
     :param tuple definition: The signature of the API method.
+    :param bool idempotent: Whether repeating the call has the same effect
+        as making it once, which makes it safe to retry after a dropped
+        connection (see :mod:`silverpop.retry`).
+    :param bool read_only: Whether the method only reads data. Read-only
+        methods are idempotent, and identical concurrent calls to them may
+        share one request (see :mod:`silverpop.coalesce`).
+    :param str repeated: The tag of the element the response repeats once per
+        record (Ex: ``LIST``), which :meth:`Silverpop.iter_records` streams.
+    :param tuple result_fields: The tags of the response's ``RESULT``, used
+        to generate the compact ``result_class`` returned by clients with
+        ``typed_results`` set (see :mod:`silverpop.records`).
+    :param tuple record_fields: The tags of each ``repeated`` element, used
+        to generate ``record_class``.
+    :param bool cacheable: Whether responses may be reused by a
+        :class:`silverpop.cache.ResponseCache`.
+    :param bool invalidates: Whether the method writes to its ``list_id``,
+        expiring the cached responses about that list.
 
     The `api_method` decorator tries to simplify declaring most of the methods
     in the API wrapper. The majority of the methods in the Silverpop API have a
@@ -24,56 +61,221 @@ class api_method(object):
 
     """
 
-    def __init__(self, cmd_name, definition=()):
+    def __init__(self, cmd_name, definition=(), idempotent=False, repeated=None,
+                 result_fields=None, record_fields=None, cacheable=False,
+                 invalidates=False, read_only=False):
         self.cmd_name = cmd_name
         self.definition = definition
+        self.read_only = read_only
+        self.idempotent = idempotent or read_only
+        self.cacheable = cacheable
+        self.invalidates = invalidates
+        self.repeated = repeated
+        self.result_fields = result_fields
+        self.record_fields = record_fields
+        self.func = None
+        self._plan = None
+        self._result_class = self._record_class = None
+
+    @property
+    def plan(self):
+        # Compiled on first use so each call only has to escape and join the
+        # values it was given.
+        if self._plan is None:
+            self._plan = compile_mapping(self.definition, command=self.cmd_name)
+        return self._plan
+
+    @property
+    def result_class(self):
+        if self._result_class is None and self.result_fields:
+            self._result_class = record_class(self.cmd_name + "Result", self.result_fields)
+        return self._result_class
+
+    @property
+    def record_class(self):
+        if self._record_class is None and self.record_fields:
+            self._record_class = record_class(self.cmd_name + "Record", self.record_fields)
+        return self._record_class
 
     def __call__(self, func):
-        outer_self = self
+        # Only the argument names and defaults are read here. The wrapper is
+        # generated the first time the method is looked up (see
+        # `lazy_api_method`), so importing the module stays cheap however
+        # many methods are declared.
+        self.func = func
+        code = func.__code__
+        argnames = code.co_varnames[:code.co_argcount]
+        defaults = func.__defaults__ or ()
+        return lazy_api_method(
+            self, func.__name__, argnames,
+            dict(zip(argnames[len(argnames) - len(defaults):], defaults)), func.__doc__)
+
+    @classmethod
+    def from_spec(cls, spec):
+        """
+        Declare a method from a plain mapping, which may have been loaded
+        from JSON::
+
+            {"name": "get_job_status", "cmd_name": "GetJobStatus",
+             "args": ["job_id"], "defaults": {},
+             "definition": [["JOB_ID", "job_id"]], "read_only": true}
+
+        ``args`` lists the arguments after ``self``. Those named in
+        ``defaults`` are optional, and must come last. Any other keys are
+        passed to the constructor.
+        """
+        spec = dict(spec)
+        name = spec.pop("name")
+        argnames = ("self",) + tuple(spec.pop("args", ()))
+        defaults = spec.pop("defaults", {})
+        doc = spec.pop("doc", None)
+        cmd_name = spec.pop("cmd_name")
+        definition = _as_definition(spec.pop("definition", ()))
+        return lazy_api_method(cls(cmd_name, definition, **spec), name, argnames, defaults, doc)
+
+    def build_request(self, *args, **kwargs):
+        """
+        Serialize a call with the wrapped method's arguments (defaults
+        included) without sending it.
+        """
+        return self._build_tree(**self.bind_arguments(*args, **kwargs))
+
+    def bind_arguments(self, *args, **kwargs):
+        """
+        Return the dict of argument values (defaults included) a call with
+        ``args`` and ``kwargs`` would be serialized from.
+        """
+        values = dict(self.defaults)
+        values.update(zip(self.argnames[1:], args))
+        for name in kwargs:
+            if name not in self.argnames[1:]:
+                raise TypeError("%s() got an unexpected keyword argument %r" % (self.name, name))
+        values.update(kwargs)
+        missing = [name for name in self.argnames[1:] if name not in values]
+        if missing:
+            raise TypeError("%s() missing required arguments: %s" % (
+                self.name, ", ".join(missing)))
+        return values
 
-        if hasattr(inspect, 'getfullargspec'):
-            argspec = inspect.getfullargspec(func)
-        else:
-            argspec = inspect.getargspec(func)
+    def build_doc(self, func=None):
+        doc = func.__doc__ if func is not None else self.doc
+        return ":API Method: ``%s``\n%s\n" % (self.cmd_name, doc or "")
+
+    def build_function(self):
+        """
+        Generate the signature-preserving function that serializes the
+        arguments and hands the request to the client's `Silverpop._call`.
+        """
+        outer_self = self
 
-        def wrapper(self, *args, **kwargs):
+        def wrapper(self, *args):
             # Name the args via zip and then put them in the kwargs.
-            values = zip(argspec.args[1:], args)
-            kwargs.update(values)
-            tree = outer_self._build_tree(**kwargs)
-            return self._call(tree)
-
-        # Preserve the argument signature of the wrapped function.
-        # fullargspec preserves the defaults while argspec does not.
-        if hasattr(inspect, 'signature'):
-            func_signature = inspect.signature(func)
-            full_argspec = str(func_signature)
-            params = func_signature.parameters
-            non_default_params = [
-                params[p].replace(default=inspect.Parameter.empty)
-                for p in argspec.args]
-            non_default_argspec = "(%s)" % ', '.join([str(p) for p in non_default_params])
-        else:
-            full_argspec = inspect.formatargspec(*argspec)
-            non_default_argspec = inspect.formatargspec(argspec.args)
+            kwargs = dict(zip(outer_self.argnames[1:], args))
+            if not self.hooks:
+                tree = outer_self._build_tree(**kwargs)
+                return self._call(tree, method=outer_self, values=kwargs)
 
-        new_func = ("def %s%s:\n"
-                    "    return wrapper%s" % (func.__name__, full_argspec, non_default_argspec))
-        exec_scope = {"wrapper": wrapper, }
+            event = CallEvent(outer_self.cmd_name)
+            tree = outer_self._build_tree(**kwargs)
+            event.serialize_time = timer() - event.start
+            if isinstance(tree, six.binary_type):
+                event.request_bytes = len(tree)
+            return self._call(tree, method=outer_self, values=kwargs, event=event)
+
+        # Preserve the argument signature. Defaults are passed in through the
+        # scope, so they don't have to survive a round trip through repr().
+        exec_scope = {"wrapper": wrapper}
+        params = []
+        for argname in self.argnames:
+            if argname in self.defaults:
+                exec_scope["_default_" + argname] = self.defaults[argname]
+                params.append("%s=_default_%s" % (argname, argname))
+            else:
+                params.append(argname)
+        new_func = ("def %s(%s):\n"
+                    "    return wrapper(%s)" % (
+                        self.name, ", ".join(params), ", ".join(self.argnames)))
 
         # Execute the signature-preserving wrapper function in a dict-based
         # closure and return it.
         six.exec_(new_func, exec_scope)
-        new_func = exec_scope[func.__name__]
-        new_func.__doc__ = self.build_doc(func)
+        new_func = exec_scope[self.name]
+        new_func.__doc__ = self.build_doc()
+        new_func.api_method = self
         return new_func
 
-    def build_doc(self, func=None):
-        return ":API Method: ``%s``\n%s\n" % (self.cmd_name, func.__doc__ or "")
-
     def _build_tree(self, **kwargs):
-        definition = replace_in_nested_mapping(self.definition, kwargs)
-        return map_to_xml(definition, command=self.cmd_name)
+        return self.plan.render(kwargs)
+
+
+def _as_definition(value):
+    # JSON has no tuples, but definitions tell nested groups (tuples) from
+    # argument names by type.
+    if isinstance(value, list):
+        return tuple(_as_definition(item) for item in value)
+    return value
+
+
+class lazy_api_method(object):
+    """
+    The class attribute `api_method` leaves in place of the decorated
+    function. The real method is generated the first time it is looked up
+    and then replaces this placeholder on the class, so later lookups cost
+    nothing extra.
+    """
+
+    def __init__(self, method, name, argnames, defaults, doc):
+        method.name = name
+        method.argnames = tuple(argnames)
+        method.defaults = defaults
+        method.doc = doc
+        self.api_method = method
+        self.__name__ = name
+        self.__doc__ = method.build_doc()
+        self._function = None
+        self._lock = threading.Lock()
+
+    def function(self):
+        with self._lock:
+            if self._function is None:
+                self._function = self.api_method.build_function()
+            return self._function
+
+    def __get__(self, instance, owner):
+        function = self.function()
+        for klass in owner.__mro__:
+            if klass.__dict__.get(self.__name__) is self:
+                setattr(klass, self.__name__, function)
+                break
+        if instance is None:
+            return function
+        return function.__get__(instance, owner)
+
+
+def iter_api_methods(cls):
+    """
+    Yield ``(name, api_method)`` for every API method declared on ``cls`` and
+    its bases, without generating their wrappers.
+    """
+    seen = set()
+    for klass in cls.__mro__:
+        for name, value in list(vars(klass).items()):
+            if name in seen:
+                continue
+            method = getattr(value, "api_method", None)
+            if isinstance(method, api_method):
+                seen.add(name)
+                yield name, method
+
+
+def register_api_methods(cls, specs, method_class=api_method):
+    """
+    Add the methods declared by ``specs`` (see :meth:`api_method.from_spec`)
+    to ``cls``.
+    """
+    for spec in specs:
+        method = method_class.from_spec(spec)
+        setattr(cls, method.__name__, method)
 
 
 class relational_table_api_method(api_method):
@@ -91,33 +293,47 @@ class relational_table_api_method(api_method):
         <COLUMN name=""></COLUMN>
 
     So we need to give it its own serializer.
+
+    The body is written row by row, so ``rows`` may be any iterable,
+    including a generator. Passing ``stream=True`` returns those chunks as an
+    iterator instead of joined bytes; `Silverpop._call` then sends them as a
+    chunked request body, and the full document never exists in memory.
     """
     def _build_tree(self, **kwargs):
-        envelope, root = get_envelope(self.cmd_name)
-
-        table_id = kwargs.pop("table_id")
-        rows = kwargs.pop("rows")
-
-        # Add the TABLE_ID tag
-        table_id_tag = ElementTree.Element("TABLE_ID")
-        table_id_tag.text = table_id
-        root.append(table_id_tag)
-
-        # Add the ROWS tag
-        rows_tag = ElementTree.Element("ROWS")
-        root.append(rows_tag)
-
-        # Iterate over the rows.
+        stream = kwargs.pop("stream", False)
+        chunks = self._iter_tree(kwargs.pop("table_id"), kwargs.pop("rows"))
+        if stream:
+            return chunks
+        return b"".join(chunks)
+
+    def _iter_tree(self, table_id, rows):
+        # The TABLE_ID tag is built eagerly so a bad value fails before any
+        # chunk is handed to the HTTP layer.
+        head = (
+            b"<Envelope><Body><" + self.cmd_name.encode("ascii") + b">" +
+            text_element("TABLE_ID", table_id))
+        tail = b"</" + self.cmd_name.encode("ascii") + b"></Body></Envelope>"
+
+        yield head
+
+        # Add the ROWS tag. An empty ROWS element is self-closing.
+        rows_open = False
         for row in rows:
-            row_tag = ElementTree.Element("ROW")
-            rows_tag.append(row_tag)
-            for key, value in six.iteritems(row):
-                column_tag = ElementTree.Element("COLUMN")
-                column_tag.attrib['name'] = key
-                column_tag.text = value
-                row_tag.append(column_tag)
+            chunk = [b"<ROWS>"] if not rows_open else []
+            rows_open = True
+
+            columns = [
+                text_element("COLUMN", value, b' name="' + escape_attrib(key) + b'"')
+                for key, value in six.iteritems(row)]
+            if columns:
+                chunk.append(b"<ROW>")
+                chunk.extend(columns)
+                chunk.append(b"</ROW>")
+            else:
+                chunk.append(b"<ROW />")
+            yield b"".join(chunk)
 
-        return ElementTree.tostring(envelope)
+        yield (b"</ROWS>" if rows_open else b"<ROWS />") + tail
 
 
 class Silverpop(object):
@@ -126,6 +342,50 @@ class Silverpop(object):
     :param str client_secret: Silverpop OAuth client secret.
     :param str refresh_token: Silverpop OAuth refersh token.
     :param int server_number: Silverpop auth server number. Interpolated into API subdomain.
+    :param int max_workers: The size of the thread pool used by `submit` and
+        `map`. The pool is only started when first needed.
+    :param int pool_connections: The number of per-host connection pools to
+        keep.
+    :param int pool_maxsize: The maximum number of connections kept open to
+        each host. Defaults to the larger of 10 and ``max_workers`` so every
+        worker thread can reuse a connection.
+    :param bool pool_block: Wait for a free connection when ``pool_maxsize``
+        connections are in use, instead of opening (and then discarding) an
+        extra one.
+    :param bool keep_alive: Reuse connections between calls. Disabling this
+        sends ``Connection: close`` with every request.
+    :param http_adapter: A ``requests`` transport adapter to send requests
+        through instead of a pool of the client's own, so several clients can
+        share connections (see :class:`silverpop.pool.ClientPool`). The
+        ``pool_*`` arguments are ignored when it is given.
+    :param float connect_timeout: Seconds to wait for a connection to the API.
+    :param float read_timeout: Seconds to wait for a response once
+        connected. ``None`` waits forever.
+    :param token_store: A :class:`silverpop.tokens.TokenStore` to share
+        access tokens through. Pass a shared
+        :class:`silverpop.tokens.MemoryTokenStore` to share them between
+        clients in a process, or a :class:`silverpop.tokens.FileTokenStore`
+        to share them between processes. Defaults to a store private to this
+        client.
+    :param rate_limiter: A :class:`silverpop.ratelimit.RateLimiter` every API
+        call waits on before it is sent.
+    :param retry_policy: A :class:`silverpop.retry.RetryPolicy` deciding
+        whether failed calls are retried. By default nothing is retried.
+    :param bool lazy_responses: Return a :class:`LazyApiResponse` from every
+        call, which only checks for success up front and doesn't keep the
+        response text or tree.
+    :param bool typed_results: Return instances of the method's compact
+        ``result_class`` (see :mod:`silverpop.records`) instead of an
+        :class:`ApiResponse` from methods that declare one, and yield
+        ``record_class`` instances from `iter_records`.
+    :param cache: A :class:`silverpop.cache.ResponseCache` to answer
+        repeated metadata and recipient lookups from.
+    :param bool coalesce_reads: Let identical concurrent calls to read-only
+        methods share one request and its response (see
+        :mod:`silverpop.coalesce`).
+    :param list hooks: Callables passed a :class:`silverpop.metrics.CallEvent`
+        after every API call, such as
+        :meth:`silverpop.metrics.MetricsRegistry.observe`.
 
     The Silverpop object is a wrapper around Silverpop's XML API. Roughly, the
     wrapper's methods are underscore-spaced versions of the XML's camel-cased
@@ -145,6 +405,12 @@ class Silverpop(object):
         Every public method on this class uses the :class:`silverpop.api.api_method`
         decorator.
 
+    A single instance can be shared between threads: requests made through
+    it share one pool of keep-alive connections, and the access token is only
+    ever refreshed by one thread at a time. Tokens are renewed
+    ``refresh_margin`` seconds before they expire, and a valid token found in
+    the token store is reused rather than refreshed.
+
     .. note::
 
         Silverpop uses a modified OAuth 2 system that uses a refresh token to
@@ -154,11 +420,53 @@ class Silverpop(object):
     oauth_endpoint = "https://api-campaign-us-%s.goacoustic.com/oauth/token"
     api_endpoint = "https://api-campaign-us-%s.goacoustic.com/XMLAPI"
 
-    def __init__(self, client_id, client_secret, refresh_token, server_number):
+    # The fields of the results returned by the methods below, from which
+    # their compact result classes are generated.
+    LIST_FIELDS = (
+        "ID", "NAME", "TYPE", "SIZE", "NUM_OPT_OUTS", "NUM_UNDELIVERABLE",
+        "LAST_MODIFIED", "VISIBILITY", "PARENT_NAME", "USER_ID",
+        "PARENT_FOLDER_ID", "IS_FOLDER", "FLAGGED_FOR_BACKUP",
+        "SUPPRESSION_LIST_ID", "IS_DATABASE_TEMPLATE",
+    )
+    LIST_META_DATA_FIELDS = LIST_FIELDS + (
+        "LAST_CONFIGURED", "CREATED", "ORGANIZATION_ID", "OPT_IN_FORM_DEFINED",
+        "OPT_OUT_FORM_DEFINED", "PROFILE_FORM_DEFINED", "OPT_IN_AUTOREPLY_DEFINED",
+        "PROFILE_AUTOREPLY_DEFINED", "COLUMNS", "KEY_COLUMNS", "SMS_KEYWORD",
+    )
+    RECIPIENT_FIELDS = (
+        "EMAIL", "Email", "RecipientId", "EmailType", "LastModified",
+        "CreatedFrom", "OptedIn", "OptedOut", "ResumeSendDate",
+        "ORGANIZATION_ID", "CRMLeadSource", "COLUMNS", "CONTACT_LISTS",
+    )
+    MAILING_FIELDS = (
+        "MailingId", "ReportId", "ScheduledTS", "MailingName", "ListName",
+        "ListId", "ParentListId", "UserName", "SentTS", "NumSent", "Subject",
+        "Visibility", "Tags",
+    )
+
+    #: Renew the access token this many seconds before it expires.
+    refresh_margin = 60
+
+    hooks = ()
+
+    def __init__(self, client_id, client_secret, refresh_token, server_number,
+                 max_workers=8, pool_connections=10, pool_maxsize=None,
+                 pool_block=False, keep_alive=True, connect_timeout=10,
+                 read_timeout=None, token_store=None, rate_limiter=None,
+                 retry_policy=None, lazy_responses=False, typed_results=False,
+                 cache=None, coalesce_reads=False, hooks=None, http_adapter=None):
         self.oauth_endpoint = self.oauth_endpoint % server_number
         self.api_endpoint = self.api_endpoint % server_number
-
-        refresh_kwargs = {
+        self.timeout = (connect_timeout, read_timeout)
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.lazy_responses = lazy_responses
+        self.typed_results = typed_results
+        self.cache = cache
+        self.coalescer = Coalescer() if coalesce_reads else None
+        self.hooks = list(hooks or ())
+
+        self.refresh_kwargs = refresh_kwargs = {
             "client_id": client_id,
             "client_secret": client_secret
         }
@@ -172,8 +480,16 @@ class Silverpop(object):
             "refresh_token": refresh_token,
         }
 
+        self.token_store = token_store if token_store is not None else MemoryTokenStore()
+        self.token_key = token_key(client_id, refresh_token, server_number)
+
+        # Guards self.token and serializes refreshes between threads.
+        self._token_lock = threading.RLock()
+
         def token_updater(token):
-            self.token = token
+            with self._token_lock:
+                self.token = token
+                self.token_store.set(self.token_key, token)
 
         # Build our session and assign it to an instance variable.
         self.session = OAuth2Session(
@@ -182,9 +498,250 @@ class Silverpop(object):
             token_updater=token_updater,
             token=self.token)
 
-    def _call(self, xml):
-        logger.debug("Request: %s" % xml)
-        response = self.session.post(self.api_endpoint, data={"xml": xml})
+        adapter = http_adapter
+        if adapter is None:
+            adapter = HTTPAdapter(
+                pool_connections=pool_connections,
+                pool_maxsize=pool_maxsize or max(10, max_workers),
+                pool_block=pool_block)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if not keep_alive:
+            self.session.headers["Connection"] = "close"
+
+        self.max_workers = max_workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def submit(self, method, *args, **kwargs):
+        """
+        Run the API ``method`` (a method name such as ``"add_recipient"``, or
+        the bound method itself) on the client's thread pool and return a
+        ``concurrent.futures.Future`` for its :class:`ApiResponse`.
+        """
+        if isinstance(method, six.string_types):
+            method = getattr(self, method)
+        return self._get_executor().submit(method, *args, **kwargs)
+
+    def map(self, method, items, max_workers=None, ordered=True):
+        """
+        Call the API ``method`` once per entry of ``items``, which are dicts
+        of keyword arguments (or tuples of positional arguments), on the
+        client's thread pool.
+
+        Yields a :class:`silverpop.bulk.CallResult` for every item, in input
+        order if ``ordered`` and in completion order otherwise. ``items`` is
+        consumed lazily, with at most ``max_workers`` calls in flight
+        (defaults to the pool size). A failed call is recorded on its result
+        rather than aborting the batch::
+
+            for result in client.map("add_recipient", recipients, max_workers=4):
+                if not result.ok:
+                    logger.warning("%r failed: %s", result.item, result.exception)
+        """
+        if isinstance(method, six.string_types):
+            method = getattr(self, method)
+        return map_calls(
+            self._get_executor(), method, items, max_workers or self.max_workers,
+            ordered=ordered)
+
+    def shutdown(self, wait=True):
+        """
+        Stop the thread pool used by `submit` and `map`, if it was started.
+        """
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def send_request(self, method, xml, values=None):
+        """
+        Send ``xml``, a request already serialized for the API ``method``
+        (Ex: ``"add_recipient"``, with ``api_method.build_request``), the way
+        calling the method would: through the client's cache, retry policy,
+        rate limiter and hooks. ``values`` are the arguments it was
+        serialized from, of which the cache reads ``list_id``.
+        """
+        definition = getattr(type(self), method).api_method
+        if not self.hooks:
+            return self._call(xml, method=definition, values=values)
+
+        event = CallEvent(definition.cmd_name)
+        if isinstance(xml, six.binary_type):
+            event.request_bytes = len(xml)
+        return self._call(xml, method=definition, values=values, event=event)
+
+    def _token_expired(self, token):
+        expires_at = token.get("expires_at") if token else None
+        return expires_at is None or float(expires_at) - self.refresh_margin <= time.time()
+
+    def _set_token(self, token):
+        self.token = token
+        self.session.token = token
+
+    def _refresh_token_if_expired(self):
+        # Refresh up front, under the lock, so that concurrent calls don't
+        # each hit OAuth2Session's own (unsynchronized) auto refresh.
+        if not self._token_expired(self.token):
+            return
+        with self._token_lock:
+            if not self._token_expired(self.token):
+                return
+
+            # Another client (or process) sharing the store may already have
+            # a valid token. Check again once we hold the store's lock, since
+            # the refresh we waited on may have been for this very key.
+            token = self.token_store.get(self.token_key)
+            if self._token_expired(token):
+                with self.token_store.lock(self.token_key):
+                    token = self.token_store.get(self.token_key)
+                    if self._token_expired(token):
+                        token = self.refresh_access_token()
+            self._set_token(token)
+
+    def refresh_access_token(self):
+        """
+        Exchange the refresh token for a new access token and save it in the
+        token store.
+        """
+        with self._token_lock:
+            token = self.session.refresh_token(
+                self.oauth_endpoint, timeout=self.timeout, **self.refresh_kwargs)
+            self.token_store.set(self.token_key, token)
+            self.token = token
+            return token
+
+    def _call(self, xml, method=None, values=None, event=None):
+        if event is None:
+            return self._call_cached(xml, method, values)
+        try:
+            response = self._call_cached(xml, method, values, event)
+        except Exception as e:
+            self._emit(event.finish(e))
+            raise
+        self._emit(event.finish())
+        return response
+
+    def _emit(self, event):
+        for hook in self.hooks:
+            try:
+                hook(event)
+            except Exception:
+                logger.exception("Call hook %r failed", hook)
+
+    def _call_cached(self, xml, method=None, values=None, event=None):
+        if self.cache is not None and method is not None:
+            return self.cache.call(
+                self.token_key, method, xml, values, lambda: self._call_api(xml, method, event))
+        return self._call_api(xml, method, event)
+
+    def _call_api(self, xml, method=None, event=None):
+        if (self.coalescer is not None and method is not None and method.read_only and
+                isinstance(xml, six.binary_type)):
+            return self.coalescer.call(xml, lambda: self._call_retrying(xml, method, event))
+        return self._call_retrying(xml, method, event)
+
+    def _call_retrying(self, xml, method=None, event=None):
+        # A streamed body can only be sent once.
+        if self.retry_policy is None or not isinstance(xml, six.binary_type):
+            return self._send(xml, method, event)
+        return self.retry_policy.run(lambda: self._send(xml, method, event), method)
+
+    def _send(self, xml, method=None, event=None):
+        response = self._post(xml, method, event=event)
+        if event is None:
+            return self._make_response(response, method)
+
+        start = timer()
+        try:
+            return self._make_response(response, method)
+        finally:
+            event.parse_time += timer() - start
+
+    def _post(self, xml, method=None, stream=False, event=None):
+        self._refresh_token_if_expired()
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(method.cmd_name if method is not None else None)
+
+        start = timer()
+        if isinstance(xml, six.binary_type):
+            logger.debug("Request: %s", xml)
+            response = self.session.post(
+                self.api_endpoint, data={"xml": xml}, timeout=self.timeout, stream=stream)
+        else:
+            # A streamed body (see `relational_table_api_method`) is sent with
+            # chunked transfer encoding, one urlencoded piece at a time.
+            logger.debug("Request: <streamed body>")
+            response = self.session.post(
+                self.api_endpoint, data=iter_form_field("xml", xml),
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+                timeout=self.timeout, stream=stream)
+
+        if event is not None:
+            event.attempts += 1
+            event.network_time += timer() - start
+            if not stream:
+                event.response_bytes = len(response.content)
+
+        if is_http_error(response.status_code):
+            raise SilverpopHTTPException(response.status_code, response.text)
+        return response
+
+    def iter_records(self, method, *args, **kwargs):
+        """
+        Call the API ``method`` (Ex: ``"get_lists"``), which must declare a
+        ``repeated`` element, and return a :class:`StreamingApiResponse`
+        that yields those elements one at a time while the response is still
+        being read::
+
+            for mailing in client.iter_records(
+                    "get_sent_mailings_for_org", "01/01/2020 00:00:00",
+                    "12/31/2020 23:59:59"):
+                audit(mailing["MailingId"])
+
+        Only one record is held in memory at a time, however large the
+        response is.
+        """
+        definition = getattr(type(self), method).api_method
+        if not definition.repeated:
+            raise ValueError("%s does not return repeated elements" % method)
+        xml = definition.build_request(*args, **kwargs)
+
+        record_class = definition.record_class if self.typed_results else None
+
+        def open_stream():
+            response = self._post(xml, definition, stream=True)
+            return StreamingApiResponse(response, definition.repeated, record_class)
+
+        if self.retry_policy is None:
+            return open_stream()
+        return self.retry_policy.run(open_stream, definition)
+
+    def fetch_table(self, method, *args, **kwargs):
+        """
+        Call the API ``method`` (which must declare ``record_fields``) and
+        load every record it returns into a column-oriented
+        :class:`silverpop.records.RecordTable`.
+        """
+        definition = getattr(type(self), method).api_method
+        if definition.record_class is None:
+            raise ValueError("%s does not declare record fields" % method)
+        records = self.iter_records(method, *args, **kwargs)
+        return RecordTable(definition.record_class, records)
+
+    def _make_response(self, response, method=None):
+        if is_http_error(response.status_code):
+            raise SilverpopHTTPException(response.status_code, response.text)
+        if self.typed_results and method is not None and method.result_class is not None:
+            return method.result_class.from_response(LazyApiResponse(response))
+        if self.lazy_responses:
+            return LazyApiResponse(response)
         return ApiResponse(response)
 
     @api_method("SendMailing", definition=(
@@ -239,7 +796,7 @@ class Silverpop(object):
         ("SYNC_FIELDS", (
             ("SYNC_FIELD", "sync_fields"),)),
         ("COLUMN", "columns"),
-    ))
+    ), invalidates=True)
     def add_recipient(
             self, list_id, created_from, send_autoreply=False,
             update_if_found=False, allow_html=False, visitor_key=None,
@@ -251,7 +808,7 @@ class Silverpop(object):
         ("LIST_ID", "list_id"),
         ("EMAIL", "email"),
         ("COLUMN", "columns"),
-    ))
+    ), invalidates=True)
     def remove_recipient(
             self, list_id, email, columns=None):
         pass
@@ -262,7 +819,7 @@ class Silverpop(object):
         ("MAILING_ID", "mailing_id"),
         ("RECIPIENT_ID", "recipient_id"),
         ("JOB_ID", "job_id"),
-    ))
+    ), invalidates=True)
     def opt_out_recipient(
             self, list_id, email=None, mailing_id=None, recipient_id=None,
             job_id=None):
@@ -283,7 +840,7 @@ class Silverpop(object):
             ("RESUME_SEND_DATE", "resume_send_date"),
             ("DAYS_TO_SNOOZE", "days_to_snooze"),
         ))
-    ))
+    ), idempotent=True, invalidates=True)
     def update_recipient(
             self, list_id, old_email=None, recipient_id=None,
             encoded_recipient_id=None, send_autoreply=None, allow_html=None,
@@ -297,7 +854,7 @@ class Silverpop(object):
         ("SEND_AUTOREPLY", "send_autoreply"),
         ("AUTO_HTML", "auto_html"),
         ("COLUMN", "columns")
-    ))
+    ), invalidates=True)
     def double_opt_in_recipient(
             self, list_id, send_autoreply=None, auto_html=None, columns=None):
         pass
@@ -346,7 +903,7 @@ class Silverpop(object):
 
     @api_method("GetListMetaData", definition=(
         ("LIST_ID", "list_id"),
-    ))
+    ), read_only=True, cacheable=True, result_fields=LIST_META_DATA_FIELDS)
     def get_list_meta_data(self, list_id):
         pass
 
@@ -356,7 +913,7 @@ class Silverpop(object):
         ("VISIBILITY", "shared"),
         ("PARENT_FOLDER_ID", "parent_folder_id"),
         ("PARENT_FOLDER_PATH", "parent_folder_path"),
-    ))
+    ), invalidates=True)
     def create_contact_list(
             self, database_id, contact_list_name, shared,
             parent_folder_id=None, parent_folder_path=None):
@@ -366,7 +923,7 @@ class Silverpop(object):
         ("CONTACT_LIST_ID", "contact_list_id"),
         ("CONTACT_ID", "contact_id"),
         ("COLUMN", "columns"),
-    ))
+    ), invalidates=True)
     def add_contact_to_contact_list(
             self, contact_list_id, contact_id=None, columns=None):
         pass
@@ -379,7 +936,7 @@ class Silverpop(object):
         ("VISITOR_KEY", "visitor_key"),
         ("RETURN_CONTACT_LISTS", "return_contact_lists"),
         ("COLUMN", "columns"),
-    ))
+    ), read_only=True, cacheable=True, result_fields=RECIPIENT_FIELDS)
     def select_recipient_data(
             self, list_id, email=None, recipient_id=None,
             encoded_recipient_id=None, visitor_key=None,
@@ -389,7 +946,7 @@ class Silverpop(object):
     @api_method("GetReportIdByDate", definition=(
         ("MAILING_ID", "mailing_id"),
         ("DATE_START", "date_start"),
-        ("DATE_END", "date_end"),))
+        ("DATE_END", "date_end"),), read_only=True)
     def get_report_id_by_date(self, mailing_id, date_start, date_end):
         return
 
@@ -412,7 +969,7 @@ class Silverpop(object):
         ("EXCLUDE_ZERO_SENT", "exclude_zero_sent"),
         ("MAILING_COUNT_ONLY", "mailing_count_only"),
         ("EXCLUDE_TEST_MAILINGS", "exclude_test_mailings"),
-    ))
+    ), read_only=True, repeated="Mailing", record_fields=MAILING_FIELDS)
     def get_sent_mailings_for_org(
             self, date_start, date_end, private=None, shared=None,
             scheduled=None, sent=None, sending=None, optin_confirmation=None,
@@ -444,7 +1001,7 @@ class Silverpop(object):
         ("EXCLUDE_ZERO_SENT", "exclude_zero_sent"),
         ("MAILING_COUNT_ONLY", "mailing_count_only"),
         ("EXCLUDE_TEST_MAILINGS", "exclude_test_mailings"),
-    ))
+    ), read_only=True, repeated="Mailing", record_fields=MAILING_FIELDS)
     def get_sent_mailings_for_list(
             self, list_id, date_start, date_end, include_children=None,
             private=None, shared=None, scheduled=None, sent=None, sending=None,
@@ -461,7 +1018,7 @@ class Silverpop(object):
         ("TOP_DOMAIN", "top_domain"),
         ("INBOX_MONITORING", "inbox_monitoring"),
         ("PER_CLICK", "per_click"),
-    ))
+    ), read_only=True)
     def get_aggregate_tracking_for_mailing(
             self, mailing_id, report_id, top_domain=None,
             inbox_monitoring=None, per_click=None):
@@ -473,54 +1030,261 @@ class Silverpop(object):
         ("FOLDER_ID", "folder_id"),
         ("INCLUDE_ALL_LISTS", "include_all_lists"),
         ("INCLUDE_TAGS", "include_tags"),
-    ))
+    ), read_only=True, cacheable=True, repeated="LIST", record_fields=LIST_FIELDS)
     def get_lists(
             self, visibility, list_type, folder_id, include_all_lists=None,
             include_tags=None):
         pass
 
-    @relational_table_api_method("InsertUpdateRelationalTable")
-    def insert_update_relational_table(self, table_id, rows):
+    @api_method("ImportList", definition=(
+        ("MAP_FILE", "map_file"),
+        ("SOURCE_FILE", "source_file"),
+        ("FILE_ENCODING", "file_encoding"),
+    ), invalidates=True, result_fields=("JOB_ID",))
+    def import_list(self, map_file, source_file, file_encoding=None):
+        """
+        Start a data job importing ``source_file`` as described by
+        ``map_file``, both already in the upload folder. See
+        :mod:`silverpop.imports`.
+        """
+
+    @api_method("ExportList", definition=(
+        ("LIST_ID", "list_id"),
+        ("EXPORT_TYPE", "export_type"),
+        ("EXPORT_FORMAT", "export_format"),
+        ("FILE_ENCODING", "file_encoding"),
+        ("ADD_TO_STORED_FILES", "add_to_stored_files"),
+        ("DATE_START", "date_start"),
+        ("DATE_END", "date_end"),
+        ("USE_CREATED_DATE", "use_created_date"),
+        ("INCLUDE_LEAD_SOURCE", "include_lead_source"),
+        ("LIST_DATE_FORMAT", "list_date_format"),
+        ("EXPORT_COLUMNS", (
+            ("COLUMN", "export_columns"),)),
+    ), result_fields=("JOB_ID", "FILE_PATH"))
+    def export_list(
+            self, list_id, export_type, export_format, file_encoding=None,
+            add_to_stored_files=None, date_start=None, date_end=None,
+            use_created_date=None, include_lead_source=None,
+            list_date_format=None, export_columns=None):
+        """
+        Start a data job exporting the recipients of ``list_id`` to the
+        download folder. Read the file with
+        :class:`silverpop.exports.ExportReader` once the job is done.
+        """
+
+    @api_method("RawRecipientDataExport", definition=(
+        ("MAILING_ID", "mailing_id"),
+        ("REPORT_ID", "report_id"),
+        ("CAMPAIGN_ID", "campaign_id"),
+        ("LIST_ID", "list_id"),
+        ("INCLUDE_CHILDREN", "include_children"),
+        ("EVENT_DATE_START", "event_date_start"),
+        ("EVENT_DATE_END", "event_date_end"),
+        ("SEND_DATE_START", "send_date_start"),
+        ("SEND_DATE_END", "send_date_end"),
+        ("EXPORT_FORMAT", "export_format"),
+        ("FILE_ENCODING", "file_encoding"),
+        ("EXPORT_FILE_NAME", "export_file_name"),
+        ("EMAIL", "email"),
+        ("MOVE_TO_FTP", "move_to_ftp"),
+        ("PRIVATE", "private"),
+        ("SHARED", "shared"),
+        ("SENT_MAILINGS", "sent_mailings"),
+        ("SENDING", "sending"),
+        ("OPTIN_CONFIRMATION", "optin_confirmation"),
+        ("PROFILE_CONFIRMATION", "profile_confirmation"),
+        ("AUTOMATED", "automated"),
+        ("CAMPAIGN_ACTIVE", "campaign_active"),
+        ("CAMPAIGN_COMPLETED", "campaign_completed"),
+        ("CAMPAIGN_CANCELLED", "campaign_cancelled"),
+        ("CAMPAIGN_SCRAPE_TEMPLATE", "campaign_scrape_template"),
+        ("INCLUDE_TEST_MAILINGS", "include_test_mailings"),
+        ("ALL_EVENT_TYPES", "all_event_types"),
+        ("SENT", "sent"),
+        ("SUPPRESSED", "suppressed"),
+        ("OPENS", "opens"),
+        ("CLICKS", "clicks"),
+        ("OPTINS", "optins"),
+        ("OPTOUTS", "optouts"),
+        ("FORWARDS", "forwards"),
+        ("ATTACHMENTS", "attachments"),
+        ("CONVERSIONS", "conversions"),
+        ("CLICKSTREAMS", "clickstreams"),
+        ("HARD_BOUNCES", "hard_bounces"),
+        ("SOFT_BOUNCES", "soft_bounces"),
+        ("REPLY_ABUSE", "reply_abuse"),
+        ("REPLY_COA", "reply_coa"),
+        ("REPLY_OTHER", "reply_other"),
+        ("MAIL_BLOCKS", "mail_blocks"),
+        ("MAILING_RESTRICTIONS", "mailing_restrictions"),
+        ("INCLUDE_SEEDS", "include_seeds"),
+        ("INCLUDE_FORWARDS", "include_forwards"),
+        ("INCLUDE_INBOX_MONITORING", "include_inbox_monitoring"),
+        ("CODED_TYPE_FIELDS", "coded_type_fields"),
+        ("EXCLUDE_DELETED", "exclude_deleted"),
+        ("FORWARDS_ONLY", "forwards_only"),
+        ("RETURN_MAILING_NAME", "return_mailing_name"),
+        ("RETURN_SUBJECT", "return_subject"),
+        ("RETURN_CRM_CAMPAIGN_ID", "return_crm_campaign_id"),
+        ("RETURN_PROGRAM_ID", "return_program_id"),
+        ("COLUMNS", (
+            ("COLUMN", "columns"),)),
+    ), result_fields=("MAILING",))
+    def raw_recipient_data_export(
+            self, mailing_id=None, report_id=None, campaign_id=None,
+            list_id=None, include_children=None, event_date_start=None,
+            event_date_end=None, send_date_start=None, send_date_end=None,
+            export_format=None, file_encoding=None, export_file_name=None,
+            email=None, move_to_ftp=None, private=None, shared=None,
+            sent_mailings=None, sending=None, optin_confirmation=None,
+            profile_confirmation=None, automated=None, campaign_active=None,
+            campaign_completed=None, campaign_cancelled=None,
+            campaign_scrape_template=None, include_test_mailings=None,
+            all_event_types=None, sent=None, suppressed=None, opens=None,
+            clicks=None, optins=None, optouts=None, forwards=None,
+            attachments=None, conversions=None, clickstreams=None,
+            hard_bounces=None, soft_bounces=None, reply_abuse=None,
+            reply_coa=None, reply_other=None, mail_blocks=None,
+            mailing_restrictions=None, include_seeds=None,
+            include_forwards=None, include_inbox_monitoring=None,
+            coded_type_fields=None, exclude_deleted=None, forwards_only=None,
+            return_mailing_name=None, return_subject=None,
+            return_crm_campaign_id=None, return_program_id=None,
+            columns=None):
+        """
+        Start a data job exporting recipient-level events. The ``MAILING``
+        of the response holds the ``JOB_ID`` and ``FILE_PATH``. Build
+        ``columns`` with :func:`silverpop.exports.column_names`.
+        """
+
+    @api_method("GetJobStatus", definition=(
+        ("JOB_ID", "job_id"),
+    ), read_only=True, result_fields=("JOB_ID", "JOB_STATUS", "JOB_DESCRIPTION", "PARAMETERS"))
+    def get_job_status(self, job_id):
+        """
+        Read the status of a data job: ``WAITING``, ``RUNNING``,
+        ``COMPLETE``, ``CANCELED`` or ``ERROR``. See :mod:`silverpop.jobs`
+        for waiting on jobs.
+        """
+
+    @relational_table_api_method("InsertUpdateRelationalTable", idempotent=True)
+    def insert_update_relational_table(self, table_id, rows, stream=False):
         pass
 
+    def insert_update_relational_table_bulk(
+            self, table_id, rows, batch_size=RELATIONAL_TABLE_MAX_ROWS, max_workers=4):
+        """
+        Upsert an arbitrary iterator of ``rows`` into a relational table,
+        split into server-legal batches of ``batch_size`` rows with up to
+        ``max_workers`` batches in flight.
+
+        Returns a :class:`silverpop.bulk.BulkResult` listing the response of
+        every batch and any per-batch failures.
+        """
+        return insert_update_relational_table_bulk(
+            self, table_id, rows, batch_size=batch_size, max_workers=max_workers)
+
+    def import_recipients(self, transfer, list_id, records, **kwargs):
+        """
+        Import ``records`` (mappings of column name to value) into
+        ``list_id`` with a single ``ImportList`` data job, uploading the
+        files through the :class:`silverpop.transfer.FileTransfer`
+        ``transfer``. See :func:`silverpop.imports.import_recipients` for the
+        options.
+        """
+        return import_recipients(self, transfer, list_id, records, **kwargs)
+
+    def write_behind(self, **kwargs):
+        """
+        Return a :class:`silverpop.writebehind.WriteBehindBuffer` that
+        buffers and merges this client's ``add_recipient`` and
+        ``update_recipient`` calls. Keyword arguments are passed to it.
+        """
+        return WriteBehindBuffer(self, **kwargs)
+
 
 class SilverpopResponseException(Exception):
-    pass
+    def __init__(self, fault_string=None, error_id=None):
+        super(SilverpopResponseException, self).__init__(fault_string)
+        self.fault_string = fault_string
+        self.error_id = error_id
+
+
+class SilverpopHTTPException(Exception):
+    """
+    Raised when the API answers with an HTTP status that means the request
+    was not handled (429 or any 5xx), rather than with an XML response.
+    """
+    def __init__(self, status_code, body=None):
+        super(SilverpopHTTPException, self).__init__(
+            "Silverpop responded with HTTP %s" % status_code)
+        self.status_code = status_code
+        self.body = body
 
 
 class ApiResponse(object):
     def __init__(self, response):
-        logger.debug("Response: %s" % response.text)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Response: %s", response.text)
         self.response_raw = response.text
-        self.response = ElementTree.fromstring(self.response_raw.encode('utf-8'))
+        self.response = xmlbackend.stdlib_backend.fromstring(self.response_raw.encode('utf-8'))
 
-        # Very rudimentary mapping of response tags and values into the
-        # instance dict. This will probably cause some problems down the line
-        # but I'm not sure what they are yet.
         results = self.response.find(".//RESULT")
         if results is not None:
-            for value in results:
-                if value.tag == "COLUMNS":
-                    self.__dict__['COLUMNS'] = {}
-                    for column in value:
-                        name = column.find("NAME")
-                        value = column.find("VALUE")
-                        self.__dict__['COLUMNS'][name.text] = value.text
-                elif value.tag not in self.__dict__:
-                    self.__dict__[value.tag] = self._process_node(value)
-                else:
-                    if type(self.__dict__[value.tag]) != list:
-                        self.__dict__[value.tag] = [self.__dict__[value.tag]]
-
-                    self.__dict__[value.tag] += [self._process_node(value)]
+            self._load_results(results)
 
             # If the request was not successful, try to raise a descriptive
             # error.
             if getattr(self, "SUCCESS", "false").lower() == "false":
-                fault_string = self.response.find(".//Fault/FaultString").text
-                raise SilverpopResponseException(fault_string)
+                self._raise_fault(self.response)
+
+    # The tags loaded from RESULT, in document order.
+    _result_tags = ()
+
+    def result_fields(self):
+        """
+        Return the fields of the response's ``RESULT`` as a dict of tag to
+        value.
+        """
+        self._materialize()
+        return dict((tag, self.__dict__[tag]) for tag in self._result_tags)
+
+    def _materialize(self):
+        pass
+
+    def _load_results(self, results):
+        # Very rudimentary mapping of response tags and values into the
+        # instance dict. This will probably cause some problems down the line
+        # but I'm not sure what they are yet.
+        tags = []
+        for value in results:
+            if value.tag not in tags:
+                tags.append(value.tag)
+            if value.tag == "COLUMNS":
+                self.__dict__['COLUMNS'] = {}
+                for column in value:
+                    name = column.find("NAME")
+                    value = column.find("VALUE")
+                    self.__dict__['COLUMNS'][name.text] = value.text
+            elif value.tag not in self.__dict__:
+                self.__dict__[value.tag] = self._process_node(value)
+            else:
+                if type(self.__dict__[value.tag]) != list:
+                    self.__dict__[value.tag] = [self.__dict__[value.tag]]
+
+                self.__dict__[value.tag] += [self._process_node(value)]
+        self._result_tags = tuple(tags)
 
-    def _process_node(self, element):
+    @staticmethod
+    def _raise_fault(root):
+        fault_string = root.find(".//Fault/FaultString").text
+        error_id = root.find(".//Fault/detail/error/errorid")
+        raise SilverpopResponseException(
+            fault_string, error_id.text if error_id is not None else None)
+
+    @staticmethod
+    def _process_node(element):
         if element.text and element.text.rstrip():
             return element.text
 
@@ -534,3 +1298,153 @@ class ApiResponse(object):
                 value_dict[value.tag] = value.text
 
         return value_dict
+
+
+_materialize_lock = threading.Lock()
+
+
+class LazyApiResponse(ApiResponse):
+    """
+    :param response: The ``requests.Response`` to parse.
+    :param bool keep_raw: Keep the response text as ``response_raw``.
+    :param bool keep_tree: Keep the parsed document as ``response``. It is
+        parsed with ElementTree whatever the XML backend.
+
+    An :class:`ApiResponse` that parses the response bytes directly and only
+    checks ``SUCCESS`` (raising on a fault) up front. The result fields are
+    copied onto the instance the first time one of them is accessed, so
+    callers that only care whether a write succeeded never pay for them.
+    """
+    def __init__(self, response, keep_raw=False, keep_tree=False):
+        content = response.content
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Response: %s", content)
+        if keep_raw:
+            self.response_raw = response.text
+
+        if keep_tree:
+            root = self.response = xmlbackend.stdlib_backend.fromstring(content)
+        else:
+            root = xmlbackend.backend.fromstring(content)
+
+        results = root.find(".//RESULT")
+        self._results = results
+        if results is not None:
+            success = results.find("SUCCESS")
+            if success is None or (success.text or "").lower() == "false":
+                self._raise_fault(root)
+
+    def _materialize(self):
+        # The results are loaded once, then dropped. A coalesced or cached
+        # response can be read from several threads, hence the lock.
+        if "_results" in self.__dict__:
+            with _materialize_lock:
+                results = self.__dict__.pop("_results", None)
+                if results is not None:
+                    self._load_results(results)
+
+    def __getstate__(self):
+        # The unloaded results may be elements of a backend that can't be
+        # pickled (see `silverpop.xmlbackend`), so they are loaded first.
+        self._materialize()
+        return self.__dict__
+
+    def __getattr__(self, name):
+        # Only called for attributes that aren't set yet.
+        self._materialize()
+        if name in self.__dict__:
+            return self.__dict__[name]
+        raise AttributeError(name)
+
+
+class StreamingApiResponse(object):
+    """
+    :param response: A ``requests.Response`` opened with ``stream=True``.
+    :param str tag: The tag of the repeated record elements in ``RESULT``.
+    :param record_class: An optional :class:`silverpop.records.Record`
+        subclass to yield records as, instead of dicts.
+
+    Iterating yields each record, as :meth:`ApiResponse._process_node` would
+    map it, as soon as its closing tag has been read. Each element is
+    discarded once yielded. Other ``RESULT`` fields are collected in
+    ``fields`` as they are read. A fault is raised when the ``SUCCESS`` flag
+    says the call failed. A response can only be iterated once.
+
+    The connection is released once iteration finishes. A response that may
+    not be read to the end should be closed with `close`, or used as a
+    context manager::
+
+        with client.iter_records("get_lists", 0, 2, 0) as lists:
+            first = next(iter(lists))
+    """
+    def __init__(self, response, tag, record_class=None):
+        self.http_response = response
+        self.tag = tag
+        self.record_class = record_class
+        self.fields = {}
+
+    def close(self):
+        """
+        Release the connection, discarding whatever hasn't been read.
+        """
+        self.http_response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        # A response dropped without being read still gives its connection
+        # back rather than leaking it.
+        http_response = getattr(self, "http_response", None)
+        if http_response is not None:
+            http_response.close()
+
+    def __iter__(self):
+        raw = self.http_response.raw
+        # Let urllib3 undo any gzip/deflate content encoding.
+        raw.decode_content = True
+
+        depth = 0
+        result, result_depth, result_closed = None, None, False
+        failed = False
+        parser = xmlbackend.backend
+        try:
+            for event, element in parser.iterparse(raw, events=("start", "end")):
+                if event == "start":
+                    depth += 1
+                    if element.tag == "RESULT" and result is None:
+                        result, result_depth = element, depth
+                    continue
+
+                depth -= 1
+                if failed and element.tag == "Fault":
+                    body = parser.Element("Body")
+                    body.append(element)
+                    ApiResponse._raise_fault(body)
+
+                if element is result:
+                    result_closed = True
+
+                # Only direct children of RESULT are of interest; anything
+                # deeper is part of the record being read.
+                if result is None or result_closed or depth != result_depth:
+                    continue
+
+                if element.tag == self.tag:
+                    record = ApiResponse._process_node(element)
+                    if self.record_class is not None and isinstance(record, dict):
+                        record = self.record_class.from_mapping(record)
+                    yield record
+                else:
+                    self.fields[element.tag] = ApiResponse._process_node(element)
+                    if element.tag == "SUCCESS":
+                        failed = (element.text or "").lower() == "false"
+                result.remove(element)
+
+            if failed:
+                raise SilverpopResponseException(self.fields.get("FaultString"))
+        finally:
+            self.http_response.close()
@@ -0,0 +1,182 @@
+"""
+Helpers for sending many API calls from one :class:`silverpop.api.Silverpop`
+client: splitting row iterators into server-legal batches and keeping a
+bounded number of requests in flight.
+"""
+import collections
+import itertools
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+#: Silverpop rejects InsertUpdateRelationalTable requests with more rows.
+RELATIONAL_TABLE_MAX_ROWS = 100
+
+
+def chunked(iterable, size):
+    """
+    Lazily split ``iterable`` into lists of at most ``size`` items.
+    """
+    if size < 1:
+        raise ValueError("size must be at least 1, got %r" % size)
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+BatchFailure = namedtuple("BatchFailure", ["index", "rows", "exception"])
+
+
+class BulkResult(object):
+    """
+    The aggregated outcome of a bulk operation.
+
+    ``responses`` holds the :class:`silverpop.api.ApiResponse` of every
+    successful batch keyed by batch index, and ``failures`` holds a
+    :class:`BatchFailure` for every batch that raised, ordered by index.
+    """
+
+    def __init__(self):
+        self.responses = {}
+        self.failures = []
+        self.batch_count = 0
+        self.row_count = 0
+
+    @property
+    def succeeded(self):
+        return not self.failures
+
+    def add_response(self, index, rows, response):
+        self.batch_count += 1
+        self.row_count += len(rows)
+        self.responses[index] = response
+
+    def add_failure(self, index, rows, exception):
+        self.batch_count += 1
+        self.row_count += len(rows)
+        self.failures.append(BatchFailure(index, rows, exception))
+        self.failures.sort(key=lambda failure: failure.index)
+
+    def __repr__(self):
+        return "<BulkResult batches=%d rows=%d failures=%d>" % (
+            self.batch_count, self.row_count, len(self.failures))
+
+
+def iter_bounded(executor, func, items, max_in_flight):
+    """
+    Submit ``func(item)`` for each of ``items`` to ``executor`` while never
+    having more than ``max_in_flight`` calls pending, so ``items`` is only
+    consumed as fast as calls complete.
+
+    Yields ``(index, item, future)`` for every call in completion order.
+    """
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be at least 1, got %r" % max_in_flight)
+
+    pending = {}
+    items = enumerate(items)
+    exhausted = False
+
+    while pending or not exhausted:
+        while not exhausted and len(pending) < max_in_flight:
+            try:
+                index, item = next(items)
+            except StopIteration:
+                exhausted = True
+                break
+            pending[executor.submit(func, item)] = (index, item)
+
+        if not pending:
+            break
+
+        done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+        for future in done:
+            index, item = pending.pop(future)
+            yield index, item, future
+
+
+class CallResult(namedtuple("CallResult", ["index", "item", "response", "exception"])):
+    """
+    The outcome of one call made by :meth:`silverpop.api.Silverpop.map`:
+    ``item`` is the arguments it was called with, and exactly one of
+    ``response`` and ``exception`` is set.
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.exception is None
+
+
+def _call_item(func, item):
+    if isinstance(item, dict):
+        return func(**item)
+    return func(*item)
+
+
+def _result(index, item, future):
+    try:
+        return CallResult(index, item, future.result(), None)
+    except Exception as e:
+        return CallResult(index, item, None, e)
+
+
+def map_calls(executor, func, items, max_in_flight, ordered=True):
+    """
+    Call ``func`` once per entry of ``items`` (a dict of keyword arguments
+    or a tuple of positional ones) on ``executor``, with at most
+    ``max_in_flight`` calls pending.
+
+    Yields a :class:`CallResult` per item, in input order if ``ordered`` and
+    in completion order otherwise. An exception is recorded on its result
+    instead of stopping the remaining calls.
+    """
+    def call(item):
+        return _call_item(func, item)
+
+    if not ordered:
+        for index, item, future in iter_bounded(executor, call, items, max_in_flight):
+            yield _result(index, item, future)
+        return
+
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be at least 1, got %r" % max_in_flight)
+
+    # Only the oldest call is waited on, so the window never grows past
+    # ``max_in_flight`` even when one call is much slower than the rest.
+    pending = collections.deque()
+    for index, item in enumerate(items):
+        if len(pending) >= max_in_flight:
+            yield _result(*pending.popleft())
+        pending.append((index, item, executor.submit(call, item)))
+    while pending:
+        yield _result(*pending.popleft())
+
+
+def insert_update_relational_table_bulk(
+        client, table_id, rows, batch_size=RELATIONAL_TABLE_MAX_ROWS, max_workers=4):
+    """
+    Send ``rows`` to ``client.insert_update_relational_table`` in batches of
+    ``batch_size``, with up to ``max_workers`` batches in flight. A failing
+    batch is recorded in the returned :class:`BulkResult` rather than
+    aborting the remaining batches.
+    """
+    if not 0 < batch_size <= RELATIONAL_TABLE_MAX_ROWS:
+        raise ValueError("batch_size must be between 1 and %d, got %r" % (
+            RELATIONAL_TABLE_MAX_ROWS, batch_size))
+
+    def send(batch):
+        return client.insert_update_relational_table(table_id, batch)
+
+    result = BulkResult()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        batches = chunked(rows, batch_size)
+        for index, batch, future in iter_bounded(executor, send, batches, max_workers):
+            try:
+                result.add_response(index, batch, future.result())
+            except Exception as e:
+                result.add_failure(index, batch, e)
+    return result
@@ -0,0 +1,189 @@
+"""
+A read-through cache for API methods whose answers are safe to reuse, such
+as ``GetListMetaData`` and ``SelectRecipientData``.
+
+Entries are keyed on the serialized request (which includes the command
+name and every argument) and on *generation* tokens for the list the call
+was about. A write method such as ``AddRecipient`` replaces the generation of
+its ``list_id``. Every entry stored under the old generation then becomes
+unreachable, which works with any backend that can get and set keys,
+including shared ones.
+"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+#: The scope of calls that aren't about a particular list.
+GLOBAL_SCOPE = "*"
+
+
+class CacheBackend(object):
+    """
+    The interface for cache backends. A shared backend (Ex: one wrapping a
+    memcached or redis client) lets several processes share entries; its
+    values must then be picklable.
+    """
+
+    def get(self, key):
+        """
+        Return the value stored under ``key``, or ``None``.
+        """
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        """
+        Store ``value`` under ``key`` for ``ttl`` seconds, or indefinitely if
+        ``ttl`` is ``None``.
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+
+class MemoryCache(CacheBackend):
+    """
+    :param int max_entries: Evict the least recently used entry once this
+        many are stored.
+
+    A thread-safe in-process LRU cache with per-entry expiry.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return None
+            # Mark as most recently used.
+            del self._entries[key]
+            self._entries[key] = entry
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (expires_at, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ResponseCache(object):
+    """
+    :param backend: The :class:`CacheBackend` to store entries in. Defaults
+        to a :class:`MemoryCache`.
+    :param float ttl: How long responses are reused for, in seconds.
+    :param dict ttls: Per-command overrides of ``ttl`` (Ex:
+        ``{"GetLists": 3600}``).
+
+    Pass a cache as the ``cache`` argument of :class:`silverpop.api.Silverpop`.
+    Only methods declared ``cacheable`` on their
+    :class:`silverpop.api.api_method` are cached, and methods declared
+    ``invalidates`` expire the entries of the list they write to.
+
+    Cached responses are shared between callers and must not be modified.
+    Lists' aggregate fields (Ex: ``SIZE`` in ``GetLists``) may lag behind
+    writes by up to ``ttl``, as only calls scoped to the written list are
+    invalidated.
+    """
+
+    def __init__(self, backend=None, ttl=300, ttls=None):
+        self.backend = backend if backend is not None else MemoryCache()
+        self.ttl = ttl
+        self.ttls = dict(ttls or {})
+
+    def _scopes(self, values):
+        list_id = (values or {}).get("list_id")
+        if list_id is None:
+            return (GLOBAL_SCOPE,)
+        return (GLOBAL_SCOPE, u"%s" % list_id)
+
+    def _generation(self, namespace, scope):
+        key = "silverpop:%s:generation:%s" % (namespace, scope)
+        generation = self.backend.get(key)
+        if generation is None:
+            # A missing generation (never set, or evicted) is replaced with a
+            # fresh one rather than a fixed default, so an eviction can never
+            # make invalidated entries reachable again.
+            generation = uuid.uuid4().hex
+            self.backend.set(key, generation)
+        return generation
+
+    def key(self, namespace, method, xml, values=None):
+        """
+        The key a response to ``xml`` is cached under.
+        """
+        digest = hashlib.sha1(xml)
+        for scope in self._scopes(values):
+            digest.update(b"\0" + self._generation(namespace, scope).encode("ascii"))
+        return "silverpop:%s:%s:%s" % (namespace, method.cmd_name, digest.hexdigest())
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, method, response):
+        self.backend.set(key, response, self.ttls.get(method.cmd_name, self.ttl))
+
+    def invalidate(self, namespace, values=None):
+        """
+        Expire every entry scoped to the ``list_id`` in ``values``, or every
+        entry in ``namespace`` if there is none.
+        """
+        scope = self._scopes(values)[-1]
+        key = "silverpop:%s:generation:%s" % (namespace, scope)
+        self.backend.set(key, uuid.uuid4().hex)
+
+    def lookup(self, namespace, method, xml, values=None):
+        """
+        Return ``(key, response)`` for a call of ``method``: the key its
+        response is to be cached under (``None`` if it isn't cacheable), and
+        the cached response, if there is one.
+        """
+        if not method.cacheable or not isinstance(xml, bytes):
+            return None, None
+        key = self.key(namespace, method, xml, values)
+        return key, self.get(key)
+
+    def finish(self, namespace, method, key, values=None, response=None):
+        """
+        Cache the ``response`` of a call looked up under ``key``, and
+        invalidate entries if ``method`` is a write. Called even if the call
+        failed (leaving ``response`` ``None``), since a write may have been
+        applied anyway.
+        """
+        if key is not None and response is not None:
+            self.set(key, method, response)
+        if method.invalidates:
+            self.invalidate(namespace, values)
+
+    def call(self, namespace, method, xml, values, func):
+        """
+        Return the response to a call of ``method``, calling ``func`` only if
+        it isn't cached, and invalidating entries if ``method`` is a write.
+        """
+        key, response = self.lookup(namespace, method, xml, values)
+        if response is not None:
+            return response
+        try:
+            response = func()
+        finally:
+            self.finish(namespace, method, key, values, response)
+        return response
@@ -0,0 +1,61 @@
+"""
+Coalescing of identical concurrent calls: while one call is in flight,
+identical calls wait for it and share its result instead of sending their
+own request.
+
+Only methods declared ``read_only`` on their
+:class:`silverpop.api.api_method` are coalesced, identified by their
+serialized request XML.
+"""
+import threading
+
+
+class _Flight(object):
+    __slots__ = ("done", "result", "exception")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+
+
+class Coalescer(object):
+    """
+    Coalesces calls made from multiple threads.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def call(self, key, func):
+        """
+        Return ``func()``, unless a call with the same ``key`` is already in
+        flight, in which case wait for it and return (or raise) its outcome.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.exception is not None:
+                raise flight.exception
+            return flight.result
+
+        try:
+            flight.result = func()
+            return flight.result
+        except Exception as e:
+            flight.exception = e
+            raise
+        finally:
+            # Calls made from now on get a fresh request.
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def __len__(self):
+        return len(self._flights)
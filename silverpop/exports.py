@@ -0,0 +1,206 @@
+"""
+Reading the files written by export data jobs (``ExportList``,
+``RawRecipientDataExport``).
+
+Once a job is done, its file is in the org's download folder. An
+:class:`ExportReader` streams it through a
+:class:`silverpop.transfer.FileTransfer`, whether it is a plain CSV or a
+zip archive, and yields one compact record per row::
+
+    response = client.export_list(list_id, "ALL", "CSV")
+    # ... wait for response.JOB_ID to complete ...
+    for row in ExportReader(transfer, response.FILE_PATH, converters={"RecipientId": int}):
+        load(row)
+
+Only the row being read is held in memory, however big the export is.
+"""
+import codecs
+import csv
+import keyword
+import mmap
+import posixpath
+import re
+import shutil
+import tempfile
+import zipfile
+
+import six
+
+from .records import Record, record_class
+
+#: The field delimiter of each ``EXPORT_FORMAT``.
+DELIMITERS = {
+    "CSV": ",",
+    "TAB": "\t",
+    "PIPE": "|",
+}
+
+
+# Names a column can't take without shadowing an attribute of Record.
+RESERVED_NAMES = frozenset(
+    [name for name in dir(Record) if not name.startswith("_")] + ["extra"])
+
+
+def field_names(header):
+    """
+    Turn the column names of an export header into unique identifiers that
+    can name record fields (Ex: ``"Opt In Date"`` becomes ``Opt_In_Date``).
+
+    Like ``namedtuple(..., rename=True)``, names that would clash with the
+    record's own attributes or keywords are renamed, here with a trailing
+    underscore (``extra_``, ``get_``). So are names with leading underscores,
+    which lose them (``_id`` becomes ``id_``). Names starting with a digit
+    are prefixed (``column_1st``).
+    """
+    names = []
+    seen = set()
+    for column in header:
+        name = re.sub(r"\W", "_", column.strip(), flags=re.UNICODE) or "column"
+        if six.PY2:
+            name = name.encode("ascii", "replace").replace("?", "_")
+        if name[0].isdigit():
+            name = "column_" + name
+        elif name.startswith("_"):
+            name = (name.lstrip("_") or "column") + "_"
+        if name in RESERVED_NAMES or keyword.iskeyword(name):
+            name += "_"
+        unique, count = name, 1
+        while unique in seen:
+            count += 1
+            unique = "%s_%d" % (name, count)
+        seen.add(unique)
+        names.append(unique)
+    return names
+
+
+def column_names(names):
+    """
+    Build the ``columns`` argument of
+    :meth:`silverpop.api.Silverpop.raw_recipient_data_export` from a list
+    of column names.
+    """
+    return [(("NAME", name),) for name in names]
+
+
+class ExportReader(object):
+    """
+    :param transfer: The :class:`silverpop.transfer.FileTransfer` to read the
+        export through.
+    :param str file_path: The export's ``FILE_PATH`` (or just its name).
+    :param str export_format: ``CSV``, ``TAB`` or ``PIPE``.
+    :param str encoding: The file's encoding.
+    :param dict converters: Callables by column name (as in the header, or
+        as a field name) that convert the column's values. Empty values are
+        always ``None``.
+    :param bool use_mmap: Memory-map the file when the transfer can read it
+        locally, rather than reading it through a file object.
+    :param str member: The file to read from a zip archive. Defaults to its
+        first file.
+
+    Iterating yields a record per row, of a :class:`silverpop.records.Record`
+    class with a field for each column (see `field_names`). ``header`` and
+    ``record_class`` are set once the header has been read. A reader can be
+    iterated more than once; each pass reads the file again.
+    """
+
+    def __init__(self, transfer, file_path, export_format="CSV", encoding="utf-8",
+                 converters=None, use_mmap=False, member=None, record_name="ExportRecord"):
+        if export_format not in DELIMITERS:
+            raise ValueError("export_format must be one of %s, got %r" % (
+                ", ".join(sorted(DELIMITERS)), export_format))
+        self.transfer = transfer
+        self.name = posixpath.basename(file_path)
+        self.delimiter = DELIMITERS[export_format]
+        self.encoding = encoding
+        self.converters = converters or {}
+        self.use_mmap = use_mmap
+        self.member = member
+        self.record_name = record_name
+        self.header = None
+        self.record_class = None
+
+    def _open_lines(self, cleanup):
+        """
+        Return an iterator over the file's lines, as bytes. Callables that
+        release what was opened are added to ``cleanup``.
+        """
+        local_path = self.transfer.local_path(self.name)
+
+        if self.name.lower().endswith(".zip"):
+            if local_path is None:
+                # Zip archives need random access.
+                archive_file = tempfile.TemporaryFile()
+                cleanup.append(archive_file.close)
+                with self.transfer.open(self.name) as source:
+                    shutil.copyfileobj(source, archive_file)
+                archive_file.seek(0)
+            else:
+                archive_file = local_path
+            archive = zipfile.ZipFile(archive_file)
+            cleanup.append(archive.close)
+            member = self.member or next(
+                name for name in archive.namelist() if not name.endswith("/"))
+            member_file = archive.open(member)
+            cleanup.append(member_file.close)
+            return iter(member_file)
+
+        if self.use_mmap and local_path is not None:
+            with open(local_path, "rb") as f:
+                try:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    # An empty file can't be mapped.
+                    return iter(())
+            cleanup.append(mapped.close)
+            return iter(mapped.readline, b"")
+
+        f = self.transfer.open(self.name)
+        cleanup.append(f.close)
+        return iter(f)
+
+    def _rows(self, lines):
+        if six.PY2:
+            # The Python 2 csv module only reads bytes, so decode the cells.
+            encoding = self.encoding
+            for row in csv.reader(lines, delimiter=self.delimiter.encode("ascii")):
+                yield [cell.decode(encoding) for cell in row]
+            return
+
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        text = (decoder.decode(line) for line in lines)
+        for row in csv.reader(text, delimiter=self.delimiter):
+            yield row
+
+    def _converters(self, fields):
+        converters = []
+        for column, field in zip(self.header, fields):
+            converters.append(self.converters.get(column) or self.converters.get(field))
+        return converters
+
+    def __iter__(self):
+        cleanup = []
+        try:
+            rows = self._rows(self._open_lines(cleanup))
+            header = next(rows, None)
+            if header is None:
+                return
+            if header and header[0].startswith(u"\ufeff"):
+                header[0] = header[0][1:]
+            self.header = header
+            fields = field_names(header)
+            self.record_class = cls = record_class(self.record_name, fields)
+            converters = self._converters(fields)
+            width = len(fields)
+
+            for row in rows:
+                if not row:
+                    continue
+                values = [
+                    None if value == u"" else (convert(value) if convert else value)
+                    for value, convert in zip(row, converters)]
+                if len(values) < width:
+                    values.extend([None] * (width - len(values)))
+                yield cls(*values)
+        finally:
+            for close in reversed(cleanup):
+                close()
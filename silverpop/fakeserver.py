@@ -0,0 +1,547 @@
+"""
+A local stand-in for the XML API and its OAuth endpoint, for load and
+failure testing without network access.
+
+The server answers every method defined on :class:`silverpop.api.Silverpop`
+with a successful ``Envelope/Body/RESULT`` (or a ``Fault``), issues access
+tokens that expire, and can be told to add latency and to throttle, fail
+or drop a share of calls::
+
+    with FakeSilverpopServer(latency=uniform(0.01, 0.05), throttle_rate=0.1) as server:
+        client = server.client(retry_policy=RetryPolicy())
+        client.get_list_meta_data(list_id)
+        print(server.stats)
+
+It can also be run on its own::
+
+    python -m silverpop.fakeserver --port 8080 --latency 0.05 --error-rate 0.01
+"""
+from __future__ import print_function
+
+import argparse
+import itertools
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from xml.etree import ElementTree
+
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import parse_qs
+
+from .utils import map_to_xml
+
+THROTTLE_FAULT = "Too many concurrent requests. Please try again later."
+THROTTLE_ERROR_ID = "10"
+SESSION_FAULT = "Session has expired or is invalid"
+SESSION_ERROR_ID = "145"
+
+
+def constant(seconds):
+    """
+    A latency of exactly ``seconds``.
+    """
+    return lambda rng: seconds
+
+
+def uniform(low, high):
+    """
+    A latency spread evenly between ``low`` and ``high`` seconds.
+    """
+    return lambda rng: rng.uniform(low, high)
+
+
+def exponential(mean):
+    """
+    Exponentially distributed latencies averaging ``mean`` seconds.
+    """
+    return lambda rng: rng.expovariate(1.0 / mean)
+
+
+def lognormal(median, sigma=0.5):
+    """
+    Log-normally distributed latencies around ``median`` seconds, with the
+    long tail real APIs tend to have.
+    """
+    import math
+    mu = math.log(median)
+    return lambda rng: rng.lognormvariate(mu, sigma)
+
+
+class Fault(Exception):
+    """
+    Raised by a handler to answer with a ``Fault`` instead of a result.
+    """
+    def __init__(self, fault_string, error_id=None):
+        super(Fault, self).__init__(fault_string)
+        self.fault_string = fault_string
+        self.error_id = error_id
+
+
+def api_commands():
+    """
+    Return the ``cmd_name`` of every API method defined on
+    :class:`silverpop.api.Silverpop`.
+    """
+    from .api import Silverpop, iter_api_methods
+    return set(method.cmd_name for name, method in iter_api_methods(Silverpop))
+
+
+# oauthlib refuses to talk to the plain HTTP OAuth route unless this is set.
+# It is set while any configured server is running, and put back as it was
+# once the last one stops.
+INSECURE_TRANSPORT = "OAUTHLIB_INSECURE_TRANSPORT"
+_insecure_transport_lock = threading.Lock()
+_insecure_transport_users = 0
+_insecure_transport_saved = None
+
+
+def _allow_insecure_transport():
+    global _insecure_transport_users, _insecure_transport_saved
+    with _insecure_transport_lock:
+        if _insecure_transport_users == 0:
+            _insecure_transport_saved = os.environ.get(INSECURE_TRANSPORT)
+            os.environ[INSECURE_TRANSPORT] = "1"
+        _insecure_transport_users += 1
+
+
+def _restore_insecure_transport():
+    global _insecure_transport_users
+    with _insecure_transport_lock:
+        _insecure_transport_users -= 1
+        if _insecure_transport_users == 0:
+            if _insecure_transport_saved is None:
+                os.environ.pop(INSECURE_TRANSPORT, None)
+            else:
+                os.environ[INSECURE_TRANSPORT] = _insecure_transport_saved
+
+
+def _text(element, path, default=None):
+    found = element.find(path)
+    return found.text if found is not None and found.text else default
+
+
+class DefaultHandlers(object):
+    """
+    Plausible results for the commands whose callers read them. Every other
+    command just succeeds.
+    """
+
+    def __init__(self, list_count=3, job_polls=2):
+        self.list_count = list_count
+        self.job_polls = job_polls
+        self.job_status_polls = {}
+        self._recipient_ids = itertools.count(1000)
+        self._lock = threading.Lock()
+
+    def recipient_id(self):
+        with self._lock:
+            return str(next(self._recipient_ids))
+
+    def list_fields(self, list_id):
+        return (
+            ("ID", list_id), ("NAME", "List %s" % list_id), ("TYPE", "0"),
+            ("SIZE", "100"), ("NUM_OPT_OUTS", "0"), ("VISIBILITY", "1"),
+            ("LAST_MODIFIED", "01/01/20 12:00 AM"),
+        )
+
+    def AddRecipient(self, request):
+        return (("RecipientId", self.recipient_id()),)
+
+    UpdateRecipient = DoubleOptInRecipient = AddRecipient
+
+    def SelectRecipientData(self, request):
+        return (
+            ("EMAIL", _text(request, "EMAIL", "recipient@example.com")),
+            ("RecipientId", self.recipient_id()),
+            ("OptedIn", "01/01/20 12:00 AM"),
+        )
+
+    def GetListMetaData(self, request):
+        return self.list_fields(_text(request, "LIST_ID", "1"))
+
+    def GetLists(self, request):
+        return (("LIST", [self.list_fields(str(i + 1)) for i in range(self.list_count)]),)
+
+    def CreateContactList(self, request):
+        return (("CONTACT_LIST_ID", self.recipient_id()),)
+
+    def ImportList(self, request):
+        return (("JOB_ID", self.recipient_id()),)
+
+    def GetJobStatus(self, request):
+        # Jobs report RUNNING for ``job_polls`` polls, then COMPLETE.
+        job_id = _text(request, "JOB_ID")
+        with self._lock:
+            polls = self.job_status_polls[job_id] = self.job_status_polls.get(job_id, 0) + 1
+        status = "COMPLETE" if polls > self.job_polls else "RUNNING"
+        return (("JOB_ID", job_id), ("JOB_STATUS", status),
+                ("JOB_DESCRIPTION", "Fake data job"))
+
+    def ExportList(self, request):
+        job_id = self.recipient_id()
+        return (("JOB_ID", job_id), ("FILE_PATH", "/download/export_%s.CSV" % job_id))
+
+    def RawRecipientDataExport(self, request):
+        job_id = self.recipient_id()
+        return (("MAILING", (
+            ("JOB_ID", job_id), ("FILE_PATH", "/download/raw_%s.zip" % job_id))),)
+
+    def __getitem__(self, cmd_name):
+        return getattr(self, cmd_name, None)
+
+
+def _envelope(result, fault=None):
+    envelope = ElementTree.Element("Envelope")
+    body = ElementTree.SubElement(envelope, "Body")
+    body.append(result)
+    if fault is not None:
+        fault_element = ElementTree.SubElement(body, "Fault")
+        ElementTree.SubElement(fault_element, "FaultString").text = fault.fault_string
+        if fault.error_id is not None:
+            error = ElementTree.SubElement(
+                ElementTree.SubElement(fault_element, "detail"), "error")
+            ElementTree.SubElement(error, "errorid").text = fault.error_id
+    return ElementTree.tostring(envelope)
+
+
+def success_response(fields=()):
+    result = ElementTree.Element("RESULT")
+    ElementTree.SubElement(result, "SUCCESS").text = "TRUE"
+    if fields:
+        map_to_xml(fields, root=result)
+    return _envelope(result)
+
+
+def fault_response(fault):
+    result = ElementTree.Element("RESULT")
+    ElementTree.SubElement(result, "SUCCESS").text = "false"
+    return _envelope(result, fault)
+
+
+class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; don't let Nagle's algorithm
+    # hold the body back for a delayed ACK.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.fake.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() != "chunked":
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        # Streamed request bodies arrive with chunked transfer encoding.
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+            if not size:
+                self.rfile.readline()
+                return b"".join(chunks)
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+
+    def respond(self, status, body, content_type="text/xml;charset=UTF-8"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        form = parse_qs(self.read_body().decode("utf-8"))
+        path = self.path.split("?")[0]
+        if path == "/oauth/token":
+            status, body = self.server.fake.issue_token(form)
+            return self.respond(status, body, "application/json")
+        if path != "/XMLAPI":
+            return self.respond(404, b"")
+
+        outcome = self.server.fake.handle_call(
+            self.headers.get("Authorization", ""), form.get("xml", [""])[0])
+        if outcome is None:
+            # Drop the connection without answering.
+            self.close_connection = True
+            return
+        self.respond(*outcome)
+
+
+class _Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeSilverpopServer(object):
+    """
+    :param int port: The port to listen on. By default a free one is picked.
+    :param latency: Seconds to wait before answering each API call, or a
+        callable given a ``random.Random`` that returns them (see `constant`,
+        `uniform`, `exponential` and `lognormal`).
+    :param dict latencies: Per-command latencies, overriding ``latency``.
+    :param float throttle_rate: The share of calls answered with a throttle
+        fault.
+    :param float rate_limit: Calls allowed per second. Calls beyond that are
+        answered with a throttle fault.
+    :param float error_rate: The share of calls answered with an HTTP error,
+        picked from ``error_statuses``.
+    :param float disconnect_rate: The share of calls whose connection is
+        closed without an answer.
+    :param int token_lifetime: Seconds an issued access token is valid for.
+        Calls with an expired or unknown token get a session fault with HTTP
+        status 401.
+    :param refresh_tokens: The refresh tokens accepted on the OAuth route. By
+        default any is.
+    :param dict handlers: Callables by command name, given the command's
+        request element and returning the result fields as nested 2-tuples
+        (see `silverpop.utils.map_to_xml`). They may raise `Fault`.
+    :param int list_count: The number of lists ``GetLists`` returns.
+    :param int job_polls: The number of ``GetJobStatus`` polls a data job
+        stays ``RUNNING`` for before it is ``COMPLETE``.
+    :param int seed: Seed for the random faults and latencies.
+
+    Counts of what the server did are kept in ``stats``, and the number of
+    calls to each command in ``calls``.
+    """
+
+    def __init__(self, port=0, latency=0, latencies=None, throttle_rate=0,
+                 rate_limit=None, error_rate=0, error_statuses=(503,),
+                 disconnect_rate=0, token_lifetime=3600, refresh_tokens=None,
+                 handlers=None, list_count=3, job_polls=2, seed=None, verbose=False):
+        self.port = port
+        self.latency = latency
+        self.latencies = latencies or {}
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses
+        self.disconnect_rate = disconnect_rate
+        self.token_lifetime = token_lifetime
+        self.refresh_tokens = refresh_tokens
+        self.defaults = DefaultHandlers(list_count, job_polls)
+        self.handlers = handlers or {}
+        self.commands = api_commands()
+        self.verbose = verbose
+
+        self.random = random.Random(seed)
+        self.tokens = {}
+        self.calls = {}
+        self.stats = dict.fromkeys((
+            "calls", "faults", "throttled", "errors", "disconnects", "unauthorized",
+            "tokens_issued"), 0)
+        self._lock = threading.Lock()
+        self._allowance = None
+        self._allowance_updated = None
+        self._server = None
+        self._thread = None
+        self._insecure_transport = False
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self._server.server_address[1]
+
+    @property
+    def oauth_endpoint(self):
+        return self.url + "/oauth/token"
+
+    @property
+    def api_endpoint(self):
+        return self.url + "/XMLAPI"
+
+    def start(self):
+        self._server = _Server(("127.0.0.1", self.port), RequestHandler)
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.1,))
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._insecure_transport:
+            self._insecure_transport = False
+            _restore_insecure_transport()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def configure(self, client):
+        """
+        Point ``client`` (a :class:`silverpop.api.Silverpop` or
+        :class:`silverpop.aio.AsyncSilverpop`) at this server.
+        """
+        # The server speaks plain HTTP, which oauthlib refuses by default.
+        # That check is turned off until the server is stopped.
+        if not self._insecure_transport:
+            self._insecure_transport = True
+            _allow_insecure_transport()
+        client.oauth_endpoint = self.oauth_endpoint
+        client.api_endpoint = self.api_endpoint
+        session = getattr(client, "session", None)
+        if hasattr(session, "auto_refresh_url"):
+            session.auto_refresh_url = self.oauth_endpoint
+        return client
+
+    def client(self, client_class=None, **kwargs):
+        """
+        Create a client talking to this server. ``kwargs`` are passed on to
+        ``client_class`` (:class:`silverpop.api.Silverpop` by default).
+        """
+        if client_class is None:
+            from .api import Silverpop as client_class
+        return self.configure(client_class("client-id", "client-secret", "refresh-token", 0,
+                                           **kwargs))
+
+    def expire_tokens(self):
+        """
+        Expire every access token issued so far.
+        """
+        with self._lock:
+            self.tokens.clear()
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def issue_token(self, form):
+        refresh_token = form.get("refresh_token", [None])[0]
+        if self.refresh_tokens is not None and refresh_token not in self.refresh_tokens:
+            return 400, json.dumps({"error": "invalid_grant"}).encode("ascii")
+
+        access_token = uuid.uuid4().hex
+        with self._lock:
+            self.tokens[access_token] = time.time() + self.token_lifetime
+            self.stats["tokens_issued"] += 1
+        return 200, json.dumps({
+            "access_token": access_token,
+            "token_type": "bearer",
+            "refresh_token": refresh_token,
+            "expires_in": self.token_lifetime,
+        }).encode("ascii")
+
+    def _over_rate_limit(self):
+        if not self.rate_limit:
+            return False
+        with self._lock:
+            now = time.time()
+            if self._allowance is None:
+                self._allowance, self._allowance_updated = float(self.rate_limit), now
+            self._allowance = min(
+                float(self.rate_limit),
+                self._allowance + (now - self._allowance_updated) * self.rate_limit)
+            self._allowance_updated = now
+            if self._allowance < 1:
+                return True
+            self._allowance -= 1
+            return False
+
+    def _delay(self, cmd_name):
+        latency = self.latencies.get(cmd_name, self.latency)
+        if callable(latency):
+            with self._lock:
+                latency = latency(self.random)
+        if latency > 0:
+            time.sleep(latency)
+
+    def _chance(self, rate):
+        if not rate:
+            return False
+        with self._lock:
+            return self.random.random() < rate
+
+    def handle_call(self, authorization, xml):
+        """
+        Return the ``(status, body)`` to answer an API call with, or ``None``
+        to drop the connection.
+        """
+        try:
+            request = ElementTree.fromstring(xml.encode("utf-8")).find("Body")[0]
+        except (ElementTree.ParseError, IndexError, TypeError):
+            return 200, fault_response(Fault("Invalid XML request", "50"))
+        cmd_name = request.tag
+
+        with self._lock:
+            self.stats["calls"] += 1
+            self.calls[cmd_name] = self.calls.get(cmd_name, 0) + 1
+
+        self._delay(cmd_name)
+
+        token = authorization[len("Bearer "):] if authorization.startswith("Bearer ") else None
+        expires_at = self.tokens.get(token)
+        if expires_at is None or expires_at <= time.time():
+            self._count("unauthorized")
+            return 401, fault_response(Fault(SESSION_FAULT, SESSION_ERROR_ID))
+
+        if self._chance(self.disconnect_rate):
+            self._count("disconnects")
+            return None
+        if self._chance(self.error_rate):
+            self._count("errors")
+            with self._lock:
+                status = self.random.choice(self.error_statuses)
+            return status, b"Service Unavailable"
+        if self._over_rate_limit() or self._chance(self.throttle_rate):
+            self._count("throttled")
+            return 200, fault_response(Fault(THROTTLE_FAULT, THROTTLE_ERROR_ID))
+
+        if cmd_name not in self.commands and cmd_name not in self.handlers:
+            self._count("faults")
+            return 200, fault_response(Fault("Unknown API method %s" % cmd_name, "1"))
+
+        handler = self.handlers.get(cmd_name) or self.defaults[cmd_name]
+        try:
+            fields = handler(request) if handler is not None else ()
+        except Fault as fault:
+            self._count("faults")
+            return 200, fault_response(fault)
+        return 200, success_response(fields)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a fake Silverpop XML API server.")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0,
+                        help="Median seconds before each API call is answered.")
+    parser.add_argument("--latency-sigma", type=float, default=0,
+                        help="Spread the latency log-normally with this sigma.")
+    parser.add_argument("--throttle-rate", type=float, default=0)
+    parser.add_argument("--rate-limit", type=float, default=None)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--disconnect-rate", type=float, default=0)
+    parser.add_argument("--token-lifetime", type=int, default=3600)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    latency = args.latency
+    if latency and args.latency_sigma:
+        latency = lognormal(latency, args.latency_sigma)
+
+    server = FakeSilverpopServer(
+        port=args.port, latency=latency, throttle_rate=args.throttle_rate,
+        rate_limit=args.rate_limit, error_rate=args.error_rate,
+        disconnect_rate=args.disconnect_rate, token_lifetime=args.token_lifetime,
+        seed=args.seed, verbose=True)
+    server.start()
+    print("Serving on %s (API: %s, OAuth: %s)" % (
+        server.url, server.api_endpoint, server.oauth_endpoint))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(json.dumps(server.stats, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Bulk recipient imports through ``ImportList`` data jobs.
+
+Rather than one ``AddRecipient`` call per contact, the contacts are written
+to a CSV data file along with a mapping file describing its columns. Both
+are uploaded through a :class:`silverpop.transfer.FileTransfer`, and a
+single ``ImportList`` call starts a job that loads all of them::
+
+    transfer = LocalDirectoryTransfer("/srv/acoustic")
+    response = client.import_recipients(
+        transfer, list_id, contacts, action=ADD_AND_UPDATE, columns=["EMAIL", "Name"])
+    job_id = response.JOB_ID
+
+The records are written as they are read, so ``records`` may be a generator
+over any number of contacts.
+"""
+import csv
+import io
+import itertools
+import os
+import shutil
+import tempfile
+import uuid
+
+import six
+
+from .utils import text_element
+
+ADD_ONLY = "ADD_ONLY"
+UPDATE_ONLY = "UPDATE_ONLY"
+ADD_AND_UPDATE = "ADD_AND_UPDATE"
+OPT_OUT = "OPT_OUT"
+
+ACTIONS = (ADD_ONLY, UPDATE_ONLY, ADD_AND_UPDATE, OPT_OUT)
+
+
+def _open_csv(path, encoding):
+    if six.PY2:
+        return open(path, "wb")
+    return io.open(path, "w", encoding=encoding, newline="")
+
+
+def _encode_row(row, encoding):
+    # The Python 2 csv module only writes bytes.
+    if six.PY2:
+        return [value.encode(encoding) if isinstance(value, six.text_type) else value
+                for value in row]
+    return row
+
+
+def _cell(value):
+    if value is None:
+        return u""
+    if isinstance(value, bool):
+        return u"Yes" if value else u"No"
+    return value if isinstance(value, six.string_types) else u"%s" % value
+
+
+class ListImport(object):
+    """
+    :param list_id: The database, contact list or query to import into.
+    :param str action: `ADD_ONLY`, `UPDATE_ONLY`, `ADD_AND_UPDATE` or
+        `OPT_OUT`.
+    :param list columns: The columns to import, in file order. By default
+        the keys of the first record, sorted.
+    :param tuple sync_fields: The columns identifying existing recipients.
+    :param list contact_lists: Contact lists to add imported recipients to.
+    :param str name: The base name of the files. Defaults to a random name.
+    :param str directory: Where to write the files. Defaults to a new
+        temporary directory.
+    :param str encoding: The data file's encoding.
+
+    Writes the data and mapping files for an ``ImportList`` job.
+    """
+
+    def __init__(self, list_id, action=ADD_AND_UPDATE, columns=None, sync_fields=("EMAIL",),
+                 contact_lists=(), name=None, directory=None, encoding="utf-8"):
+        if action not in ACTIONS:
+            raise ValueError("action must be one of %s, got %r" % (", ".join(ACTIONS), action))
+        self.list_id = list_id
+        self.action = action
+        self.columns = list(columns) if columns is not None else None
+        self.sync_fields = tuple(sync_fields)
+        self.contact_lists = tuple(contact_lists)
+        self.encoding = encoding
+        self.name = name or "import-%s" % uuid.uuid4().hex
+        self._owns_directory = directory is None
+        self.directory = directory if directory is not None else tempfile.mkdtemp()
+        self.source_file = self.name + ".csv"
+        self.map_file = self.name + ".xml"
+        self.row_count = 0
+
+    @property
+    def source_path(self):
+        return os.path.join(self.directory, self.source_file)
+
+    @property
+    def map_path(self):
+        return os.path.join(self.directory, self.map_file)
+
+    def write(self, records):
+        """
+        Write ``records`` (mappings of column name to value) to the data
+        file, one at a time, then write the mapping file. Returns the number
+        of records written.
+        """
+        records = iter(records)
+        columns = self.columns
+        if columns is None:
+            first = next(records, None)
+            columns = self.columns = sorted(first) if first is not None else []
+            if first is not None:
+                records = itertools.chain([first], records)
+        known = set(columns)
+
+        with _open_csv(self.source_path, self.encoding) as f:
+            writer = csv.writer(f)
+            writer.writerow(_encode_row(columns, self.encoding))
+            for record in records:
+                unknown = set(record) - known
+                if unknown:
+                    raise ValueError("Record %d has columns not in the mapping: %s" % (
+                        self.row_count + 1, ", ".join(sorted(unknown))))
+                writer.writerow(_encode_row(
+                    [_cell(record.get(column)) for column in columns], self.encoding))
+                self.row_count += 1
+
+        with open(self.map_path, "wb") as f:
+            f.write(self.mapping_xml())
+        return self.row_count
+
+    def mapping_xml(self):
+        """
+        Return the mapping file, describing the data file's columns.
+        """
+        out = [
+            b"<LIST_IMPORT><LIST_INFO>",
+            text_element("ACTION", self.action),
+            text_element("LIST_ID", u"%s" % self.list_id),
+            text_element("FILE_TYPE", u"0"),
+            text_element("HASHEADERS", u"true"),
+            b"</LIST_INFO>",
+        ]
+        if self.sync_fields:
+            out.append(b"<SYNC_FIELDS>")
+            for field in self.sync_fields:
+                out.extend((b"<SYNC_FIELD>", text_element("NAME", field), b"</SYNC_FIELD>"))
+            out.append(b"</SYNC_FIELDS>")
+
+        out.append(b"<MAPPING>")
+        for index, column in enumerate(self.columns or (), 1):
+            out.extend((
+                b"<COLUMN>",
+                text_element("INDEX", u"%d" % index),
+                text_element("NAME", column),
+                text_element("INCLUDE", u"true"),
+                b"</COLUMN>"))
+        out.append(b"</MAPPING>")
+
+        if self.contact_lists:
+            out.append(b"<CONTACT_LISTS>")
+            for contact_list in self.contact_lists:
+                out.append(text_element("CONTACT_LIST_ID", u"%s" % contact_list))
+            out.append(b"</CONTACT_LISTS>")
+        out.append(b"</LIST_IMPORT>")
+        return b"".join(out)
+
+    def upload(self, transfer):
+        """
+        Upload both files through ``transfer``.
+        """
+        transfer.upload(self.source_path, self.source_file)
+        transfer.upload(self.map_path, self.map_file)
+
+    def cleanup(self):
+        """
+        Delete the local files.
+        """
+        if self._owns_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+        else:
+            for path in (self.source_path, self.map_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def import_recipients(client, transfer, list_id, records, keep_files=False, **kwargs):
+    """
+    Write ``records`` to a data file, upload it with its mapping through
+    ``transfer`` and start the ``ImportList`` job with ``client``. Other
+    keyword arguments are passed to :class:`ListImport`.
+
+    Returns the ``ImportList`` response, whose ``JOB_ID`` identifies the job.
+    """
+    job = ListImport(list_id, **kwargs)
+    try:
+        job.write(records)
+        job.upload(transfer)
+    finally:
+        if not keep_files:
+            job.cleanup()
+    return client.import_list(job.map_file, job.source_file, file_encoding=job.encoding)
@@ -0,0 +1,326 @@
+"""
+Waiting on data jobs.
+
+Imports, exports and other data jobs run asynchronously on Acoustic's side:
+starting one returns a ``JOB_ID`` whose progress is read with
+``GetJobStatus``. A :class:`JobTracker` polls every outstanding job from a
+single scheduler thread::
+
+    with JobTracker(client) as tracker:
+        handle = tracker.submit("export_list", list_id, "ALL", "CSV")
+        tracker.track(import_job_id, callback=lambda handle: notify(handle.status))
+        response = handle.result(timeout=3600)
+
+Each job is polled less often the longer its status stays the same, and the
+polls that fall due together are sent as one batch on the client's thread
+pool, so the number of jobs in flight doesn't multiply threads or, with
+``max_polls_per_second``, the request rate.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from concurrent import futures
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+WAITING = "WAITING"
+RUNNING = "RUNNING"
+COMPLETE = "COMPLETE"
+CANCELED = "CANCELED"
+ERROR = "ERROR"
+
+#: Statuses after which a job's status doesn't change anymore.
+FINAL_STATUSES = frozenset([COMPLETE, CANCELED, ERROR])
+
+# Raised (on Python 3.8+) for settling a future that was cancelled meanwhile.
+_InvalidStateError = getattr(futures, "InvalidStateError", ())
+
+
+class JobFailed(Exception):
+    """
+    Raised for a job that finished with an ``ERROR`` or ``CANCELED``
+    status. ``response`` is its last ``GetJobStatus`` response.
+    """
+    def __init__(self, job_id, status, response=None):
+        super(JobFailed, self).__init__("Job %s finished with status %s" % (job_id, status))
+        self.job_id = job_id
+        self.status = status
+        self.response = response
+
+
+def job_id_of(response):
+    """
+    Return the ``JOB_ID`` of the response that started a data job.
+    """
+    job_id = getattr(response, "JOB_ID", None)
+    if job_id is None:
+        # RawRecipientDataExport nests it in a MAILING element.
+        mailing = getattr(response, "MAILING", None)
+        if isinstance(mailing, dict):
+            job_id = mailing.get("JOB_ID")
+    if job_id is None:
+        raise ValueError("%r does not identify a data job" % (response,))
+    return job_id
+
+
+class JobHandle(object):
+    """
+    A data job being tracked.
+
+    ``status`` and ``response`` are those of the latest poll. Wait for the
+    job with `result` (which returns its final ``GetJobStatus`` response or
+    raises :class:`JobFailed`), register a callback with
+    `add_done_callback`, or use the ``concurrent.futures.Future`` in
+    ``future`` directly (``asyncio.wrap_future`` turns it into an
+    awaitable).
+    """
+
+    def __init__(self, job_id, start_response=None):
+        self.job_id = job_id
+        self.start_response = start_response
+        self.status = None
+        self.response = None
+        self.polls = 0
+        self.errors = 0
+        self.future = Future()
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def exception(self, timeout=None):
+        return self.future.exception(timeout)
+
+    def add_done_callback(self, callback):
+        """
+        Call ``callback(handle)`` once the job has finished (right away if
+        it already has).
+        """
+        self.future.add_done_callback(lambda future: callback(self))
+
+    def __repr__(self):
+        return "<JobHandle %s %s>" % (self.job_id, self.status or "PENDING")
+
+
+class JobTracker(object):
+    """
+    :param client: The :class:`silverpop.api.Silverpop` to poll with.
+    :param float initial_interval: Seconds before a job's first poll.
+    :param float max_interval: The longest wait between two polls of a job.
+    :param float backoff: How much longer to wait after each poll that
+        didn't change a job's status.
+    :param float max_polls_per_second: Spread polls out so that no more than
+        this many are sent per second across all jobs.
+    :param int max_in_flight: Polls sent concurrently.
+    :param int max_errors: Consecutive failed polls after which a job's
+        handle fails with the last error.
+
+    Polls the status of many data jobs from one scheduler thread, started
+    when the first job is tracked.
+    """
+
+    def __init__(self, client, initial_interval=2.0, max_interval=60.0, backoff=1.5,
+                 max_polls_per_second=None, max_in_flight=4, max_errors=5):
+        self.client = client
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.max_polls_per_second = max_polls_per_second
+        self.max_in_flight = max_in_flight
+        self.max_errors = max_errors
+
+        self._queue = []
+        self._intervals = {}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def track(self, job_id, callback=None, start_response=None):
+        """
+        Start polling ``job_id`` and return its :class:`JobHandle`.
+        """
+        handle = JobHandle(job_id, start_response)
+        if callback is not None:
+            handle.add_done_callback(callback)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("JobTracker is closed")
+            self._schedule(handle, self.initial_interval)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="silverpop-jobs")
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
+        return handle
+
+    def submit(self, method, *args, **kwargs):
+        """
+        Call the API ``method`` (Ex: ``"import_list"``) that starts a data
+        job and track the job it started. ``callback`` may be given as a
+        keyword argument.
+        """
+        callback = kwargs.pop("callback", None)
+        if not callable(method):
+            method = getattr(self.client, method)
+        response = method(*args, **kwargs)
+        return self.track(job_id_of(response), callback=callback, start_response=response)
+
+    def wait(self, handles, timeout=None):
+        """
+        Block until every one of ``handles`` has finished, or ``timeout``
+        seconds have passed. Returns whether they all finished.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        for handle in handles:
+            remaining = None if deadline is None else max(0, deadline - time.time())
+            try:
+                handle.exception(remaining)
+            except Exception:
+                return False
+        return True
+
+    def pending(self):
+        """
+        The number of jobs still being polled.
+        """
+        with self._condition:
+            return len(self._queue)
+
+    def close(self, wait=True):
+        """
+        Stop polling. Jobs that haven't finished have their handles
+        cancelled.
+        """
+        with self._condition:
+            self._closed = True
+            queue, self._queue = self._queue, []
+            self._condition.notify()
+            thread = self._thread
+        for due, count, handle in queue:
+            handle.future.cancel()
+        if wait and thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _schedule(self, handle, interval):
+        self._intervals[handle] = interval
+        heapq.heappush(self._queue, (time.time() + interval, next(self._counter), handle))
+
+    def _take_due(self):
+        """
+        Wait until at least one job is due, then remove and return every
+        job that is. Returns ``None`` once closed.
+        """
+        with self._condition:
+            while True:
+                if self._closed:
+                    return None
+                now = time.time()
+                if self._queue and self._queue[0][0] <= now:
+                    break
+                timeout = self._queue[0][0] - now if self._queue else None
+                self._condition.wait(timeout)
+
+            limit = len(self._queue)
+            if self.max_polls_per_second:
+                limit = max(1, int(self.max_polls_per_second))
+            batch = []
+            while self._queue and self._queue[0][0] <= now and len(batch) < limit:
+                batch.append(heapq.heappop(self._queue)[2])
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_due()
+            if batch is None:
+                return
+            started = time.time()
+            updated = 0
+            try:
+                results = self.client.map(
+                    "get_job_status", [{"job_id": handle.job_id} for handle in batch],
+                    max_workers=self.max_in_flight)
+                for handle, result in zip(batch, results):
+                    updated += 1
+                    try:
+                        self._update(handle, result)
+                    except Exception as e:
+                        logger.exception("Updating job %s failed", handle.job_id)
+                        self._settle(handle, exception=e)
+            except Exception:
+                logger.exception("Polling jobs failed")
+                # Poll the jobs that weren't reached again later.
+                with self._condition:
+                    for handle in batch[updated:]:
+                        interval = self._intervals.pop(handle, self.initial_interval)
+                        if not self._closed:
+                            self._schedule(handle, interval)
+                        else:
+                            handle.future.cancel()
+
+            if self.max_polls_per_second:
+                # Don't start the next batch before this one's share of the
+                # rate has elapsed.
+                pause = len(batch) / float(self.max_polls_per_second) - (time.time() - started)
+                if pause > 0:
+                    time.sleep(pause)
+
+    def _update(self, handle, result):
+        interval = self._intervals.pop(handle, self.initial_interval)
+        handle.polls += 1
+        if handle.future.cancelled():
+            return
+
+        if not result.ok:
+            handle.errors += 1
+            logger.warning("Polling job %s failed: %s", handle.job_id, result.exception)
+            if handle.errors >= self.max_errors:
+                self._settle(handle, exception=result.exception)
+                return
+            interval = min(interval * self.backoff, self.max_interval)
+        else:
+            handle.errors = 0
+            response = result.response
+            status = getattr(response, "JOB_STATUS", None)
+            changed = status != handle.status
+            handle.status, handle.response = status, response
+            if status == COMPLETE:
+                self._settle(handle, response)
+                return
+            if status in FINAL_STATUSES:
+                self._settle(handle, exception=JobFailed(handle.job_id, status, response))
+                return
+            # A job that is making progress is likely to finish soon.
+            if not changed:
+                interval = min(interval * self.backoff, self.max_interval)
+
+        with self._condition:
+            if not self._closed:
+                self._schedule(handle, interval)
+            else:
+                handle.future.cancel()
+
+    def _settle(self, handle, response=None, exception=None):
+        # The future is public, so its owner may cancel it at any time,
+        # including right after this checks.
+        if handle.future.done():
+            return
+        try:
+            if exception is not None:
+                handle.future.set_exception(exception)
+            else:
+                handle.future.set_result(response)
+        except _InvalidStateError:
+            pass
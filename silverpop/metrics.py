@@ -0,0 +1,201 @@
+"""
+Per-call instrumentation.
+
+Pass ``hooks`` to :class:`silverpop.api.Silverpop` to have every API call
+reported as a :class:`CallEvent` once it finishes. It records how long the
+call spent serializing, on the network and parsing, so slow jobs can be
+told apart from slow responses::
+
+    metrics = MetricsRegistry()
+    client = Silverpop(client_id, secret, refresh_token, 2, hooks=[metrics.observe])
+    ...
+    print(metrics.export_text())
+"""
+import threading
+import time
+
+timer = getattr(time, "perf_counter", time.time)
+
+SUCCESS = "success"
+FAULT = "fault"
+HTTP_ERROR = "http_error"
+ERROR = "error"
+
+#: Latency histogram bucket bounds, in seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class CallEvent(object):
+    """
+    The measurements of a single API call. Times are in seconds.
+
+    ``attempts`` counts the requests actually sent: more than one when the
+    call was retried, none when it was answered from the cache or shared an
+    in-flight request. The byte sizes are ``None`` when unknown (for a
+    streamed body).
+    """
+    __slots__ = (
+        "cmd_name", "start", "duration", "serialize_time", "network_time",
+        "parse_time", "request_bytes", "response_bytes", "attempts", "outcome",
+        "exception",
+    )
+
+    def __init__(self, cmd_name):
+        self.cmd_name = cmd_name
+        self.start = timer()
+        self.duration = None
+        self.serialize_time = 0.0
+        self.network_time = 0.0
+        self.parse_time = 0.0
+        self.request_bytes = None
+        self.response_bytes = None
+        self.attempts = 0
+        self.outcome = None
+        self.exception = None
+
+    @property
+    def retries(self):
+        return max(self.attempts - 1, 0)
+
+    def finish(self, exception=None):
+        self.duration = timer() - self.start
+        self.exception = exception
+        if exception is None:
+            self.outcome = SUCCESS
+        else:
+            # Imported here, as the api module imports this one.
+            from .api import SilverpopHTTPException, SilverpopResponseException
+            if isinstance(exception, SilverpopResponseException):
+                self.outcome = FAULT
+            elif isinstance(exception, SilverpopHTTPException):
+                self.outcome = HTTP_ERROR
+            else:
+                self.outcome = ERROR
+        return self
+
+    def __repr__(self):
+        return "<CallEvent %s %s %.3fs>" % (self.cmd_name, self.outcome, self.duration or 0)
+
+
+class Histogram(object):
+    """
+    A cumulative histogram with fixed bucket bounds.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        """
+        Return ``(bound, count)`` pairs counting the observations less than or
+        equal to each bound, ending with ``("+Inf", count)``.
+        """
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            pairs.append((bound, total))
+        pairs.append(("+Inf", self.count))
+        return pairs
+
+
+def _escape_label(value):
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{%s}" % ",".join(
+        '%s="%s"' % (name, _escape_label(str(value)))
+        for name, value in sorted(labels.items()))
+
+
+class MetricsRegistry(object):
+    """
+    :param tuple buckets: The latency histogram bucket bounds, in seconds.
+
+    Aggregates :class:`CallEvent` objects (passed to `observe`) into
+    per-method counters and latency histograms. Safe to share between
+    threads and clients.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, prefix="silverpop"):
+        self.buckets = buckets
+        self.prefix = prefix
+        self.calls = {}
+        self.retries = {}
+        self.request_bytes = {}
+        self.response_bytes = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, cmd_name, phase):
+        key = (cmd_name, phase)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.buckets)
+        return histogram
+
+    def observe(self, event):
+        name = event.cmd_name
+        with self._lock:
+            key = (name, event.outcome)
+            self.calls[key] = self.calls.get(key, 0) + 1
+            self.retries[name] = self.retries.get(name, 0) + event.retries
+            if event.request_bytes is not None:
+                self.request_bytes[name] = self.request_bytes.get(name, 0) + event.request_bytes
+            if event.response_bytes is not None:
+                self.response_bytes[name] = (
+                    self.response_bytes.get(name, 0) + event.response_bytes)
+
+            self._histogram(name, "total").observe(event.duration)
+            self._histogram(name, "serialize").observe(event.serialize_time)
+            if event.attempts:
+                self._histogram(name, "network").observe(event.network_time)
+                self._histogram(name, "parse").observe(event.parse_time)
+
+    def _counter(self, lines, name, help_text, values, label_names):
+        lines.append("# HELP %s_%s %s" % (self.prefix, name, help_text))
+        lines.append("# TYPE %s_%s counter" % (self.prefix, name))
+        for key, value in sorted(values.items()):
+            if not isinstance(key, tuple):
+                key = (key,)
+            labels = _labels(**dict(zip(label_names, key)))
+            lines.append("%s_%s%s %s" % (self.prefix, name, labels, value))
+
+    def export_text(self):
+        """
+        Render every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            self._counter(lines, "calls_total", "API calls by method and outcome.",
+                          self.calls, ("method", "outcome"))
+            self._counter(lines, "retries_total", "Retried API requests by method.",
+                          self.retries, ("method",))
+            self._counter(lines, "request_bytes_total", "Request bytes sent by method.",
+                          self.request_bytes, ("method",))
+            self._counter(lines, "response_bytes_total", "Response bytes read by method.",
+                          self.response_bytes, ("method",))
+
+            name = "%s_call_duration_seconds" % self.prefix
+            lines.append("# HELP %s Time spent in each phase of an API call." % name)
+            lines.append("# TYPE %s histogram" % name)
+            for (cmd_name, phase), histogram in sorted(self.histograms.items()):
+                for bound, count in histogram.cumulative():
+                    lines.append("%s_bucket%s %d" % (
+                        name, _labels(method=cmd_name, phase=phase, le=bound), count))
+                labels = _labels(method=cmd_name, phase=phase)
+                lines.append("%s_sum%s %r" % (name, labels, histogram.sum))
+                lines.append("%s_count%s %d" % (name, labels, histogram.count))
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,401 @@
+"""
+A durable outbox for API writes.
+
+Writes made through an :class:`Outbox` are serialized and stored in a local
+SQLite database, and the call returns as soon as the write is on disk. The
+outbox then delivers them in the order they were made, at its own pace and
+retrying failures, so neither Acoustic's latency nor its outages hold up the
+caller, and nothing queued is lost on a restart::
+
+    outbox = Outbox(client, "/var/lib/app/silverpop-outbox.db", rate=5)
+    outbox.start()
+    ...
+    outbox.opt_out_recipient(list_id, email=email)
+    outbox.add_recipient(list_id, 2, columns=columns, dedupe_key=event.id)
+
+Delivery is at least once: a write whose response was lost (or whose process
+died mid-call) is sent again. Two kinds of duplicates are dropped when they
+are queued. Writes given the same ``dedupe_key`` are only ever queued once,
+for ``retention`` seconds after delivery. A call to an idempotent method
+that repeats a write still waiting to be sent replaces it, so it is sent
+once, in the later position.
+"""
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+from .api import SilverpopResponseException
+from .ratelimit import TokenBucket
+from .retry import classify
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        method TEXT NOT NULL,
+        list_id TEXT,
+        xml BLOB,
+        dedupe_key TEXT,
+        state TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created REAL NOT NULL,
+        next_attempt REAL NOT NULL,
+        updated REAL,
+        last_error TEXT,
+        claim TEXT)""",
+    "CREATE INDEX IF NOT EXISTS outbox_due ON outbox (state, next_attempt, id)",
+    "CREATE INDEX IF NOT EXISTS outbox_dedupe_key ON outbox (dedupe_key)",
+)
+
+# Columns added since the first release, and their definitions, for
+# databases created before them.
+_ADDED_COLUMNS = (
+    ("claim", "TEXT"),
+)
+
+# Prefixes keeping generated keys apart from the ones callers pass.
+_AUTO_KEY = "auto:"
+_CALLER_KEY = "key:"
+
+
+class _Reclaimed(Exception):
+    """
+    A write's claim ran out and another process claimed it, so it wasn't
+    sent.
+    """
+
+
+def _permanent(exception):
+    # Silverpop rejected the write itself; sending it again won't help.
+    return isinstance(exception, SilverpopResponseException) and classify(exception) is None
+
+
+class Outbox(object):
+    """
+    :param client: The :class:`silverpop.api.Silverpop` to deliver writes
+        with.
+    :param str path: The SQLite database file. It is created if needed, and
+        may be shared by several processes.
+    :param float rate: Deliver at most this many writes per second, on top
+        of any ``rate_limiter`` the client has.
+    :param int batch_size: Writes claimed from the database at a time. With
+        a ``rate``, no more are claimed than can be sent in half of
+        ``claim_timeout``.
+    :param int max_in_flight: Writes delivered concurrently. With more than
+        one, writes queued close together may be applied out of order.
+    :param int max_attempts: Attempts after which a write is given up on and
+        left ``failed``.
+    :param float backoff: The delay before a failed write's first retry, in
+        seconds. It doubles with every further attempt.
+    :param float max_backoff: The longest delay between attempts.
+    :param float claim_timeout: Seconds after which a write claimed for
+        delivery by a process that never finished it is delivered again. The
+        clock restarts for all of an outbox's claimed writes each time it
+        starts sending one, so only a single call running this long lets
+        them be claimed again. An outbox never sends a write whose claim it
+        has lost.
+    :param float retention: Seconds a delivered write's ``dedupe_key`` is
+        remembered for.
+    :param float poll_interval: Seconds the background drainer sleeps when
+        nothing is due.
+
+    Calling a write method of the client (one that isn't ``read_only``) on
+    the outbox queues it and returns the id of its row. Pass ``dedupe_key``
+    to drop repeats of the same write.
+
+    Writes are delivered in the order they were queued, except that a write
+    being retried after a failure doesn't hold up the ones behind it. A
+    write Silverpop answers with a fault is given up on right away, unless
+    the fault is throttling (see :func:`silverpop.retry.classify`). Any
+    other failure, such as an error page or a token refresh failing during
+    an outage, is retried until ``max_attempts``.
+    """
+
+    def __init__(self, client, path, rate=None, batch_size=100, max_in_flight=1,
+                 max_attempts=10, backoff=1.0, max_backoff=300.0, claim_timeout=300.0,
+                 retention=86400.0, poll_interval=1.0):
+        self.client = client
+        self.path = path
+        self.bucket = TokenBucket(rate) if rate else None
+        self.batch_size = batch_size
+        if rate:
+            # Claimed writes wait their turn; they mustn't be claimed again
+            # by another process in the meantime.
+            self.batch_size = max(1, min(batch_size, int(rate * claim_timeout / 2)))
+        self.max_in_flight = max_in_flight
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.claim_timeout = claim_timeout
+        self.retention = retention
+        self.poll_interval = poll_interval
+
+        # Marks the rows this outbox claimed, so that it doesn't deliver or
+        # update those another process has claimed since.
+        self._claim_token = uuid.uuid4().hex
+        self._local = threading.local()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            connection.execute(statement)
+        columns = set(row[1] for row in connection.execute("PRAGMA table_info(outbox)"))
+        for name, definition in _ADDED_COLUMNS:
+            if name not in columns:
+                connection.execute("ALTER TABLE outbox ADD COLUMN %s %s" % (name, definition))
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads.
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self, func):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(connection)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return result
+
+    def _definition(self, method):
+        definition = getattr(getattr(type(self.client), method, None), "api_method", None)
+        if definition is None:
+            raise AttributeError("%s is not an API method" % method)
+        if definition.read_only:
+            raise ValueError("%s only reads data and can't be queued" % method)
+        return definition
+
+    def __getattr__(self, name):
+        definition = getattr(getattr(type(self.client), name, None), "api_method", None)
+        if definition is None or definition.read_only:
+            raise AttributeError("%r has no write method %r" % (self, name))
+
+        def enqueue(*args, **kwargs):
+            return self.enqueue(name, *args, **kwargs)
+        enqueue.__name__ = name
+        return enqueue
+
+    def enqueue(self, method, *args, **kwargs):
+        """
+        Serialize a call to the API ``method`` (Ex: ``"add_recipient"``)
+        and store it for delivery. Returns the id of its row, which is that
+        of the write already queued if this one was a duplicate.
+        """
+        dedupe_key = kwargs.pop("dedupe_key", None)
+        definition = self._definition(method)
+        values = definition.bind_arguments(*args, **kwargs)
+        xml = definition._build_tree(**values)
+        if not isinstance(xml, bytes):
+            # Large relational table upserts are serialized as a stream.
+            xml = b"".join(xml)
+        list_id = values.get("list_id")
+        if list_id is not None:
+            list_id = u"%s" % list_id
+
+        if dedupe_key is not None:
+            dedupe_key = _CALLER_KEY + u"%s" % dedupe_key
+        elif definition.idempotent:
+            dedupe_key = _AUTO_KEY + hashlib.sha1(
+                method.encode("ascii") + b"\0" + xml).hexdigest()
+
+        def insert(connection):
+            if dedupe_key is not None and dedupe_key.startswith(_CALLER_KEY):
+                row = connection.execute(
+                    "SELECT id FROM outbox WHERE dedupe_key = ?", (dedupe_key,)).fetchone()
+                if row is not None:
+                    return row[0]
+            elif dedupe_key is not None:
+                connection.execute(
+                    "DELETE FROM outbox WHERE dedupe_key = ? AND state = ?", (dedupe_key, PENDING))
+
+            now = time.time()
+            return connection.execute(
+                "INSERT INTO outbox (method, list_id, xml, dedupe_key, state, created, "
+                "next_attempt) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (method, list_id, sqlite3.Binary(xml), dedupe_key, PENDING, now, now)).lastrowid
+
+        return self._transaction(insert)
+
+    def counts(self):
+        """
+        The number of writes in each state (`PENDING`, `SENDING`, `SENT` and
+        `FAILED`).
+        """
+        counts = dict.fromkeys((PENDING, SENDING, SENT, FAILED), 0)
+        counts.update(self._connection().execute(
+            "SELECT state, COUNT(*) FROM outbox GROUP BY state").fetchall())
+        return counts
+
+    def failed(self):
+        """
+        Return ``(id, method, attempts, last_error)`` for every write that was
+        given up on.
+        """
+        return self._connection().execute(
+            "SELECT id, method, attempts, last_error FROM outbox WHERE state = ? ORDER BY id",
+            (FAILED,)).fetchall()
+
+    def requeue(self, ids=None):
+        """
+        Queue failed writes (all of them, or those in ``ids``) for delivery
+        again. Returns how many were.
+        """
+        def update(connection):
+            query = "UPDATE outbox SET state = ?, attempts = 0, next_attempt = ? WHERE state = ?"
+            params = [PENDING, time.time(), FAILED]
+            if ids is not None:
+                query += " AND id IN (%s)" % ", ".join("?" * len(ids))
+                params.extend(ids)
+            return connection.execute(query, params).rowcount
+        return self._transaction(update)
+
+    def _claim(self):
+        """
+        Mark the next due writes as being sent and return their rows. Writes
+        whose delivery was started by a process that has since died are
+        claimed again.
+        """
+        def claim(connection):
+            now = time.time()
+            connection.execute(
+                "UPDATE outbox SET state = ?, claim = NULL WHERE state = ? AND updated < ?",
+                (PENDING, SENDING, now - self.claim_timeout))
+            connection.execute(
+                "DELETE FROM outbox WHERE state = ? AND updated < ?",
+                (SENT, now - self.retention))
+            rows = connection.execute(
+                "SELECT id, method, list_id, xml, dedupe_key, attempts FROM outbox "
+                "WHERE state = ? AND next_attempt <= ? ORDER BY id LIMIT ?",
+                (PENDING, now, self.batch_size)).fetchall()
+            connection.executemany(
+                "UPDATE outbox SET state = ?, updated = ?, claim = ? WHERE id = ?",
+                [(SENDING, now, self._claim_token, row[0]) for row in rows])
+            return rows
+        return self._transaction(claim)
+
+    def _deliver(self, row):
+        row_id, method, list_id, xml, dedupe_key, attempts = row
+        if self.bucket is not None:
+            self.bucket.acquire()
+
+        def renew(connection):
+            # Restart the clock of this write's claim, unless another process
+            # claimed it while it waited, and of every write still waiting
+            # its turn.
+            now = time.time()
+            renewed = connection.execute(
+                "UPDATE outbox SET updated = ? WHERE id = ? AND state = ? AND claim = ?",
+                (now, row_id, SENDING, self._claim_token)).rowcount
+            connection.execute(
+                "UPDATE outbox SET updated = ? WHERE state = ? AND claim = ?",
+                (now, SENDING, self._claim_token))
+            return renewed
+        if self._transaction(renew) != 1:
+            raise _Reclaimed()
+        values = {"list_id": list_id} if list_id is not None else None
+        return self.client.send_request(method, bytes(xml), values)
+
+    def _finish(self, result):
+        row_id, method, list_id, xml, dedupe_key, attempts = result.item
+        now = time.time()
+
+        if isinstance(result.exception, _Reclaimed):
+            logger.warning("Not delivering %s %d, which another process claimed",
+                           method, row_id)
+            return
+        if result.ok:
+            if dedupe_key is not None and dedupe_key.startswith(_CALLER_KEY):
+                # Keep the key, but not the request, to drop later repeats.
+                statement = ("UPDATE outbox SET state = ?, xml = NULL, updated = ? WHERE id = ?",
+                             [SENT, now, row_id])
+            else:
+                statement = ("DELETE FROM outbox WHERE id = ?", [row_id])
+        else:
+            attempts += 1
+            error = repr(result.exception)
+            if _permanent(result.exception) or attempts >= self.max_attempts:
+                logger.error("Giving up on %s %d after %d attempts: %s",
+                             method, row_id, attempts, error)
+                state, next_attempt = FAILED, now
+            else:
+                logger.warning("Delivering %s %d failed: %s", method, row_id, error)
+                state = PENDING
+                next_attempt = now + min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+            statement = (
+                "UPDATE outbox SET state = ?, attempts = ?, next_attempt = ?, updated = ?, "
+                "last_error = ? WHERE id = ?",
+                [state, attempts, next_attempt, now, error, row_id])
+
+        # Leave the row alone if its claim was lost while it was being sent.
+        query, params = statement
+        self._transaction(lambda connection: connection.execute(
+            query + " AND state = ? AND claim = ?", params + [SENDING, self._claim_token]))
+
+    def drain(self):
+        """
+        Deliver the writes that are due, in order, until none are. Returns
+        the number delivered.
+        """
+        delivered = 0
+        while not self._stopping.is_set():
+            rows = self._claim()
+            if not rows:
+                break
+            for result in self.client.map(self._deliver, [(row,) for row in rows],
+                                          max_workers=self.max_in_flight):
+                result = result._replace(item=result.item[0])
+                self._finish(result)
+                delivered += result.ok
+        return delivered
+
+    def start(self):
+        """
+        Deliver writes from a background thread until `close` is called.
+        """
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="silverpop-outbox")
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.drain()
+            except Exception:
+                logger.exception("Draining the outbox failed")
+            self._stopping.wait(self.poll_interval)
+
+    def close(self, timeout=None):
+        """
+        Stop the background drainer. Writes still queued stay in the
+        database and are delivered the next time it is drained.
+        """
+        self._stopping.set()
+        thread, self._thread = self._thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
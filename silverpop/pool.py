@@ -0,0 +1,192 @@
+"""
+Sharing clients between the tasks of a multi-tenant worker.
+
+Each :class:`silverpop.api.Silverpop` has its own session, connections and
+access token, so building one per task pays for a TLS handshake and an
+OAuth refresh every time. A :class:`ClientPool` keeps one client per set of
+credentials and hands it out on demand::
+
+    pool = ClientPool(idle_timeout=600, token_store=FileTokenStore("/var/run/silverpop"))
+
+    def handle(task):
+        client = pool.get(task.client_id, task.client_secret, task.refresh_token,
+                          task.server_number)
+        client.add_recipient(task.list_id, 2, columns=task.columns)
+
+Clients for the same pod share one pool of keep-alive connections to it, and
+every client stores its access token in the pool's ``token_store``, so a
+client rebuilt after being evicted picks up where its predecessor left off.
+"""
+import collections
+import hashlib
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+
+from .tokens import MemoryTokenStore
+
+
+class ClientPool(object):
+    """
+    :param client_class: The client to build, :class:`silverpop.api.Silverpop`
+        by default.
+    :param token_store: The :class:`silverpop.tokens.TokenStore` every
+        client shares. Defaults to a :class:`silverpop.tokens.MemoryTokenStore`
+        private to the pool.
+    :param float idle_timeout: Seconds after its last use a client is
+        evicted. ``None`` keeps clients until ``max_clients`` is reached.
+    :param int max_clients: The most clients kept. The least recently used
+        is evicted to make room for a new one.
+    :param int pool_connections: The number of per-host connection pools
+        kept for each pod.
+    :param int pool_maxsize: The maximum number of connections kept open to
+        each pod, shared by all of its clients.
+    :param bool pool_block: Wait for a free connection when ``pool_maxsize``
+        connections to a pod are in use.
+    :param configure: An optional callable given every new client, to adjust
+        it before it is first used.
+
+    Other keyword arguments are passed to every client. The pool is
+    thread-safe.
+
+    Evicting a client stops its thread pool, but a client that is still
+    referenced keeps working. It just won't be handed out again.
+    """
+
+    def __init__(self, client_class=None, token_store=None, idle_timeout=300.0,
+                 max_clients=None, pool_connections=2, pool_maxsize=32, pool_block=False,
+                 configure=None, **client_kwargs):
+        if client_class is None:
+            from .api import Silverpop as client_class
+        self.client_class = client_class
+        self.token_store = token_store if token_store is not None else MemoryTokenStore()
+        self.idle_timeout = idle_timeout
+        self.max_clients = max_clients
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.configure = configure
+        self.client_kwargs = client_kwargs
+
+        self.hits = self.misses = self.evictions = 0
+
+        # Clients by key, least recently used first, with their last use.
+        self._clients = collections.OrderedDict()
+        self._adapters = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(client_id, client_secret, refresh_token, server_number):
+        """
+        The key the client for a set of credentials is kept under. The
+        credentials are hashed, as in :func:`silverpop.tokens.token_key`.
+        """
+        digest = hashlib.sha256(("%s\0%s\0%s" % (
+            client_id, client_secret, refresh_token)).encode("utf-8")).hexdigest()
+        return "%s-%s" % (server_number, digest[:32])
+
+    def adapter(self, server_number):
+        """
+        Return the transport adapter, and so the connections, shared by the
+        clients of pod ``server_number``.
+        """
+        with self._lock:
+            adapter = self._adapters.get(server_number)
+            if adapter is None:
+                adapter = self._adapters[server_number] = HTTPAdapter(
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=self.pool_maxsize,
+                    pool_block=self.pool_block)
+            return adapter
+
+    def get(self, client_id, client_secret, refresh_token, server_number):
+        """
+        Return the client for these credentials, building it if there isn't
+        one.
+        """
+        key = self.key(client_id, client_secret, refresh_token, server_number)
+        now = time.time()
+        evicted = []
+        with self._lock:
+            entry = self._clients.pop(key, None)
+            evicted.extend(self._take_idle(now))
+            if entry is not None:
+                self.hits += 1
+                client = entry[0]
+                self._clients[key] = (client, now)
+
+        if entry is None:
+            # Built outside the lock, since it can take a while.
+            client = self._build(client_id, client_secret, refresh_token, server_number)
+            with self._lock:
+                self.misses += 1
+                # Another thread may have built one in the meantime.
+                entry = self._clients.pop(key, None)
+                if entry is not None:
+                    client = entry[0]
+                self._clients[key] = (client, now)
+                while self.max_clients is not None and len(self._clients) > self.max_clients:
+                    evicted.append(self._clients.popitem(last=False)[1][0])
+
+        self._shutdown(evicted)
+        return client
+
+    def _build(self, client_id, client_secret, refresh_token, server_number):
+        client = self.client_class(
+            client_id, client_secret, refresh_token, server_number,
+            token_store=self.token_store, http_adapter=self.adapter(server_number),
+            **self.client_kwargs)
+        if self.configure is not None:
+            self.configure(client)
+        return client
+
+    def _take_idle(self, now):
+        evicted = []
+        if self.idle_timeout is None:
+            return evicted
+        while self._clients:
+            key, (client, last_used) = next(iter(self._clients.items()))
+            if now - last_used < self.idle_timeout:
+                break
+            del self._clients[key]
+            evicted.append(client)
+        return evicted
+
+    def _shutdown(self, clients):
+        with self._lock:
+            self.evictions += len(clients)
+        for client in clients:
+            client.shutdown(wait=False)
+
+    def evict_idle(self):
+        """
+        Evict the clients that have been idle for ``idle_timeout`` seconds.
+        Returns how many were.
+        """
+        with self._lock:
+            evicted = self._take_idle(time.time())
+        self._shutdown(evicted)
+        return len(evicted)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._clients)
+
+    def close(self):
+        """
+        Evict every client and close the pods' connections.
+        """
+        with self._lock:
+            clients = [client for client, last_used in self._clients.values()]
+            self._clients.clear()
+            adapters, self._adapters = list(self._adapters.values()), {}
+        self._shutdown(clients)
+        for adapter in adapters:
+            adapter.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
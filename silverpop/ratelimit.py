@@ -0,0 +1,132 @@
+"""
+Client-side rate limiting, so calls stay under Acoustic's API limits instead
+of failing once the limit has been hit.
+
+Buckets hand out *reservations*: taking a token may leave the bucket in
+debt, and the caller waits for however long it takes to be repaid. That makes
+the same bucket usable from threads (`TokenBucket.acquire`) and from asyncio
+(``await asyncio.sleep(bucket.reserve())``).
+"""
+import json
+import threading
+import time
+
+from .utils import file_lock
+
+
+class TokenBucket(object):
+    """
+    :param float rate: Tokens (API calls) added per second.
+    :param float capacity: The largest burst allowed. Defaults to ``rate``.
+
+    A thread-safe token bucket for a single process.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive, got %r" % rate)
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def _take(self, tokens, updated, count, now):
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate) - count
+        return tokens, max(0.0, -tokens / self.rate)
+
+    def reserve(self, count=1):
+        """
+        Take ``count`` tokens and return how many seconds the caller has to
+        wait before using them.
+        """
+        with self._lock:
+            now = time.time()
+            self._tokens, wait = self._take(self._tokens, self._updated, count, now)
+            self._updated = now
+            return wait
+
+    def acquire(self, count=1):
+        """
+        Take ``count`` tokens, sleeping until they are available.
+        """
+        wait = self.reserve(count)
+        if wait:
+            time.sleep(wait)
+
+
+class FileTokenBucket(TokenBucket):
+    """
+    :param str path: The file holding the bucket's state. Every process using
+        the same path shares the same budget.
+    :param float rate: Tokens (API calls) added per second.
+    :param float capacity: The largest burst allowed. Defaults to ``rate``.
+
+    A token bucket whose state lives in a small file guarded by an ``flock``,
+    so worker processes on one host share a single budget.
+    """
+
+    def __init__(self, path, rate, capacity=None):
+        super(FileTokenBucket, self).__init__(rate, capacity)
+        self.path = path
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            return state["tokens"], state["updated"]
+        except (IOError, OSError, ValueError, KeyError):
+            return self.capacity, time.time()
+
+    def _write(self, tokens, updated):
+        with open(self.path, "w") as f:
+            json.dump({"tokens": tokens, "updated": updated}, f)
+
+    def reserve(self, count=1):
+        with self._lock:
+            with file_lock(self.path + ".lock"):
+                now = time.time()
+                tokens, updated = self._read()
+                tokens, wait = self._take(tokens, updated, count, now)
+                self._write(tokens, now)
+                return wait
+
+
+class RateLimiter(object):
+    """
+    :param bucket: The bucket every API call draws from, usually sized to the
+        org's limit. ``None`` leaves calls unlimited except for ``commands``.
+    :param dict commands: Extra buckets for individual API commands, keyed by
+        command name (Ex: ``{"AddRecipient": TokenBucket(5)}``). A call to
+        one of these draws from both its command bucket and ``bucket``.
+
+    Pass a limiter as the ``rate_limiter`` argument of
+    :class:`silverpop.api.Silverpop`::
+
+        limiter = RateLimiter(FileTokenBucket("/tmp/silverpop-org.bucket", rate=10))
+        client = Silverpop(client_id, client_secret, refresh_token, 2,
+                           rate_limiter=limiter)
+    """
+
+    def __init__(self, bucket=None, commands=None):
+        self.bucket = bucket
+        self.commands = dict(commands or {})
+
+    def reserve(self, cmd_name=None):
+        """
+        Reserve one call to ``cmd_name`` and return the seconds to wait.
+        """
+        wait = 0.0
+        if cmd_name in self.commands:
+            wait = self.commands[cmd_name].reserve()
+        if self.bucket is not None:
+            wait = max(wait, self.bucket.reserve())
+        return wait
+
+    def acquire(self, cmd_name=None):
+        """
+        Reserve one call to ``cmd_name``, sleeping until it may be made.
+        """
+        wait = self.reserve(cmd_name)
+        if wait:
+            time.sleep(wait)
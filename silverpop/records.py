@@ -0,0 +1,184 @@
+"""
+Compact, typed containers for API results.
+
+An :class:`silverpop.api.api_method` can declare the fields its ``RESULT``
+holds (``result_fields``) and the fields of the records it repeats
+(``record_fields``). A ``__slots__`` class is generated for each, so a
+result held in memory costs a few words per field instead of an instance
+``__dict__`` plus the parsed response it came from.
+"""
+import six
+
+
+class Record(object):
+    """
+    The base class of generated record classes. Fields are read as
+    attributes (``record.EMAIL``) or items (``record["EMAIL"]``); fields the
+    response did not include are ``None``.
+
+    Tags not declared in ``_fields`` are kept in ``extra`` when a record is
+    built from a mapping or a response, so no data is silently dropped.
+    """
+    __slots__ = ("extra",)
+    _fields = ()
+    _field_set = frozenset()
+
+    def __init__(self, *args, **kwargs):
+        extra = kwargs.pop("extra", None)
+        if len(args) > len(self._fields):
+            raise TypeError("%s takes at most %d values" % (
+                type(self).__name__, len(self._fields)))
+        for name, value in zip(self._fields, args):
+            object.__setattr__(self, name, value)
+        for name in self._fields[len(args):]:
+            object.__setattr__(self, name, kwargs.pop(name, None))
+        if kwargs:
+            raise TypeError("%s has no fields %s" % (
+                type(self).__name__, ", ".join(sorted(kwargs))))
+        object.__setattr__(self, "extra", extra)
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        """
+        Build a record from a mapping of tags to values, such as a record
+        yielded by :class:`silverpop.api.StreamingApiResponse`.
+        """
+        values = [mapping.get(name) for name in cls._fields]
+        extra = dict(
+            (name, value) for name, value in six.iteritems(mapping)
+            if name not in cls._field_set) or None
+        return cls(*values, extra=extra)
+
+    @classmethod
+    def from_response(cls, response):
+        """
+        Build a record from the fields of an :class:`silverpop.api.ApiResponse`.
+        ``SUCCESS``, which is always true for a response that was built, is
+        left out of ``extra`` unless it is declared.
+        """
+        fields = response.result_fields()
+        if "SUCCESS" not in cls._field_set:
+            fields.pop("SUCCESS", None)
+        return cls.from_mapping(fields)
+
+    def __getitem__(self, name):
+        if name in self._field_set:
+            return getattr(self, name)
+        if self.extra and name in self.extra:
+            return self.extra[name]
+        raise KeyError(name)
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def as_dict(self):
+        values = dict(self.extra or {})
+        values.update((name, getattr(self, name)) for name in self._fields)
+        return values
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.as_dict() == other.as_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "%s(%s)" % (type(self).__name__, ", ".join(
+            "%s=%r" % (name, getattr(self, name)) for name in self._fields
+            if getattr(self, name) is not None))
+
+    def __reduce__(self):
+        # Generated classes aren't module attributes, so pickle the recipe
+        # for the class along with the values.
+        return (_unpickle_record, (
+            type(self).__name__, self._fields,
+            tuple(getattr(self, name) for name in self._fields), self.extra))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%s is immutable" % type(self).__name__)
+
+
+_record_classes = {}
+
+
+def record_class(name, fields):
+    """
+    Generate a :class:`Record` subclass called ``name`` with a slot for each
+    of ``fields``. The same name and fields always give the same class.
+    """
+    fields = tuple(fields)
+    try:
+        return _record_classes[(name, fields)]
+    except KeyError:
+        cls = type(str(name), (Record,), {
+            "__slots__": fields,
+            "_fields": fields,
+            "_field_set": frozenset(fields),
+        })
+        return _record_classes.setdefault((name, fields), cls)
+
+
+def _unpickle_record(name, fields, values, extra):
+    return record_class(name, fields)(*values, extra=extra)
+
+
+class RecordTable(object):
+    """
+    :param record_class: The :class:`Record` subclass of the rows.
+    :param rows: An optional iterable of records or mappings to load.
+
+    A column-oriented container for many records of one type. Each field is
+    stored in a single list, so a row costs one list slot per field rather
+    than an object. Rows are materialized as records only when indexed or
+    iterated over; `column` gives direct access to a field's values.
+    """
+
+    def __init__(self, record_class, rows=()):
+        self.record_class = record_class
+        self._columns = dict((name, []) for name in record_class._fields)
+        self._extra = {}
+        self._length = 0
+        for row in rows:
+            self.append(row)
+
+    def append(self, row):
+        if not isinstance(row, Record):
+            row = self.record_class.from_mapping(row)
+        for name in self.record_class._fields:
+            self._columns[name].append(getattr(row, name))
+        if row.extra:
+            # Extras are rare, so they are stored sparsely.
+            self._extra[self._length] = row.extra
+        self._length += 1
+
+    def column(self, name):
+        """
+        The list of values of field ``name``, in row order.
+        """
+        return self._columns[name]
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        return self.record_class(
+            *[self._columns[name][index] for name in self.record_class._fields],
+            extra=self._extra.get(index))
+
+    def __iter__(self):
+        extras = self._extra
+        columns = [self._columns[name] for name in self.record_class._fields]
+        for index, values in enumerate(zip(*columns) if columns else ()):
+            yield self.record_class(*values, extra=extras.get(index))
+
+    def __repr__(self):
+        return "<RecordTable %s rows=%d>" % (self.record_class.__name__, self._length)
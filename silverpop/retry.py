@@ -0,0 +1,198 @@
+"""
+Retrying failed API calls with exponential backoff.
+
+Failures are sorted into two kinds:
+
+* *unsent* failures, where Silverpop never acted on the request (the
+  connection could not be made, or the call was throttled). These are safe
+  to retry for every API method.
+* *transient* failures, where the request may or may not have been acted on
+  (the connection dropped, or the response timed out). These are only
+  retried for methods declared ``idempotent`` on their
+  :class:`silverpop.api.api_method`, or for commands the policy is told are
+  safe to repeat.
+"""
+import logging
+import random
+import sys
+import threading
+import time
+
+import requests
+
+from .api import SilverpopHTTPException, SilverpopResponseException
+
+logger = logging.getLogger(__name__)
+
+UNSENT = "unsent"
+TRANSIENT = "transient"
+
+#: Error ids of the faults Silverpop returns when a call was rejected for
+#: going over the org's limits.
+THROTTLE_ERROR_IDS = frozenset(["10"])
+
+#: The same faults' strings, for responses that leave out the error id. These
+#: are compared whole (ignoring case and surrounding whitespace), since other
+#: faults, such as going over a list's size limit, read much alike.
+THROTTLE_FAULTS = frozenset([
+    "too many concurrent requests. please try again later.",
+    "too many concurrent requests.",
+    "too many concurrent requests",
+])
+
+
+class RetryBudget(object):
+    """
+    :param float ratio: The fraction of calls that may be retried.
+    :param float minimum: Retries available up front, before any calls have
+        been made.
+
+    Caps retries at a fraction of overall traffic, so an outage doesn't turn
+    every call into ``max_attempts`` calls. Each call adds ``ratio`` to the
+    budget and each retry takes one from it.
+    """
+
+    def __init__(self, ratio=0.1, minimum=10):
+        self.ratio = ratio
+        self.minimum = minimum
+        self._balance = float(minimum)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._balance = min(self._balance + self.ratio, self.minimum + 100 * self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self._balance < 1:
+                return False
+            self._balance -= 1
+            return True
+
+
+def classify(exception):
+    """
+    Return `UNSENT`, `TRANSIENT` or ``None`` (for permanent failures).
+    """
+    if isinstance(exception, SilverpopHTTPException):
+        return UNSENT if exception.status_code in (429, 503) else TRANSIENT
+    if isinstance(exception, SilverpopResponseException):
+        if exception.error_id is not None:
+            throttled = exception.error_id.strip() in THROTTLE_ERROR_IDS
+        else:
+            throttled = (exception.fault_string or "").strip().lower() in THROTTLE_FAULTS
+        if throttled:
+            return UNSENT
+        return None
+    if isinstance(exception, requests.exceptions.ConnectTimeout):
+        return UNSENT
+    if isinstance(exception, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return TRANSIENT
+
+    # Only consult aiohttp if it is in use, rather than importing it.
+    aiohttp = sys.modules.get("aiohttp")
+    if aiohttp is not None:
+        if isinstance(exception, aiohttp.ClientConnectorError):
+            return UNSENT
+        if isinstance(exception, aiohttp.ClientConnectionError):
+            return TRANSIENT
+    if type(exception).__name__ == "TimeoutError":
+        return TRANSIENT
+    return None
+
+
+class RetryPolicy(object):
+    """
+    :param int max_attempts: The most times a call is attempted, including
+        the first.
+    :param float backoff: The delay before the first retry, in seconds. It
+        doubles with every further attempt.
+    :param float max_backoff: The longest delay between attempts.
+    :param bool jitter: Randomize each delay between zero and its full value,
+        so clients that failed together don't retry together.
+    :param budget: An optional :class:`RetryBudget` shared by every call made
+        with this policy.
+    :param retry_commands: Command names (Ex: ``"SendMailing"``) the caller
+        considers safe to repeat even though their ``api_method`` is not
+        idempotent.
+
+    Pass a policy as the ``retry_policy`` argument of
+    :class:`silverpop.api.Silverpop`.
+    """
+
+    def __init__(self, max_attempts=3, backoff=0.5, max_backoff=30, jitter=True,
+                 budget=None, retry_commands=()):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.budget = budget
+        self.retry_commands = frozenset(retry_commands)
+
+    def delay(self, attempt):
+        """
+        The seconds to wait after the ``attempt``-th failed attempt.
+        """
+        delay = min(self.max_backoff, self.backoff * (2 ** (attempt - 1)))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def should_retry(self, exception, attempt, method=None):
+        """
+        Decide whether the call to ``method`` (an
+        :class:`silverpop.api.api_method`) that failed with ``exception`` on
+        its ``attempt``-th attempt should be tried again.
+        """
+        if attempt >= self.max_attempts:
+            return False
+
+        kind = classify(exception)
+        if kind is None:
+            return False
+        if kind == TRANSIENT:
+            idempotent = method is not None and (
+                method.idempotent or method.cmd_name in self.retry_commands)
+            if not idempotent:
+                return False
+
+        return self.budget is None or self.budget.withdraw()
+
+    def start(self):
+        """
+        Note a new call, for the ``budget``. Called once before its first
+        attempt.
+        """
+        if self.budget is not None:
+            self.budget.deposit()
+
+    def retry_delay(self, exception, attempt, method=None):
+        """
+        Return the seconds to wait before retrying the call to ``method``
+        that failed with ``exception`` on its ``attempt``-th attempt, or
+        ``None`` if it shouldn't be retried.
+        """
+        if not self.should_retry(exception, attempt, method):
+            return None
+        delay = self.delay(attempt)
+        logger.warning(
+            "Retrying %s in %.2fs after attempt %d failed: %r",
+            method.cmd_name if method is not None else "call", delay, attempt, exception)
+        return delay
+
+    def run(self, func, method=None, sleep=time.sleep):
+        """
+        Call ``func`` until it succeeds or fails in a way that should not be
+        retried.
+        """
+        self.start()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return func()
+            except Exception as e:
+                delay = self.retry_delay(e, attempt, method)
+                if delay is None:
+                    raise
+                sleep(delay)
@@ -0,0 +1,66 @@
+"""
+Fakes of the parts of aiohttp the asyncio client uses. Kept apart from
+``test_aio`` since Python 2 can't parse them.
+"""
+import asyncio
+
+
+SUCCESS = b"<Envelope><Body><RESULT><SUCCESS>TRUE</SUCCESS><ID>1</ID></RESULT></Body></Envelope>"
+
+
+class FakeResponse(object):
+    charset = "utf-8"
+
+    def __init__(self, status, content=b"", json=None):
+        self.status = status
+        self.content = content
+        self._json = json
+
+    async def __aenter__(self):
+        await asyncio.sleep(0)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    async def read(self):
+        return self.content
+
+    async def json(self):
+        return self._json
+
+
+class FakeSession(object):
+    def __init__(self):
+        self.token_requests = 0
+        self.api_requests = []
+        self.statuses = []
+
+    def post(self, url, data=None, headers=None):
+        if url.endswith("/oauth/token"):
+            self.token_requests += 1
+            return FakeResponse(200, json={"access_token": "abc", "expires_in": 3600})
+        self.api_requests.append((data, headers))
+        return FakeResponse(self.statuses.pop(0) if self.statuses else 200, SUCCESS)
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def gather(*awaitables):
+    return await asyncio.gather(*awaitables)
+
+
+async def read_body(chunks):
+    body = []
+    async for chunk in chunks:
+        body.append(chunk)
+    return b"".join(body)
@@ -0,0 +1,90 @@
+"""
+Fakes shared by the tests, for exercising a :class:`silverpop.api.Silverpop`
+without a server. Tests that need real HTTP use
+:class:`silverpop.fakeserver.FakeSilverpopServer` instead.
+"""
+import io
+import time
+
+from silverpop.api import Silverpop
+
+SUCCESS = b"<Envelope><Body><RESULT><SUCCESS>TRUE</SUCCESS></RESULT></Body></Envelope>"
+FAULT = (
+    b"<Envelope><Body><RESULT><SUCCESS>false</SUCCESS></RESULT>"
+    b"<Fault><FaultString>Nope</FaultString></Fault></Body></Envelope>")
+
+
+class FakeResponse(object):
+    """
+    The parts of a ``requests.Response`` the client reads, for a response
+    whose body is ``content``.
+    """
+
+    def __init__(self, content=SUCCESS, status_code=200):
+        self.content = content
+        self.status_code = status_code
+        self.raw = io.BytesIO(content)
+        self.closed = False
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8")
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession(object):
+    """
+    :param responses: What the first API calls get, in order: a
+        `FakeResponse`, a status code, or an exception to raise.
+    :param content: The body of every response after those.
+    :param float delay: Seconds every call takes.
+    :param list refreshes: Where to record token refreshes. Pass the same
+        list to several sessions to count them across clients.
+
+    Stands in for the client's OAuth2Session. Every call is recorded in
+    ``requests`` as ``(url, data, headers)``, with a streamed body joined,
+    and whether it asked for a streamed response in ``streamed``.
+    """
+
+    def __init__(self, responses=(), content=SUCCESS, delay=0, refreshes=None):
+        self.responses = list(responses)
+        self.content = content
+        self.delay = delay
+        self.refreshes = refreshes if refreshes is not None else []
+        self.requests = []
+        self.streamed = []
+
+    def post(self, url, data=None, headers=None, timeout=None, stream=False):
+        if not isinstance(data, dict):
+            data = b"".join(data)
+        self.requests.append((url, data, headers))
+        self.streamed.append(stream)
+        if self.delay:
+            time.sleep(self.delay)
+
+        response = self.responses.pop(0) if self.responses else FakeResponse(self.content)
+        if isinstance(response, Exception):
+            raise response
+        if isinstance(response, int):
+            return FakeResponse(self.content, response)
+        return response
+
+    def refresh_token(self, url, timeout=None, **kwargs):
+        time.sleep(0.01)
+        self.refreshes.append(url)
+        return {"access_token": "token-%d" % len(self.refreshes),
+                "expires_at": time.time() + 3600}
+
+
+def make_client(session=None, valid_token=True, **kwargs):
+    """
+    Return a client sending through ``session`` (a new `FakeSession` by
+    default). Keyword arguments are passed to the client.
+    """
+    client = Silverpop("id", "secret", "refresh", 2, **kwargs)
+    if valid_token:
+        client.token = {"access_token": "abc", "expires_at": time.time() + 3600}
+    client.session = session if session is not None else FakeSession()
+    return client
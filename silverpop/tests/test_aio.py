@@ -0,0 +1,116 @@
+import sys
+import unittest
+from six.moves.urllib.parse import parse_qs
+
+from silverpop.api import Silverpop, SilverpopResponseException
+from silverpop.cache import ResponseCache
+from silverpop.retry import RetryPolicy
+from silverpop.tokens import MemoryTokenStore
+
+if sys.version_info >= (3, 5):
+    from silverpop.aio import AsyncSilverpop
+    from silverpop.tests.aio_helpers import (
+        SUCCESS, FakeResponse, FakeSession, gather, read_body, run)
+
+
+@unittest.skipIf(sys.version_info < (3, 5), "the asyncio client requires Python 3.5+")
+class TestAsyncSilverpop(unittest.TestCase):
+
+    def setUp(self):
+        self.session = FakeSession()
+        self.client = AsyncSilverpop("id", "secret", "refresh", 2, session=self.session)
+
+    def test_method_is_awaitable(self):
+        response = run(self.client.get_list_meta_data(123))
+
+        self.assertEqual("1", response.ID)
+        data, headers = self.session.api_requests[0]
+        self.assertEqual("Bearer abc", headers["Authorization"])
+        self.assertIn("<LIST_ID>123</LIST_ID>", data["xml"])
+
+    def test_concurrent_calls_share_one_refresh(self):
+        responses = run(gather(*[self.client.get_list_meta_data(i) for i in range(20)]))
+        self.assertEqual(20, len(responses))
+        self.assertEqual(1, self.session.token_requests)
+
+    def test_token_store(self):
+        store = MemoryTokenStore()
+        clients = [AsyncSilverpop("id", "secret", "refresh", 2, session=self.session,
+                                  token_store=store) for i in range(2)]
+        run(gather(*[client.get_list_meta_data(1) for client in clients]))
+        self.assertEqual(1, self.session.token_requests)
+        self.assertEqual("abc", store.get(clients[0].token_key)["access_token"])
+
+        # A valid token saved by another client is used as is.
+        store.set(clients[0].token_key, {"access_token": "saved", "expires_at": 1e12})
+        client = AsyncSilverpop("id", "secret", "refresh", 2, session=self.session,
+                                token_store=store)
+        run(client.get_list_meta_data(1))
+        self.assertEqual(1, self.session.token_requests)
+        self.assertEqual("Bearer saved", self.session.api_requests[-1][1]["Authorization"])
+
+    def test_streamed_body(self):
+        run(self.client.insert_update_relational_table("1", iter([{"A": "b"}]), stream=True))
+        data, headers = self.session.api_requests[0]
+        body = run(read_body(data))
+        self.assertEqual("application/x-www-form-urlencoded", headers["Content-Type"])
+        self.assertIn(b'<COLUMN name="A">b</COLUMN>', parse_qs(body)[b"xml"][0])
+
+    def test_bulk(self):
+        result = run(self.client.insert_update_relational_table_bulk(
+            "1", ({"ID": str(i)} for i in range(250)), max_workers=2))
+        self.assertTrue(result.succeeded)
+        self.assertEqual(3, result.batch_count)
+        self.assertEqual(3, len(self.session.api_requests))
+
+    def test_fault(self):
+        self.session.post = lambda url, data=None, headers=None: FakeResponse(200, (
+            b"<Envelope><Body><RESULT><SUCCESS>false</SUCCESS></RESULT>"
+            b"<Fault><FaultString>Nope</FaultString></Fault></Body></Envelope>"))
+        self.client.token = {"access_token": "x", "expires_at": 1e12, "refresh_token": "r"}
+        with self.assertRaises(SilverpopResponseException):
+            run(self.client.get_list_meta_data(1))
+
+    def test_coalesce_reads(self):
+        client = AsyncSilverpop("id", "secret", "refresh", 2, session=self.session,
+                                coalesce_reads=True)
+
+        responses = run(gather(
+            *[client.get_list_meta_data(1) for i in range(10)] +
+            [client.get_list_meta_data(2)]))
+        self.assertEqual(2, len(self.session.api_requests))
+        self.assertIs(responses[0], responses[9])
+        self.assertEqual({}, client._flights)
+
+    def test_hooks(self):
+        events = []
+        client = AsyncSilverpop("id", "secret", "refresh", 2, session=self.session,
+                                hooks=[events.append])
+        run(client.get_list_meta_data(1))
+
+        event, = events
+        self.assertEqual("success", event.outcome)
+        self.assertEqual(1, event.attempts)
+        self.assertEqual(len(SUCCESS), event.response_bytes)
+
+    def test_only_async_methods(self):
+        self.assertNotIsInstance(self.client, Silverpop)
+        for name in ("submit", "map", "shutdown", "iter_records", "fetch_table",
+                     "import_recipients", "write_behind"):
+            self.assertFalse(hasattr(self.client, name), name)
+        self.assertEqual(
+            Silverpop.get_lists.__doc__, AsyncSilverpop.get_lists.__doc__)
+
+    def test_retry_and_cache(self):
+        client = AsyncSilverpop(
+            "id", "secret", "refresh", 2, session=self.session, cache=ResponseCache(),
+            retry_policy=RetryPolicy(backoff=0, jitter=False))
+        self.session.statuses = [503]
+
+        first = run(client.get_list_meta_data(1))
+        self.assertIs(first, run(client.get_list_meta_data(1)))
+        self.assertEqual(2, len(self.session.api_requests))
+
+        run(client.add_recipient(1, 2))
+        self.assertIsNot(first, run(client.get_list_meta_data(1)))
+        self.assertEqual(4, len(self.session.api_requests))
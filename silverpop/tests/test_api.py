@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+import gc
+import inspect
+import json
+import threading
+import time
+import unittest
+from xml.etree import ElementTree
+
+import six
+from six.moves.urllib.parse import urlencode
+
+from silverpop.api import (
+    ApiResponse, LazyApiResponse, Silverpop, SilverpopResponseException,
+    StreamingApiResponse, api_method, iter_api_methods, lazy_api_method,
+    register_api_methods)
+from silverpop.tests.helpers import FakeResponse, FakeSession, make_client
+from silverpop.utils import replace_in_nested_mapping, map_to_xml
+
+
+SAMPLE_VALUES = {
+    "list_id": 123,
+    "email": u"récipient+1@example.com",
+    "created_from": 1,
+    "send_autoreply": True,
+    "update_if_found": False,
+    "contact_lists": [1, 0, 3],
+    "sync_fields": {"EMAIL": "a@example.com"},
+    "columns": {"First Name": u"Zoë", "Empty": None, "Flag": True, "Q": "<&>"},
+    "suppression_lists": [4, 5],
+    "substitutions": [(("NAME", "a"), ("VALUE", "b")), (("NAME", ""), ("VALUE", None))],
+    "click_throughs": [(("ClickThroughName", "x"), ("ClickThroughURL", "http://a?b&c"))],
+    "snoozed": True,
+    "days_to_snooze": 3,
+    "mailing_name": "Mailing",
+    "subject": "Hello & welcome",
+    "shared": 0,
+}
+
+
+def api_methods():
+    for name in dir(Silverpop):
+        method = getattr(Silverpop, name)
+        if isinstance(getattr(method, "api_method", None), api_method):
+            yield name, method.api_method
+
+
+class TestApiMethodSerialization(unittest.TestCase):
+
+    def assertMatchesLegacy(self, method, values):
+        expected = map_to_xml(
+            replace_in_nested_mapping(method.definition, values), command=method.cmd_name)
+        self.assertEqual(expected, method._build_tree(**values), method.cmd_name)
+
+    def test_plans_match_legacy_serializer(self):
+        for name, method in api_methods():
+            if not method.definition:
+                continue
+            self.assertMatchesLegacy(method, dict(SAMPLE_VALUES))
+
+    def test_plans_match_legacy_serializer_without_values(self):
+        for name, method in api_methods():
+            if not method.definition:
+                continue
+            self.assertMatchesLegacy(method, {})
+
+    def test_method_calls_through_plan(self):
+        client = Silverpop.__new__(Silverpop)
+        client._call = lambda xml, method=None, values=None: xml
+
+        xml = client.remove_recipient(1, "a@example.com", columns={"a": "b"})
+        self.assertEqual(
+            b"<Envelope><Body><RemoveRecipient><LIST_ID>1</LIST_ID>"
+            b"<EMAIL>a@example.com</EMAIL><COLUMN><NAME>a</NAME><VALUE>b</VALUE></COLUMN>"
+            b"</RemoveRecipient></Body></Envelope>", xml)
+
+
+class EchoClient(Silverpop):
+    def __init__(self):
+        pass
+
+    def _call(self, xml, method=None, values=None):
+        return xml
+
+
+class TestLazyMethods(unittest.TestCase):
+
+    def make_class(self):
+        class Client(EchoClient):
+            @api_method("GetThing", definition=(("ID", "thing_id"), ("FLAG", "flag")))
+            def get_thing(self, thing_id, flag=None):
+                """Get a thing."""
+        return Client
+
+    def test_wrapper_built_on_first_access(self):
+        Client = self.make_class()
+        self.assertIsInstance(vars(Client)["get_thing"], lazy_api_method)
+        self.assertEqual("GetThing", dict(iter_api_methods(Client))["get_thing"].cmd_name)
+
+        xml = Client().get_thing(1, flag=True)
+        self.assertEqual(
+            b"<Envelope><Body><GetThing><ID>1</ID><FLAG /></GetThing></Body></Envelope>", xml)
+        self.assertFalse(isinstance(vars(Client)["get_thing"], lazy_api_method))
+
+    def test_signature_and_doc(self):
+        method = self.make_class().get_thing
+        self.assertEqual(["self", "thing_id", "flag"], inspect.getargspec(method).args
+                         if not hasattr(inspect, "signature")
+                         else list(inspect.signature(method).parameters))
+        self.assertEqual(":API Method: ``GetThing``\nGet a thing.\n", method.__doc__)
+        self.assertEqual("GetThing", method.api_method.cmd_name)
+
+    def test_register_from_spec(self):
+        class Client(EchoClient):
+            pass
+
+        register_api_methods(Client, json.loads("""[
+            {"name": "get_job_status", "cmd_name": "GetJobStatus",
+             "args": ["job_id", "verbose"], "defaults": {"verbose": null},
+             "definition": [["JOB_ID", "job_id"], ["GROUP", [["VERBOSE", "verbose"]]]],
+             "read_only": true}
+        ]"""))
+
+        method = Client.get_job_status.api_method
+        self.assertTrue(method.idempotent)
+        self.assertEqual(
+            b"<Envelope><Body><GetJobStatus><JOB_ID>7</JOB_ID>"
+            b"<GROUP><VERBOSE>1</VERBOSE></GROUP></GetJobStatus></Body></Envelope>",
+            Client().get_job_status(7, verbose=1))
+        self.assertEqual(Client().get_job_status(7), method.build_request(job_id=7))
+        with self.assertRaises(TypeError):
+            method.build_request()
+
+
+def legacy_relational_tree(table_id, rows):
+    envelope = ElementTree.Element("Envelope")
+    body = ElementTree.SubElement(envelope, "Body")
+    root = ElementTree.SubElement(body, "InsertUpdateRelationalTable")
+    ElementTree.SubElement(root, "TABLE_ID").text = table_id
+    rows_tag = ElementTree.SubElement(root, "ROWS")
+    for row in rows:
+        row_tag = ElementTree.SubElement(rows_tag, "ROW")
+        for key, value in six.iteritems(row):
+            column_tag = ElementTree.SubElement(row_tag, "COLUMN")
+            column_tag.attrib['name'] = key
+            column_tag.text = value
+    return ElementTree.tostring(envelope)
+
+
+class TestRelationalTableSerialization(unittest.TestCase):
+    method = Silverpop.insert_update_relational_table.api_method
+
+    def test_matches_legacy_serializer(self):
+        rows = [
+            {"EMAIL": u"zoë@example.com", "Note": u'a "quoted" <b>&\n'},
+            {},
+            {"EMAIL": None, "Empty": ""},
+        ]
+        self.assertEqual(
+            legacy_relational_tree("123", rows),
+            self.method._build_tree(table_id="123", rows=rows))
+        self.assertEqual(
+            legacy_relational_tree(None, []),
+            self.method._build_tree(table_id=None, rows=[]))
+
+    def test_stream_accepts_generators(self):
+        rows = ({"ID": str(i)} for i in range(1000))
+        chunks = self.method._build_tree(table_id="1", rows=rows, stream=True)
+        self.assertFalse(isinstance(chunks, bytes))
+        self.assertEqual(
+            legacy_relational_tree("1", [{"ID": str(i)} for i in range(1000)]),
+            b"".join(chunks))
+
+    def test_unserializable_value(self):
+        with self.assertRaises(TypeError):
+            self.method._build_tree(table_id="1", rows=[{"ID": 1}])
+
+    def test_streamed_call_is_form_encoded(self):
+        client = make_client()
+
+        client.insert_update_relational_table("1", iter([{"A B": "c&d"}]), stream=True)
+
+        url, data, headers = client.session.requests[0]
+        self.assertEqual(
+            urlencode({"xml": legacy_relational_tree("1", [{"A B": "c&d"}])}).encode("ascii"),
+            data)
+        self.assertEqual("application/x-www-form-urlencoded", headers["Content-Type"])
+
+
+class TestSession(unittest.TestCase):
+
+    def test_pool_configuration(self):
+        client = Silverpop(
+            "id", "secret", "refresh", 2, max_workers=32, pool_connections=2,
+            keep_alive=False, connect_timeout=3, read_timeout=30)
+
+        adapter = client.session.get_adapter(client.api_endpoint)
+        self.assertEqual(32, adapter._pool_maxsize)
+        self.assertEqual(2, adapter._pool_connections)
+        self.assertEqual("close", client.session.headers["Connection"])
+        self.assertEqual((3, 30), client.timeout)
+
+    def test_token_refreshed_once_across_threads(self):
+        client = make_client(valid_token=False)
+        refreshes = []
+
+        def refresh_token(url, timeout=None, **kwargs):
+            time.sleep(0.01)
+            refreshes.append(kwargs)
+            return {"access_token": "abc", "expires_at": time.time() + 3600}
+
+        client.session.refresh_token = refresh_token
+        threads = [
+            threading.Thread(target=client.get_list_meta_data, args=(1,))
+            for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([{"client_id": "id", "client_secret": "secret"}], refreshes)
+        self.assertEqual(10, len(client.session.requests))
+
+    def test_rate_limiter_sees_command(self):
+        commands = []
+
+        class Limiter(object):
+            def acquire(self, cmd_name):
+                commands.append(cmd_name)
+
+        client = make_client(rate_limiter=Limiter())
+
+        client.get_list_meta_data(1)
+        client.remove_recipient(1, "a@example.com")
+        self.assertEqual(["GetListMetaData", "RemoveRecipient"], commands)
+
+
+LIST_RESPONSE = (
+    u"<Envelope><Body><RESULT><SUCCESS>TRUE</SUCCESS>"
+    u"<LIST><ID>1</ID><NAME>Zoë</NAME></LIST><LIST><ID>2</ID><NAME>B</NAME></LIST>"
+    u"<COLUMNS><COLUMN><NAME>A</NAME><VALUE>b</VALUE></COLUMN></COLUMNS>"
+    u"</RESULT></Body></Envelope>").encode("utf-8")
+
+
+class TestLazyApiResponse(unittest.TestCase):
+
+    def test_fields_match_eager_response(self):
+        eager = ApiResponse(FakeResponse(LIST_RESPONSE))
+        lazy = LazyApiResponse(FakeResponse(LIST_RESPONSE))
+
+        self.assertEqual(eager.LIST, lazy.LIST)
+        self.assertEqual(eager.COLUMNS, lazy.COLUMNS)
+        self.assertEqual("TRUE", lazy.SUCCESS)
+        self.assertIsNone(getattr(lazy, "MISSING", None))
+
+    def test_nothing_retained_by_default(self):
+        lazy = LazyApiResponse(FakeResponse(LIST_RESPONSE))
+        self.assertFalse(hasattr(lazy, "response_raw"))
+        self.assertFalse(hasattr(lazy, "response"))
+
+        lazy = LazyApiResponse(FakeResponse(LIST_RESPONSE), keep_raw=True, keep_tree=True)
+        self.assertEqual(LIST_RESPONSE.decode("utf-8"), lazy.response_raw)
+        self.assertEqual("Envelope", lazy.response.tag)
+
+    def test_fault_raised_up_front(self):
+        content = (
+            b"<Envelope><Body><RESULT><SUCCESS>false</SUCCESS></RESULT>"
+            b"<Fault><FaultString>Invalid list</FaultString></Fault></Body></Envelope>")
+        with self.assertRaises(SilverpopResponseException):
+            LazyApiResponse(FakeResponse(content))
+
+    def test_client_option(self):
+        client = Silverpop("id", "secret", "refresh", 2, lazy_responses=True)
+        self.assertIsInstance(
+            client._make_response(FakeResponse(LIST_RESPONSE)), LazyApiResponse)
+
+
+class TestStreamingApiResponse(unittest.TestCase):
+
+    def test_records_are_streamed(self):
+        response = FakeResponse(LIST_RESPONSE)
+        records = StreamingApiResponse(response, "LIST")
+
+        self.assertEqual(
+            [{"ID": "1", "NAME": u"Zoë"}, {"ID": "2", "NAME": "B"}], list(records))
+        self.assertEqual("TRUE", records.fields["SUCCESS"])
+        self.assertTrue(response.closed)
+
+    def test_closed_without_iterating(self):
+        response = FakeResponse(LIST_RESPONSE)
+        with StreamingApiResponse(response, "LIST") as records:
+            next(iter(records))
+        self.assertTrue(response.closed)
+
+        response = FakeResponse(LIST_RESPONSE)
+        StreamingApiResponse(response, "LIST")
+        gc.collect()
+        self.assertTrue(response.closed)
+
+    def test_fault(self):
+        content = (
+            b"<Envelope><Body><RESULT><SUCCESS>false</SUCCESS></RESULT>"
+            b"<Fault><FaultString>Invalid</FaultString></Fault></Body></Envelope>")
+        with self.assertRaises(SilverpopResponseException) as context:
+            list(StreamingApiResponse(FakeResponse(content), "LIST"))
+        self.assertEqual("Invalid", context.exception.fault_string)
+
+    def test_iter_records(self):
+        client = make_client(FakeSession(content=LIST_RESPONSE))
+        records = list(client.iter_records("get_lists", 0, 2, 5, include_tags=True))
+
+        self.assertEqual(["1", "2"], [record["ID"] for record in records])
+        url, data, headers = client.session.requests[0]
+        self.assertEqual(
+            b"<Envelope><Body><GetLists><LIST_TYPE>2</LIST_TYPE><FOLDER_ID>5</FOLDER_ID>"
+            b"<INCLUDE_TAGS /></GetLists></Body></Envelope>", data["xml"])
+        self.assertEqual([True], client.session.streamed)
+
+    def test_iter_records_needs_repeated_element(self):
+        client = Silverpop("id", "secret", "refresh", 2)
+        with self.assertRaises(ValueError):
+            client.iter_records("get_list_meta_data", 1)
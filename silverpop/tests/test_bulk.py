@@ -0,0 +1,106 @@
+import threading
+import time
+import unittest
+
+from silverpop.api import Silverpop, SilverpopResponseException
+from silverpop.bulk import chunked, insert_update_relational_table_bulk
+
+
+class TestChunked(unittest.TestCase):
+
+    def test_chunks(self):
+        self.assertEqual([[0, 1], [2, 3], [4]], list(chunked(range(5), 2)))
+
+    def test_empty(self):
+        self.assertEqual([], list(chunked([], 2)))
+
+    def test_is_lazy(self):
+        consumed = []
+
+        def rows():
+            for i in range(10):
+                consumed.append(i)
+                yield i
+
+        next(chunked(rows(), 3))
+        self.assertEqual([0, 1, 2], consumed)
+
+
+class FakeClient(object):
+    def __init__(self, fail_on=()):
+        self.fail_on = fail_on
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = []
+
+    def insert_update_relational_table(self, table_id, rows):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.calls.append(rows)
+        time.sleep(0.01)
+        with self.lock:
+            self.in_flight -= 1
+        if rows[0] in self.fail_on:
+            raise SilverpopResponseException("Bad row %s" % rows[0])
+        return rows[0]
+
+
+class TestRelationalTableBulk(unittest.TestCase):
+
+    def test_batches_and_aggregates(self):
+        client = FakeClient(fail_on=(20,))
+        result = insert_update_relational_table_bulk(
+            client, "1", iter(range(45)), batch_size=10, max_workers=3)
+
+        self.assertEqual(5, result.batch_count)
+        self.assertEqual(45, result.row_count)
+        self.assertEqual({0: 0, 1: 10, 3: 30, 4: 40}, result.responses)
+        self.assertFalse(result.succeeded)
+        self.assertEqual(1, len(result.failures))
+        self.assertEqual(2, result.failures[0].index)
+        self.assertEqual(list(range(20, 30)), result.failures[0].rows)
+        self.assertEqual(3, client.max_in_flight)
+
+    def test_rejects_oversized_batches(self):
+        with self.assertRaises(ValueError):
+            insert_update_relational_table_bulk(FakeClient(), "1", [], batch_size=101)
+
+
+class MapClient(Silverpop):
+    def _call(self, xml, method=None, values=None):
+        list_id = int(xml.split(b"<LIST_ID>")[1].split(b"<")[0])
+        time.sleep(0.001 * (10 - list_id % 10))
+        if list_id == 3:
+            raise SilverpopResponseException("Bad list")
+        return list_id
+
+
+class TestMap(unittest.TestCase):
+
+    def setUp(self):
+        self.client = MapClient("id", "secret", "refresh", 2, max_workers=4)
+        self.addCleanup(self.client.shutdown)
+
+    def test_submit(self):
+        future = self.client.submit("get_list_meta_data", 5)
+        self.assertEqual(5, future.result())
+
+    def test_map_in_input_order(self):
+        items = ({"list_id": i} for i in range(1, 21))
+        results = list(self.client.map("get_list_meta_data", items, max_workers=3))
+
+        self.assertEqual(list(range(20)), [result.index for result in results])
+        self.assertEqual(
+            [i for i in range(1, 21) if i != 3],
+            [result.response for result in results if result.ok])
+        self.assertFalse(results[2].ok)
+        self.assertEqual({"list_id": 3}, results[2].item)
+        self.assertIsInstance(results[2].exception, SilverpopResponseException)
+
+    def test_map_in_completion_order(self):
+        results = list(self.client.map(
+            self.client.get_list_meta_data, [(i,) for i in range(1, 11)], ordered=False))
+        self.assertEqual(set(range(10)), set(result.index for result in results))
+        self.assertEqual(9, sum(1 for result in results if result.ok))
@@ -0,0 +1,80 @@
+import unittest
+
+from silverpop.api import Silverpop
+from silverpop.cache import MemoryCache, ResponseCache
+from silverpop.tests.helpers import make_client
+
+
+class TestMemoryCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = MemoryCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(1, cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(3, cache.get("c"))
+
+    def test_ttl(self):
+        cache = MemoryCache()
+        cache.set("a", 1, ttl=-1)
+        cache.set("b", 2, ttl=60)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(2, cache.get("b"))
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.client = make_client(cache=ResponseCache())
+
+    def test_reads_are_cached_by_arguments(self):
+        first = self.client.get_list_meta_data(1)
+        self.assertIs(first, self.client.get_list_meta_data(1))
+        self.client.get_list_meta_data(2)
+        self.client.select_recipient_data(1, "a@example.com")
+        self.client.select_recipient_data(1, "a@example.com")
+        self.client.select_recipient_data(1, "b@example.com")
+
+        self.assertEqual(4, len(self.client.session.requests))
+
+    def test_uncacheable_methods_always_call(self):
+        self.client.send_mailing(1, "a@example.com")
+        self.client.send_mailing(1, "a@example.com")
+        self.assertEqual(2, len(self.client.session.requests))
+
+    def test_writes_invalidate_their_list(self):
+        self.client.select_recipient_data(1, "a@example.com")
+        self.client.select_recipient_data(2, "a@example.com")
+        self.client.update_recipient(1, old_email="a@example.com", columns={"A": "b"})
+        self.client.select_recipient_data(1, "a@example.com")
+        self.client.select_recipient_data(2, "a@example.com")
+
+        # The second read of list 2 is still cached.
+        self.assertEqual(4, len(self.client.session.requests))
+
+    def test_writes_without_list_invalidate_everything(self):
+        self.client.get_list_meta_data(1)
+        self.client.create_contact_list(1, "New list", 1)
+        self.client.get_list_meta_data(1)
+        self.assertEqual(3, len(self.client.session.requests))
+
+    def test_shared_backend_is_namespaced_per_account(self):
+        backend = MemoryCache()
+        self.client = make_client(cache=ResponseCache(backend))
+        other = Silverpop("other", "secret", "refresh", 2, cache=ResponseCache(backend))
+        other.token = self.client.token
+        other.session = self.client.session
+
+        self.client.get_list_meta_data(1)
+        other.get_list_meta_data(1)
+        make_client(cache=ResponseCache(backend)).get_list_meta_data(1)
+        self.assertEqual(2, len(self.client.session.requests))
+
+    def test_typed_results_are_cached(self):
+        client = make_client(cache=ResponseCache(), typed_results=True)
+        result = client.select_recipient_data(1, "a@example.com")
+        self.assertIs(result, client.select_recipient_data(1, "a@example.com"))
@@ -0,0 +1,75 @@
+import threading
+import time
+import unittest
+
+from silverpop.coalesce import Coalescer
+from silverpop.tests.helpers import FakeSession, make_client
+
+
+class TestCoalescer(unittest.TestCase):
+
+    def run_concurrently(self, coalescer, key, func, count=8):
+        results = []
+        errors = []
+
+        def call():
+            try:
+                results.append(coalescer.call(key, func))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def test_concurrent_calls_share_result(self):
+        coalescer = Coalescer()
+        calls = []
+
+        def func():
+            calls.append(1)
+            time.sleep(0.05)
+            return object()
+
+        results, errors = self.run_concurrently(coalescer, b"key", func)
+        self.assertEqual(1, len(calls))
+        self.assertEqual(8, len(results))
+        self.assertEqual(1, len(set(id(result) for result in results)))
+        self.assertEqual(0, len(coalescer))
+
+    def test_exceptions_are_shared(self):
+        def func():
+            time.sleep(0.05)
+            raise ValueError("nope")
+
+        results, errors = self.run_concurrently(Coalescer(), b"key", func)
+        self.assertEqual([], results)
+        self.assertEqual(8, len(errors))
+
+    def test_sequential_calls_are_not_coalesced(self):
+        coalescer = Coalescer()
+        self.assertNotEqual(coalescer.call(b"key", object), coalescer.call(b"key", object))
+
+
+class TestCoalesceReads(unittest.TestCase):
+
+    def setUp(self):
+        self.client = make_client(FakeSession(delay=0.05), coalesce_reads=True)
+
+    def test_identical_reads_share_request(self):
+        futures = [self.client.submit(self.client.get_list_meta_data, 1) for i in range(6)]
+        futures.append(self.client.submit(self.client.get_list_meta_data, 2))
+        responses = [future.result() for future in futures]
+
+        self.assertEqual(2, len(self.client.session.requests))
+        self.assertIs(responses[0], responses[5])
+
+    def test_writes_are_not_coalesced(self):
+        futures = [self.client.submit(self.client.update_recipient, 1, "a@example.com")
+                   for i in range(3)]
+        for future in futures:
+            future.result()
+        self.assertEqual(3, len(self.client.session.requests))
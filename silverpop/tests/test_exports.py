@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from silverpop.api import Silverpop
+from silverpop.exports import ExportReader, column_names, field_names
+from silverpop.fakeserver import FakeSilverpopServer
+from silverpop.transfer import LocalDirectoryTransfer
+
+
+EXPORT = (
+    u"\ufeffEmail,Opt In Date,RecipientId,Notes\r\n"
+    u"a@example.com,01/01/2020,1,\"Line one\r\nline two\"\r\n"
+    u"zoë@example.com,,2,\"Comma, \"\"quoted\"\"\"\r\n").encode("utf-8")
+
+
+class RemoteOnlyTransfer(LocalDirectoryTransfer):
+    def local_path(self, remote_name):
+        return None
+
+
+class TestExportReader(unittest.TestCase):
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.transfer = LocalDirectoryTransfer(root)
+
+    def write(self, name, content):
+        with open(os.path.join(self.transfer.download_directory, name), "wb") as f:
+            f.write(content)
+
+    def assertRows(self, reader):
+        rows = list(reader)
+        self.assertEqual([u"Email", u"Opt In Date", u"RecipientId", u"Notes"], reader.header)
+        self.assertEqual(2, len(rows))
+        self.assertEqual(u"a@example.com", rows[0].Email)
+        self.assertEqual(u"Line one\r\nline two", rows[0].Notes)
+        self.assertEqual(2, rows[1].RecipientId)
+        self.assertIsNone(rows[1].Opt_In_Date)
+        self.assertEqual(u"Comma, \"quoted\"", rows[1]["Notes"])
+
+    def test_csv(self):
+        self.write("export.CSV", EXPORT)
+        self.assertRows(ExportReader(
+            self.transfer, "/download/export.CSV", converters={"RecipientId": int}))
+
+    def test_mmap(self):
+        self.write("export.CSV", EXPORT)
+        self.assertRows(ExportReader(
+            self.transfer, "export.CSV", converters={"RecipientId": int}, use_mmap=True))
+
+        self.write("empty.CSV", b"")
+        self.assertEqual([], list(ExportReader(self.transfer, "empty.CSV", use_mmap=True)))
+
+    def test_zip(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            archive.writestr("export.CSV", EXPORT)
+        self.write("export.zip", buffer.getvalue())
+
+        for transfer in (self.transfer, RemoteOnlyTransfer(self.transfer.root)):
+            self.assertRows(ExportReader(
+                transfer, "export.zip", converters={"RecipientId": int}))
+
+    def test_tab_format(self):
+        self.write("export.TAB", b"A\tB\r\n1\t2\r\n")
+        rows = list(ExportReader(self.transfer, "export.TAB", export_format="TAB"))
+        self.assertEqual((u"1", u"2"), (rows[0].A, rows[0].B))
+
+    def test_field_names(self):
+        self.assertEqual(
+            ["Opt_In_Date", "column_1st", "A", "A_2", "column"],
+            field_names([u"Opt In Date", u"1st", u"A", u"A", u""]))
+
+    def test_reserved_field_names(self):
+        header = [u"extra", u"get", u"as_dict", u"_fields", u"class", u"__", u"EMAIL"]
+        self.assertEqual(
+            ["extra_", "get_", "as_dict_", "fields_", "class_", "column_", "EMAIL"],
+            field_names(header))
+
+        self.write("export.csv", b"extra,get,_fields,EMAIL\r\n1,2,3,a@example.com\r\n")
+        row, = ExportReader(self.transfer, "export.csv")
+        self.assertEqual((u"1", u"2", u"3"), (row.extra_, row.get_, row.fields_))
+        self.assertIsNone(row.extra)
+        self.assertEqual(u"a@example.com", row.get("EMAIL"))
+
+
+class TestExportMethods(unittest.TestCase):
+
+    def test_requests(self):
+        xml = Silverpop.raw_recipient_data_export.api_method.build_request(
+            mailing_id=5, opens=True, columns=column_names(["CustomerId"]))
+        self.assertEqual(
+            b"<Envelope><Body><RawRecipientDataExport><MAILING_ID>5</MAILING_ID><OPENS />"
+            b"<COLUMNS><COLUMN><NAME>CustomerId</NAME></COLUMN></COLUMNS>"
+            b"</RawRecipientDataExport></Body></Envelope>", xml)
+
+        xml = Silverpop.export_list.api_method.build_request(
+            1, "ALL", "CSV", export_columns=["EMAIL", "Name"])
+        self.assertIn(
+            b"<EXPORT_COLUMNS><COLUMN>EMAIL</COLUMN><COLUMN>Name</COLUMN></EXPORT_COLUMNS>", xml)
+
+    def test_responses(self):
+        with FakeSilverpopServer() as server:
+            client = server.client()
+            self.assertTrue(client.export_list(1, "ALL", "CSV").FILE_PATH.startswith("/download/"))
+            mailing = client.raw_recipient_data_export(mailing_id=5).MAILING
+            self.assertTrue(mailing["JOB_ID"])
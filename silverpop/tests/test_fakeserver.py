@@ -0,0 +1,90 @@
+import os
+import time
+import unittest
+
+from silverpop.api import SilverpopHTTPException, SilverpopResponseException
+from silverpop.fakeserver import INSECURE_TRANSPORT, FakeSilverpopServer, Fault, constant
+from silverpop.retry import RetryPolicy
+
+
+class TestFakeSilverpopServer(unittest.TestCase):
+
+    def serve(self, **kwargs):
+        server = FakeSilverpopServer(seed=1, **kwargs).start()
+        self.addCleanup(server.stop)
+        return server
+
+    def test_calls(self):
+        server = self.serve()
+        client = server.client(typed_results=True)
+
+        lists = client.get_lists(1, 2, 0)
+        self.assertEqual(["1", "2", "3"], [item["ID"] for item in lists.LIST])
+        self.assertEqual("7", client.get_list_meta_data(7).ID)
+        self.assertTrue(client.add_recipient(1, 1, columns={"EMAIL": "a@example.com"})
+                        .RecipientId)
+        self.assertEqual(1, server.stats["tokens_issued"])
+        self.assertEqual(1, server.calls["AddRecipient"])
+
+    def test_streamed_body(self):
+        server = self.serve()
+        client = server.client()
+        client.insert_update_relational_table("1", iter([{"A": "b"}] * 100), stream=True)
+        self.assertEqual(1, server.calls["InsertUpdateRelationalTable"])
+
+    def test_handlers(self):
+        def fail(request):
+            raise Fault("No such list", "256")
+
+        client = self.serve(handlers={"GetListMetaData": fail}).client()
+        with self.assertRaises(SilverpopResponseException) as context:
+            client.get_list_meta_data(1)
+        self.assertEqual("256", context.exception.error_id)
+
+    def test_throttle_and_retry(self):
+        server = self.serve(throttle_rate=0.5)
+        client = server.client(retry_policy=RetryPolicy(max_attempts=20, backoff=0))
+        for i in range(10):
+            client.get_list_meta_data(1)
+        self.assertEqual(10, server.stats["calls"] - server.stats["throttled"])
+        self.assertGreater(server.stats["throttled"], 0)
+
+    def test_errors(self):
+        client = self.serve(error_rate=1).client()
+        with self.assertRaises(SilverpopHTTPException):
+            client.get_list_meta_data(1)
+
+    def test_token_expiry(self):
+        server = self.serve(token_lifetime=1, latency=constant(0))
+        client = server.client()
+        client.refresh_margin = 0.5
+        client.get_list_meta_data(1)
+        time.sleep(1.1)
+        client.get_list_meta_data(1)
+        self.assertEqual(2, server.stats["tokens_issued"])
+
+        server.expire_tokens()
+        with self.assertRaises(SilverpopResponseException):
+            client.get_list_meta_data(1)
+        self.assertEqual(1, server.stats["unauthorized"])
+
+    def test_insecure_transport_restored(self):
+        saved = os.environ.pop(INSECURE_TRANSPORT, None)
+        if saved is not None:
+            self.addCleanup(os.environ.__setitem__, INSECURE_TRANSPORT, saved)
+
+        first = FakeSilverpopServer().start()
+        second = FakeSilverpopServer().start()
+        first.client()
+        second.client()
+        self.assertEqual("1", os.environ[INSECURE_TRANSPORT])
+        first.stop()
+        # Still needed by the second server's clients.
+        self.assertEqual("1", os.environ[INSECURE_TRANSPORT])
+        second.stop()
+        self.assertNotIn(INSECURE_TRANSPORT, os.environ)
+
+    def test_recipient_ids(self):
+        server = self.serve()
+        ids = [server.defaults.recipient_id() for i in range(3)]
+        self.assertEqual(["1000", "1001", "1002"], ids)
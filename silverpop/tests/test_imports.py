@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import csv
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from xml.etree import ElementTree
+
+import six
+
+from silverpop.fakeserver import FakeSilverpopServer
+from silverpop.imports import ListImport, OPT_OUT, import_recipients
+from silverpop.transfer import LocalDirectoryTransfer
+
+
+def read_csv(path):
+    if six.PY2:
+        with open(path, "rb") as f:
+            return [[cell.decode("utf-8") for cell in row] for row in csv.reader(f)]
+    with io.open(path, encoding="utf-8", newline="") as f:
+        return list(csv.reader(f))
+
+
+class TestListImport(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_write(self):
+        job = ListImport(5, columns=["EMAIL", "Name", "Subscribed"], directory=self.directory,
+                         contact_lists=[7], name="contacts")
+        records = ({"EMAIL": "%d@example.com" % i, "Name": u"Zoë, \"%d\"" % i,
+                    "Subscribed": i % 2 == 0} for i in range(3))
+        self.assertEqual(3, job.write(records))
+
+        rows = read_csv(os.path.join(self.directory, "contacts.csv"))
+        self.assertEqual(["EMAIL", "Name", "Subscribed"], rows[0])
+        self.assertEqual(["1@example.com", u"Zoë, \"1\"", "No"], rows[2])
+
+        mapping = ElementTree.parse(os.path.join(self.directory, "contacts.xml")).getroot()
+        self.assertEqual("ADD_AND_UPDATE", mapping.findtext("LIST_INFO/ACTION"))
+        self.assertEqual("5", mapping.findtext("LIST_INFO/LIST_ID"))
+        self.assertEqual(["EMAIL"], [e.text for e in mapping.findall("SYNC_FIELDS/*/NAME")])
+        self.assertEqual(
+            [("1", "EMAIL"), ("2", "Name"), ("3", "Subscribed")],
+            [(c.findtext("INDEX"), c.findtext("NAME")) for c in mapping.findall("MAPPING/COLUMN")])
+        self.assertEqual("7", mapping.findtext("CONTACT_LISTS/CONTACT_LIST_ID"))
+
+    def test_columns_from_first_record(self):
+        job = ListImport(5, action=OPT_OUT, directory=self.directory)
+        job.write(iter([{"EMAIL": "a@example.com"}, {"EMAIL": "b@example.com"}]))
+        self.assertEqual(["EMAIL"], job.columns)
+        self.assertEqual(3, len(read_csv(job.source_path)))
+
+    def test_unknown_column(self):
+        job = ListImport(5, columns=["EMAIL"], directory=self.directory)
+        with self.assertRaises(ValueError):
+            job.write([{"EMAIL": "a@example.com", "Other": 1}])
+
+    def test_invalid_action(self):
+        with self.assertRaises(ValueError):
+            ListImport(5, action="DELETE")
+
+
+class TestImportRecipients(unittest.TestCase):
+
+    def test_import(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        transfer = LocalDirectoryTransfer(root)
+
+        with FakeSilverpopServer() as server:
+            client = server.client()
+            response = client.import_recipients(
+                transfer, 5, ({"EMAIL": "%d@example.com" % i} for i in range(1000)),
+                name="batch")
+
+        self.assertTrue(response.JOB_ID)
+        self.assertEqual({"ImportList": 1}, server.calls)
+        self.assertEqual(["batch.csv", "batch.xml"], sorted(os.listdir(transfer.upload_directory)))
+        self.assertEqual(1001, len(read_csv(os.path.join(transfer.upload_directory, "batch.csv"))))
+
+    def test_files_cleaned_up_on_failure(self):
+        class Failing(LocalDirectoryTransfer):
+            def upload(self, local_path, remote_name):
+                self.uploaded_from = local_path
+                raise IOError("disconnected")
+
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        transfer = Failing(root)
+        with self.assertRaises(IOError):
+            import_recipients(None, transfer, 5, [{"EMAIL": "a@example.com"}])
+        self.assertFalse(os.path.exists(transfer.uploaded_from))
@@ -0,0 +1,158 @@
+import threading
+import time
+import unittest
+
+from silverpop.api import SilverpopHTTPException
+from silverpop.bulk import CallResult
+from silverpop.fakeserver import FakeSilverpopServer
+from silverpop.jobs import JobFailed, JobTracker, job_id_of
+
+
+class StatusResponse(object):
+    def __init__(self, status):
+        self.JOB_STATUS = status
+
+
+class ScriptedClient(object):
+    """
+    Answers polls from a list of statuses (or exceptions, or responses) per
+    job.
+    """
+    def __init__(self, **script):
+        self.script = script
+        self.polls = []
+        self.batches = []
+
+    def map(self, method, items, max_workers=None):
+        self.batches.append(len(items))
+        for index, item in enumerate(items):
+            job_id = item["job_id"]
+            self.polls.append((job_id, time.time()))
+            outcome = self.script[job_id].pop(0)
+            if isinstance(outcome, Exception):
+                yield CallResult(index, item, None, outcome)
+            elif isinstance(outcome, str):
+                yield CallResult(index, item, StatusResponse(outcome), None)
+            else:
+                yield CallResult(index, item, outcome, None)
+
+
+class TestJobTracker(unittest.TestCase):
+
+    def tracker(self, client, **kwargs):
+        kwargs.setdefault("initial_interval", 0.01)
+        tracker = JobTracker(client, **kwargs)
+        self.addCleanup(tracker.close)
+        return tracker
+
+    def test_backoff_while_unchanged(self):
+        client = ScriptedClient(a=["WAITING", "WAITING", "WAITING", "RUNNING", "COMPLETE"])
+        handle = self.tracker(client, backoff=3).track("a")
+
+        self.assertEqual("COMPLETE", handle.result(timeout=5).JOB_STATUS)
+        times = [at for job_id, at in client.polls]
+        gaps = [b - a for a, b in zip(times, times[1:])]
+        self.assertGreater(gaps[1], gaps[0] * 2)
+        # A status change resets nothing, but doesn't back off either.
+        self.assertLess(gaps[3], gaps[2] * 2)
+        self.assertEqual(5, handle.polls)
+
+    def test_failed_job(self):
+        client = ScriptedClient(a=["RUNNING", "ERROR"])
+        handle = self.tracker(client).track("a")
+        with self.assertRaises(JobFailed) as context:
+            handle.result(timeout=5)
+        self.assertEqual("ERROR", context.exception.status)
+
+    def test_poll_errors(self):
+        error = SilverpopHTTPException(503)
+        client = ScriptedClient(a=[error, "COMPLETE"], b=[error, error])
+        tracker = self.tracker(client, max_errors=2, backoff=1)
+        a, b = tracker.track("a"), tracker.track("b")
+
+        self.assertEqual("COMPLETE", a.result(timeout=5).JOB_STATUS)
+        self.assertIs(error, b.exception(timeout=5))
+
+    def test_callbacks_and_batches(self):
+        script = dict(("job%d" % i, ["RUNNING", "COMPLETE"]) for i in range(20))
+        client = ScriptedClient(**script)
+        done = []
+        event = threading.Event()
+
+        def callback(handle):
+            done.append(handle.job_id)
+            if len(done) == 20:
+                event.set()
+
+        tracker = self.tracker(client, initial_interval=0.05, backoff=1)
+        handles = [tracker.track(job_id, callback=callback) for job_id in sorted(script)]
+        self.assertTrue(tracker.wait(handles, timeout=5))
+        self.assertTrue(event.wait(5))
+        self.assertEqual(40, len(client.polls))
+        self.assertLess(len(client.batches), 40)
+
+    def test_rate_limit(self):
+        script = dict(("job%d" % i, ["RUNNING", "COMPLETE"]) for i in range(6))
+        client = ScriptedClient(**script)
+        tracker = self.tracker(client, max_polls_per_second=10, backoff=1)
+        started = time.time()
+        handles = [tracker.track(job_id) for job_id in script]
+
+        self.assertTrue(tracker.wait(handles, timeout=5))
+        # The first six polls use up 0.6 seconds of the budget before the
+        # second round may start.
+        self.assertGreaterEqual(time.time() - started, 0.6)
+        self.assertEqual(12, len(client.polls))
+
+    def test_cancelled_while_polled(self):
+        class CancelledResponse(object):
+            # The caller cancels once the poll's response is being read.
+            @property
+            def JOB_STATUS(self):
+                a.future.cancel()
+                return "COMPLETE"
+
+        client = ScriptedClient(a=[CancelledResponse()], b=["RUNNING", "COMPLETE"])
+        tracker = self.tracker(client)
+        a, b = tracker.track("a"), tracker.track("b")
+        self.assertEqual("COMPLETE", b.result(timeout=5).JOB_STATUS)
+        self.assertTrue(a.future.cancelled())
+
+    def test_polling_survives_errors(self):
+        client = ScriptedClient(a=["RUNNING", "COMPLETE"])
+        poll = client.map
+        failures = [RuntimeError("pool is shut down")]
+
+        def map(method, items, max_workers=None):
+            if failures:
+                raise failures.pop()
+            return poll(method, items, max_workers)
+        client.map = map
+
+        handle = self.tracker(client).track("a")
+        self.assertEqual("COMPLETE", handle.result(timeout=5).JOB_STATUS)
+
+    def test_close_cancels_pending(self):
+        client = ScriptedClient(a=["RUNNING"] * 100)
+        tracker = JobTracker(client, initial_interval=60)
+        handle = tracker.track("a")
+        tracker.close()
+        self.assertTrue(handle.future.cancelled())
+        self.assertFalse(tracker.wait([handle], timeout=0))
+
+
+class TestJobsAgainstServer(unittest.TestCase):
+
+    def test_submit(self):
+        with FakeSilverpopServer(job_polls=2) as server:
+            client = server.client()
+            with JobTracker(client, initial_interval=0.01) as tracker:
+                handles = [tracker.submit("export_list", 1, "ALL", "CSV") for i in range(5)]
+                handles.append(tracker.submit("raw_recipient_data_export", mailing_id=1))
+                for handle in handles:
+                    self.assertEqual("COMPLETE", handle.result(timeout=5).JOB_STATUS)
+                self.assertEqual(18, server.calls["GetJobStatus"])
+
+    def test_job_id_of(self):
+        with self.assertRaises(ValueError):
+            job_id_of(object())
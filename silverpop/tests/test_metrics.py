@@ -0,0 +1,82 @@
+import unittest
+
+from silverpop.api import SilverpopResponseException
+from silverpop.metrics import CallEvent, Histogram, MetricsRegistry
+from silverpop.retry import RetryPolicy
+from silverpop.tests.helpers import FAULT, SUCCESS, FakeResponse, FakeSession, make_client
+
+
+def make_recorded_client(*responses, **kwargs):
+    events = []
+    client = make_client(FakeSession(responses), hooks=[events.append], **kwargs)
+    return client, events
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_cumulative(self):
+        histogram = Histogram((0.1, 1))
+        for value in (0.05, 0.5, 0.7, 5):
+            histogram.observe(value)
+        self.assertEqual([(0.1, 1), (1, 3), ("+Inf", 4)], histogram.cumulative())
+        self.assertAlmostEqual(6.25, histogram.sum)
+
+
+class TestCallEvents(unittest.TestCase):
+
+    def test_success(self):
+        client, events = make_recorded_client()
+        client.get_list_meta_data(1)
+
+        event, = events
+        self.assertEqual("GetListMetaData", event.cmd_name)
+        self.assertEqual("success", event.outcome)
+        self.assertEqual(1, event.attempts)
+        self.assertEqual(len(client.get_list_meta_data.api_method.build_request(1)),
+                         event.request_bytes)
+        self.assertEqual(len(SUCCESS), event.response_bytes)
+        self.assertGreaterEqual(event.duration, event.network_time + event.parse_time)
+
+    def test_fault(self):
+        client, events = make_recorded_client(FakeResponse(FAULT))
+        with self.assertRaises(SilverpopResponseException):
+            client.get_list_meta_data(1)
+        self.assertEqual("fault", events[0].outcome)
+
+    def test_retries(self):
+        client, events = make_recorded_client(
+            503, retry_policy=RetryPolicy(backoff=0))
+        client.get_list_meta_data(1)
+        self.assertEqual(1, events[0].retries)
+        self.assertEqual("success", events[0].outcome)
+
+    def test_failing_hook_does_not_fail_call(self):
+        def broken(event):
+            raise ValueError()
+
+        client, events = make_recorded_client()
+        client.hooks.insert(0, broken)
+        client.get_list_meta_data(1)
+        self.assertEqual(1, len(events))
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def test_export_text(self):
+        registry = MetricsRegistry(buckets=(1,))
+        event = CallEvent("GetLists")
+        event.attempts = 2
+        event.request_bytes = 10
+        event.response_bytes = 20
+        registry.observe(event.finish())
+        registry.observe(CallEvent("GetLists").finish(SilverpopResponseException("x")))
+
+        text = registry.export_text()
+        self.assertIn('silverpop_calls_total{method="GetLists",outcome="success"} 1', text)
+        self.assertIn('silverpop_calls_total{method="GetLists",outcome="fault"} 1', text)
+        self.assertIn('silverpop_retries_total{method="GetLists"} 1', text)
+        self.assertIn('silverpop_response_bytes_total{method="GetLists"} 20', text)
+        self.assertIn('silverpop_call_duration_seconds_bucket'
+                      '{le="+Inf",method="GetLists",phase="total"} 2', text)
+        self.assertIn('silverpop_call_duration_seconds_count'
+                      '{method="GetLists",phase="network"} 1', text)
@@ -0,0 +1,261 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from silverpop.fakeserver import Fault, FakeSilverpopServer
+from silverpop.outbox import FAILED, PENDING, SENDING, SENT, Outbox
+
+
+class TestOutbox(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "outbox.db")
+
+        self.requests = []
+
+        def record(request):
+            self.requests.append((request.tag, request.findtext("LIST_ID")))
+            return (("RecipientId", "1"),)
+
+        self.handlers = {"UpdateRecipient": record, "AddRecipient": record,
+                         "OptOutRecipient": record}
+        self.server = FakeSilverpopServer(handlers=self.handlers)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.client = self.server.client()
+
+    def outbox(self, **kwargs):
+        outbox = Outbox(self.client, self.path, **kwargs)
+        self.addCleanup(outbox.close)
+        return outbox
+
+    def test_queued_then_delivered_in_order(self):
+        outbox = self.outbox()
+        first = outbox.add_recipient(1, 2, columns={"EMAIL": "a@example.com"})
+        outbox.opt_out_recipient(2, email="a@example.com")
+        outbox.enqueue("update_recipient", 3, old_email="a@example.com")
+        self.assertGreater(first, 0)
+        self.assertEqual({}, self.server.calls)
+        self.assertEqual(3, outbox.counts()[PENDING])
+
+        self.assertEqual(3, outbox.drain())
+        self.assertEqual(
+            [("AddRecipient", "1"), ("OptOutRecipient", "2"), ("UpdateRecipient", "3")],
+            self.requests)
+        self.assertEqual(0, sum(outbox.counts().values()))
+
+    def test_only_writes(self):
+        outbox = self.outbox()
+        with self.assertRaises(AttributeError):
+            outbox.get_lists
+        with self.assertRaises(ValueError):
+            outbox.enqueue("get_lists", 1)
+
+    def test_survives_restart(self):
+        outbox = self.outbox()
+        outbox.update_recipient(1, old_email="a@example.com")
+        outbox.update_recipient(2, old_email="a@example.com")
+        outbox.close()
+
+        # A process that died after claiming the first write.
+        connection = sqlite3.connect(self.path)
+        connection.execute("UPDATE outbox SET state = 'sending', updated = 0 WHERE list_id = '1'")
+        connection.commit()
+        connection.close()
+
+        self.assertEqual(2, self.outbox().drain())
+        self.assertEqual([("UpdateRecipient", "1"), ("UpdateRecipient", "2")], self.requests)
+
+    def test_idempotent_duplicates_replaced(self):
+        outbox = self.outbox()
+        outbox.update_recipient(1, old_email="a@example.com", columns={"A": "1"})
+        outbox.update_recipient(2, old_email="a@example.com", columns={"A": "2"})
+        outbox.update_recipient(1, old_email="a@example.com", columns={"A": "1"})
+        # Not idempotent, so both are kept.
+        outbox.add_recipient(3, 2, columns={"EMAIL": "a@example.com"})
+        outbox.add_recipient(3, 2, columns={"EMAIL": "a@example.com"})
+
+        outbox.drain()
+        self.assertEqual(
+            [("UpdateRecipient", "2"), ("UpdateRecipient", "1"),
+             ("AddRecipient", "3"), ("AddRecipient", "3")],
+            self.requests)
+
+    def test_dedupe_key(self):
+        outbox = self.outbox()
+        first = outbox.add_recipient(1, 2, columns={"EMAIL": "a@example.com"}, dedupe_key="e1")
+        self.assertEqual(first, outbox.add_recipient(1, 2, dedupe_key="e1"))
+        outbox.drain()
+        self.assertEqual(1, outbox.counts()[SENT])
+
+        outbox.add_recipient(1, 2, dedupe_key="e1")
+        outbox.drain()
+        self.assertEqual({"AddRecipient": 1}, self.server.calls)
+
+        # Forgotten once retention has passed.
+        outbox = self.outbox(retention=0)
+        outbox.drain()
+        outbox.add_recipient(1, 2, dedupe_key="e1")
+        outbox.drain()
+        self.assertEqual({"AddRecipient": 2}, self.server.calls)
+
+    def test_retry_and_give_up(self):
+        self.server.error_rate = 1
+        outbox = self.outbox(backoff=0.01, max_attempts=3)
+        outbox.update_recipient(1, old_email="a@example.com")
+        self.assertEqual(0, outbox.drain())
+        self.assertEqual(1, outbox.counts()[PENDING])
+
+        time.sleep(0.02)
+        outbox.drain()
+        time.sleep(0.04)
+        outbox.drain()
+        (row_id, method, attempts, error), = outbox.failed()
+        self.assertEqual(("update_recipient", 3), (method, attempts))
+        self.assertIn("503", error)
+
+        self.server.error_rate = 0
+        self.assertEqual(1, outbox.requeue())
+        self.assertEqual(1, outbox.drain())
+
+    def test_server_errors_retried(self):
+        self.server.error_rate = 1
+        self.server.error_statuses = (500,)
+        outbox = self.outbox(backoff=0.01)
+        outbox.update_recipient(1, old_email="a@example.com")
+        self.assertEqual(0, outbox.drain())
+        self.assertEqual(1, outbox.counts()[PENDING])
+
+        # Refreshing the token fails as well.
+        self.server.refresh_tokens = ()
+        expired = dict(self.client.token, expires_at=0)
+        self.client.token_store.set(self.client.token_key, expired)
+        self.client.token = expired
+        self.server.error_rate = 0
+        time.sleep(0.02)
+        self.assertEqual(0, outbox.drain())
+        self.assertEqual(1, outbox.counts()[PENDING])
+
+        self.server.refresh_tokens = None
+        time.sleep(0.04)
+        self.assertEqual(1, outbox.drain())
+        self.assertEqual([("UpdateRecipient", "1")], self.requests)
+
+    def test_permanent_failure(self):
+        def fault(request):
+            raise Fault("Recipient is not a member of the list", "121")
+        self.handlers["OptOutRecipient"] = fault
+
+        outbox = self.outbox()
+        outbox.opt_out_recipient(1, email="a@example.com")
+        outbox.update_recipient(1, old_email="a@example.com")
+        self.assertEqual(1, outbox.drain())
+        self.assertEqual(1, outbox.counts()[FAILED])
+        self.assertEqual(1, outbox.failed()[0][2])
+
+    def test_rate(self):
+        outbox = self.outbox(rate=20)
+        for i in range(30):
+            outbox.update_recipient(i, old_email="a@example.com")
+        started = time.time()
+        outbox.drain()
+        self.assertGreaterEqual(time.time() - started, 0.45)
+
+    def test_claims_kept_fresh(self):
+        self.assertEqual(5, self.outbox(rate=1, claim_timeout=10).batch_size)
+
+        ages = []
+
+        def record(request):
+            connection = sqlite3.connect(self.path)
+            ages.extend(time.time() - updated for updated, in connection.execute(
+                "SELECT updated FROM outbox WHERE list_id = ?", (request.findtext("LIST_ID"),)))
+            connection.close()
+            return (("RecipientId", "1"),)
+        self.handlers["UpdateRecipient"] = record
+
+        outbox = self.outbox(rate=10)
+        for i in range(1, 6):
+            outbox.update_recipient(i, old_email="a@example.com")
+        outbox.drain()
+        # The last write was claimed about 0.4s before it was sent.
+        self.assertEqual(5, len(ages))
+        self.assertLess(max(ages), 0.2)
+
+    def test_claims_kept_fresh_without_rate(self):
+        ages = []
+
+        def record(request):
+            time.sleep(0.05)
+            connection = sqlite3.connect(self.path)
+            ages.extend(time.time() - updated for updated, in connection.execute(
+                "SELECT updated FROM outbox WHERE state = 'sending' AND list_id > ?",
+                (request.findtext("LIST_ID"),)))
+            connection.close()
+            return (("RecipientId", "1"),)
+        self.handlers["UpdateRecipient"] = record
+
+        outbox = self.outbox(claim_timeout=0.12)
+        for i in range(1, 6):
+            outbox.update_recipient(i, old_email="a@example.com")
+        outbox.drain()
+        # Without a rate, writes wait only on the calls before them.
+        self.assertEqual(10, len(ages))
+        self.assertLess(max(ages), 0.1)
+
+    def test_reclaimed_write_not_sent(self):
+        outbox = self.outbox()
+        other = self.outbox()
+
+        def record(request):
+            # Another process claims the second write once the first one's
+            # claim has gone stale.
+            connection = sqlite3.connect(self.path)
+            connection.execute("UPDATE outbox SET claim = ? WHERE list_id = '2'",
+                               (other._claim_token,))
+            connection.commit()
+            connection.close()
+            return (("RecipientId", "1"),)
+        self.handlers["UpdateRecipient"] = record
+
+        outbox.update_recipient(1, old_email="a@example.com")
+        outbox.update_recipient(2, old_email="a@example.com")
+        self.assertEqual(1, outbox.drain())
+        self.assertEqual({"UpdateRecipient": 1}, self.server.calls)
+        self.assertEqual(1, outbox.counts()[SENDING])
+
+    def test_schema_upgraded(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute(
+            "CREATE TABLE outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, method TEXT NOT NULL, "
+            "list_id TEXT, xml BLOB, dedupe_key TEXT, state TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL, "
+            "next_attempt REAL NOT NULL, updated REAL, last_error TEXT)")
+        connection.close()
+
+        outbox = self.outbox()
+        outbox.update_recipient(1, old_email="a@example.com")
+        self.assertEqual(1, outbox.drain())
+
+    def test_send_request_hooks(self):
+        events = []
+        self.client.hooks = [events.append]
+        outbox = self.outbox()
+        outbox.update_recipient(1, old_email="a@example.com")
+        outbox.drain()
+        event, = events
+        self.assertEqual(("UpdateRecipient", "success"), (event.cmd_name, event.outcome))
+        self.assertGreater(event.request_bytes, 0)
+
+    def test_background_drainer(self):
+        outbox = self.outbox(poll_interval=0.01).start()
+        outbox.update_recipient(1, old_email="a@example.com")
+        deadline = time.time() + 5
+        while self.server.calls.get("UpdateRecipient") != 1 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual({"UpdateRecipient": 1}, self.server.calls)
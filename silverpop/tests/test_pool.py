@@ -0,0 +1,95 @@
+import threading
+import time
+import unittest
+
+from silverpop.fakeserver import FakeSilverpopServer
+from silverpop.pool import ClientPool
+from silverpop.tokens import MemoryTokenStore
+
+
+class TestClientPool(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeSilverpopServer()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def pool(self, **kwargs):
+        pool = ClientPool(configure=self.server.configure, **kwargs)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_reuse(self):
+        pool = self.pool(max_workers=2)
+        client = pool.get("id", "secret", "refresh", 1)
+        self.assertIs(client, pool.get("id", "secret", "refresh", 1))
+        self.assertIsNot(client, pool.get("id", "secret", "other", 1))
+        self.assertIsNot(client, pool.get("id", "secret", "refresh", 2))
+        self.assertEqual(2, client.max_workers)
+        self.assertEqual((1, 3, 3), (pool.hits, pool.misses, len(pool)))
+
+    def test_shared_connections_per_pod(self):
+        pool = self.pool()
+        first = pool.get("a", "secret", "refresh", 1)
+        second = pool.get("b", "secret", "refresh", 1)
+        other_pod = pool.get("a", "secret", "refresh", 2)
+
+        adapter = first.session.get_adapter(first.api_endpoint)
+        self.assertIs(adapter, second.session.get_adapter(second.api_endpoint))
+        self.assertIsNot(adapter, other_pod.session.get_adapter(other_pod.api_endpoint))
+
+        first.get_lists(0, 1, 0)
+        second.get_lists(0, 1, 0)
+        self.assertEqual(1, len(adapter.poolmanager.pools))
+
+    def test_tokens_survive_eviction(self):
+        store = MemoryTokenStore()
+        pool = self.pool(token_store=store, idle_timeout=0.05)
+        client = pool.get("id", "secret", "refresh", 1)
+        client.get_lists(0, 1, 0)
+        self.assertIs(store, client.token_store)
+
+        time.sleep(0.1)
+        self.assertEqual(1, pool.evict_idle())
+        self.assertEqual(0, len(pool))
+        rebuilt = pool.get("id", "secret", "refresh", 1)
+        self.assertIsNot(client, rebuilt)
+        rebuilt.get_lists(0, 1, 0)
+        self.assertEqual(1, self.server.stats["tokens_issued"])
+
+        # An evicted client that is still referenced keeps working.
+        client.submit("get_lists", 0, 1, 0).result()
+
+    def test_idle_clients_evicted_on_get(self):
+        pool = self.pool(idle_timeout=0.05)
+        pool.get("a", "secret", "refresh", 1)
+        time.sleep(0.1)
+        pool.get("b", "secret", "refresh", 1)
+        self.assertEqual((1, 1), (len(pool), pool.evictions))
+
+    def test_max_clients(self):
+        pool = self.pool(max_clients=2, idle_timeout=None)
+        a = pool.get("a", "secret", "refresh", 1)
+        pool.get("b", "secret", "refresh", 1)
+        self.assertIs(a, pool.get("a", "secret", "refresh", 1))
+        pool.get("c", "secret", "refresh", 1)
+        # "b" was the least recently used.
+        self.assertIs(a, pool.get("a", "secret", "refresh", 1))
+        self.assertEqual((2, 1, 3), (len(pool), pool.evictions, pool.misses))
+
+    def test_concurrent_get(self):
+        pool = self.pool()
+        clients = []
+        barrier = threading.Event()
+
+        def get():
+            barrier.wait()
+            clients.append(pool.get("id", "secret", "refresh", 1))
+
+        threads = [threading.Thread(target=get) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        barrier.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, len(set(clients)))
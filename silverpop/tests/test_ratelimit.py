@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from silverpop.ratelimit import FileTokenBucket, RateLimiter, TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_burst_then_wait(self):
+        bucket = TokenBucket(rate=10, capacity=2)
+        self.assertEqual(0, bucket.reserve())
+        self.assertEqual(0, bucket.reserve())
+        self.assertAlmostEqual(0.1, bucket.reserve(), delta=0.05)
+        self.assertAlmostEqual(0.2, bucket.reserve(), delta=0.05)
+
+    def test_invalid_rate(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+
+
+class TestFileTokenBucket(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "bucket")
+
+    def test_budget_is_shared_between_instances(self):
+        first = FileTokenBucket(self.path, rate=10, capacity=2)
+        second = FileTokenBucket(self.path, rate=10, capacity=2)
+
+        self.assertEqual(0, first.reserve())
+        self.assertEqual(0, second.reserve())
+        self.assertAlmostEqual(0.1, first.reserve(), delta=0.05)
+        self.assertAlmostEqual(0.2, second.reserve(), delta=0.05)
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_command_and_org_buckets(self):
+        limiter = RateLimiter(
+            TokenBucket(rate=10, capacity=3),
+            commands={"AddRecipient": TokenBucket(rate=1, capacity=1)})
+
+        self.assertEqual(0, limiter.reserve("AddRecipient"))
+        self.assertAlmostEqual(1, limiter.reserve("AddRecipient"), delta=0.05)
+        # The org bucket was drawn from by both calls above.
+        self.assertEqual(0, limiter.reserve("GetLists"))
+        self.assertAlmostEqual(0.1, limiter.reserve("GetLists"), delta=0.05)
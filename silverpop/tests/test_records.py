@@ -0,0 +1,80 @@
+import pickle
+import unittest
+
+from silverpop.api import Silverpop
+from silverpop.records import RecordTable, record_class
+from silverpop.tests.helpers import FakeSession, make_client
+
+
+Person = record_class("Person", ("EMAIL", "NAME"))
+
+
+class TestRecord(unittest.TestCase):
+
+    def test_access(self):
+        person = Person("a@example.com", NAME="A")
+        self.assertEqual("a@example.com", person.EMAIL)
+        self.assertEqual("A", person["NAME"])
+        self.assertIsNone(Person().EMAIL)
+        self.assertEqual("fallback", person.get("MISSING", "fallback"))
+        with self.assertRaises(KeyError):
+            person["MISSING"]
+
+    def test_compact(self):
+        self.assertFalse(hasattr(Person(), "__dict__"))
+        with self.assertRaises(AttributeError):
+            Person().EMAIL = "b@example.com"
+
+    def test_from_mapping_keeps_extra_tags(self):
+        person = Person.from_mapping({"EMAIL": "a@example.com", "AGE": "3"})
+        self.assertEqual("3", person["AGE"])
+        self.assertEqual({"EMAIL": "a@example.com", "NAME": None, "AGE": "3"}, person.as_dict())
+
+    def test_equality_and_pickle(self):
+        person = Person("a@example.com", "A", extra={"AGE": "3"})
+        self.assertEqual(person, pickle.loads(pickle.dumps(person)))
+        self.assertNotEqual(person, Person("a@example.com", "A"))
+
+
+class TestRecordTable(unittest.TestCase):
+
+    def test_columns_and_rows(self):
+        table = RecordTable(Person, [
+            {"EMAIL": "a@example.com", "NAME": "A"},
+            Person("b@example.com"),
+            {"EMAIL": "c@example.com", "AGE": "3"},
+        ])
+
+        self.assertEqual(3, len(table))
+        self.assertEqual(["A", None, None], table.column("NAME"))
+        self.assertEqual("b@example.com", table[1].EMAIL)
+        self.assertEqual("3", table[-1]["AGE"])
+        self.assertEqual(
+            ["a@example.com", "b@example.com", "c@example.com"],
+            [person.EMAIL for person in table])
+
+
+RECIPIENT = (
+    b"<Envelope><Body><RESULT><SUCCESS>TRUE</SUCCESS><EMAIL>a@example.com</EMAIL>"
+    b"<RecipientId>42</RecipientId><COLUMNS><COLUMN><NAME>First</NAME>"
+    b"<VALUE>A</VALUE></COLUMN></COLUMNS><Unexpected>x</Unexpected>"
+    b"</RESULT></Body></Envelope>")
+
+
+class TestTypedResults(unittest.TestCase):
+
+    def test_generated_from_definitions(self):
+        definition = Silverpop.select_recipient_data.api_method
+        self.assertEqual("SelectRecipientDataResult", definition.result_class.__name__)
+        self.assertEqual("GetListsRecord", Silverpop.get_lists.api_method.record_class.__name__)
+
+    def test_client_returns_typed_results(self):
+        client = make_client(FakeSession(content=RECIPIENT), typed_results=True)
+
+        result = client.select_recipient_data(1, "a@example.com")
+        self.assertEqual("42", result.RecipientId)
+        self.assertEqual({"First": "A"}, result.COLUMNS)
+        self.assertIsNone(result.OptedOut)
+        # Undeclared tags are kept rather than dropped.
+        self.assertEqual({"Unexpected": "x"}, result.extra)
+        self.assertEqual("x", result["Unexpected"])
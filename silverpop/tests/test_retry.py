@@ -0,0 +1,104 @@
+import unittest
+
+import requests
+
+from silverpop.api import SilverpopHTTPException, SilverpopResponseException
+from silverpop.retry import TRANSIENT, UNSENT, RetryBudget, RetryPolicy, classify
+from silverpop.tests import helpers
+
+
+def make_client(failures, **policy_kwargs):
+    policy_kwargs.setdefault("backoff", 0)
+    return helpers.make_client(
+        helpers.FakeSession(failures), retry_policy=RetryPolicy(**policy_kwargs))
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_idempotent_method_retries_dropped_connection(self):
+        client = make_client([requests.exceptions.ConnectionError()])
+        client.get_lists(1, 2, 3)
+        self.assertEqual(2, len(client.session.requests))
+
+    def test_unsafe_method_does_not_retry_dropped_connection(self):
+        client = make_client([requests.exceptions.ConnectionError()])
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            client.send_mailing(1, "a@example.com")
+        self.assertEqual(1, len(client.session.requests))
+
+    def test_caller_can_mark_command_safe(self):
+        client = make_client(
+            [requests.exceptions.ReadTimeout()], retry_commands=["SendMailing"])
+        client.send_mailing(1, "a@example.com")
+        self.assertEqual(2, len(client.session.requests))
+
+    def test_unsent_failures_retry_any_method(self):
+        client = make_client([requests.exceptions.ConnectTimeout(), 503])
+        client.send_mailing(1, "a@example.com")
+        self.assertEqual(3, len(client.session.requests))
+
+    def test_throttle_fault_is_retried(self):
+        fault = SilverpopResponseException(
+            "Too many concurrent requests. Please try again later.", "10")
+        client = make_client([fault])
+        client.schedule_mailing(1, 2, "Mailing")
+        self.assertEqual(2, len(client.session.requests))
+
+    def test_permanent_fault_is_not_retried(self):
+        client = make_client([SilverpopResponseException("Invalid list ID")])
+        with self.assertRaises(SilverpopResponseException):
+            client.get_list_meta_data(1)
+        self.assertEqual(1, len(client.session.requests))
+
+    def test_throttle_faults_are_matched_exactly(self):
+        self.assertEqual(UNSENT, classify(SilverpopResponseException("Throttled", "10")))
+        self.assertEqual(UNSENT, classify(
+            SilverpopResponseException(" Too many concurrent requests. ")))
+        for fault in (SilverpopResponseException("You have exceeded the maximum list size"),
+                      SilverpopResponseException("Mailing not sent, try again tomorrow", "140"),
+                      SilverpopResponseException("Too many concurrent requests", "300")):
+            self.assertIsNone(classify(fault))
+
+    def test_server_error_page_is_retried(self):
+        page = helpers.FakeResponse(b"<html><body>Internal Server Error</body></html>", 500)
+        client = make_client([page])
+        client.get_lists(1, 2, 3)
+        self.assertEqual(2, len(client.session.requests))
+        self.assertEqual(TRANSIENT, classify(SilverpopHTTPException(500)))
+
+        client = make_client([page])
+        with self.assertRaises(SilverpopHTTPException):
+            client.send_mailing(1, "a@example.com")
+        self.assertEqual(1, len(client.session.requests))
+
+    def test_gives_up_after_max_attempts(self):
+        client = make_client([502, 502, 502], max_attempts=3)
+        with self.assertRaises(SilverpopHTTPException):
+            client.get_list_meta_data(1)
+        self.assertEqual(3, len(client.session.requests))
+
+    def test_budget_limits_retries(self):
+        client = make_client([502, 502, 502], max_attempts=5, budget=RetryBudget(minimum=1))
+        with self.assertRaises(SilverpopHTTPException):
+            client.get_list_meta_data(1)
+        self.assertEqual(2, len(client.session.requests))
+
+    def test_backoff(self):
+        policy = RetryPolicy(backoff=1, max_backoff=5, jitter=False)
+        self.assertEqual([1, 2, 4, 5], [policy.delay(attempt) for attempt in range(1, 5)])
+
+
+class TestFaultParsing(unittest.TestCase):
+
+    def test_fault_details(self):
+        from silverpop.api import ApiResponse
+
+        response = helpers.FakeResponse(
+            b"<Envelope><Body><RESULT><SUCCESS>false</SUCCESS></RESULT><Fault>"
+            b"<FaultString>Too many requests</FaultString><detail><error>"
+            b"<errorid>145</errorid></error></detail></Fault></Body></Envelope>")
+        with self.assertRaises(SilverpopResponseException) as context:
+            ApiResponse(response)
+        self.assertEqual("Too many requests", context.exception.fault_string)
+        self.assertEqual("145", context.exception.error_id)
+        self.assertEqual("Too many requests", str(context.exception))
@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from silverpop.tests import helpers
+from silverpop.tokens import FileTokenStore, MemoryTokenStore, token_key
+
+# Token refreshes by every client, across sessions.
+refreshes = []
+
+
+def make_client(**kwargs):
+    return helpers.make_client(
+        helpers.FakeSession(refreshes=refreshes), valid_token=False, **kwargs)
+
+
+class TestTokenRefresh(unittest.TestCase):
+
+    def setUp(self):
+        del refreshes[:]
+
+    def test_proactive_renewal(self):
+        client = make_client()
+        client.token = {"access_token": "old", "expires_at": time.time() + 30}
+
+        client.get_list_meta_data(1)
+        self.assertEqual(1, len(refreshes))
+        self.assertEqual("token-1", client.token["access_token"])
+
+        client.get_list_meta_data(1)
+        self.assertEqual(1, len(refreshes))
+
+    def test_shared_memory_store(self):
+        store = MemoryTokenStore()
+        clients = [make_client(token_store=store) for i in range(5)]
+        threads = [
+            threading.Thread(target=client.get_list_meta_data, args=(1,))
+            for client in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, len(refreshes))
+        self.assertEqual(
+            set(["token-1"]), set(client.token["access_token"] for client in clients))
+
+    def test_different_credentials_do_not_share(self):
+        self.assertNotEqual(token_key("id", "a", 2), token_key("id", "b", 2))
+        self.assertNotEqual(token_key("id", "a", 2), token_key("id", "a", 3))
+        self.assertNotIn("secret", token_key("id", "secret", 2))
+
+
+class TestFileTokenStore(unittest.TestCase):
+
+    def setUp(self):
+        del refreshes[:]
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_round_trip(self):
+        store = FileTokenStore(self.directory)
+        self.assertIsNone(store.get("key"))
+        store.set("key", {"access_token": "abc"})
+        self.assertEqual({"access_token": "abc"}, FileTokenStore(self.directory).get("key"))
+
+    def test_new_client_reuses_persisted_token(self):
+        make_client(token_store=FileTokenStore(self.directory)).get_list_meta_data(1)
+        client = make_client(token_store=FileTokenStore(self.directory))
+        client.get_list_meta_data(1)
+
+        self.assertEqual(1, len(refreshes))
+        self.assertEqual("token-1", client.token["access_token"])
+        self.assertEqual(1, len([
+            name for name in os.listdir(self.directory) if name.endswith(".json")]))
@@ -1,6 +1,7 @@
+# -*- coding: utf-8 -*-
 import unittest
 
-from silverpop.utils import replace_in_nested_mapping, map_to_xml
+from silverpop.utils import replace_in_nested_mapping, map_to_xml, compile_mapping
 
 
 class TestReplaceNestedMapping(unittest.TestCase):
@@ -69,3 +70,36 @@ class TestMapToXml(unittest.TestCase):
 
         xml = map_to_xml(mapping)
         self.assertEqual(expected_xml, xml)
+
+
+class TestSerializationPlan(unittest.TestCase):
+
+    def assertMatchesLegacy(self, mapping, values, command="Cmd"):
+        expected = map_to_xml(replace_in_nested_mapping(mapping, values), command=command)
+        self.assertEqual(expected, compile_mapping(mapping, command=command).render(values))
+
+    def test_scalars(self):
+        mapping = (("ABC", "abc"), ("DEF", "def"), ("GHI", "ghi"))
+        self.assertMatchesLegacy(mapping, {"abc": 1, "def": u"é<&>", "ghi": True})
+
+    def test_no_values(self):
+        mapping = (("ABC", "abc"), ("DEF", (("GHI", "ghi"),)))
+        self.assertMatchesLegacy(mapping, {})
+        self.assertMatchesLegacy(mapping, {}, command=None)
+
+    def test_nested(self):
+        mapping = (("ABC", "abc"), ("DEF", (("GHI", "ghi"), ("JKL", "jkl"))))
+        self.assertMatchesLegacy(mapping, {"ghi": "x"})
+        self.assertMatchesLegacy(mapping, {"ghi": [0]})
+
+    def test_lists_and_dicts(self):
+        mapping = (("COLUMN", "columns"), ("LIST", (("ITEM", "items"),)))
+        self.assertMatchesLegacy(mapping, {
+            "columns": {"a": 1, "b": None, "c": "", "d": [1, 2], "": "x"},
+            "items": [1, (("A", "b"),), {"x": "y"}, [2, 3], False, ()],
+        })
+
+    def test_repeated_tags_fall_back(self):
+        mapping = (("ABC", "abc"), ("ABC", "def"))
+        self.assertMatchesLegacy(mapping, {"abc": "1", "def": "2"})
+        self.assertMatchesLegacy(mapping, {"abc": "1"})
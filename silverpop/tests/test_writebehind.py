@@ -0,0 +1,189 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from silverpop.fakeserver import FakeSilverpopServer
+from silverpop.transfer import LocalDirectoryTransfer
+from silverpop.writebehind import BufferFull, WriteBehindBuffer, recipient_identity
+
+
+def columns_of(request):
+    return dict((column.findtext("NAME"), column.findtext("VALUE"))
+                for column in request.findall("COLUMN"))
+
+
+class TestRecipientIdentity(unittest.TestCase):
+
+    def test_identity(self):
+        self.assertEqual(("recipient_id", 5), recipient_identity(
+            {"recipient_id": 5, "old_email": "a@example.com"}))
+        self.assertEqual(("email", "a@example.com"), recipient_identity(
+            {"old_email": "a@example.com", "columns": {"EMAIL": "b@example.com"}}))
+        self.assertEqual(("email", "b@example.com"), recipient_identity(
+            {"columns": {"Email": "b@example.com"}}))
+        self.assertEqual(("sync_fields", (("CustomerId", "7"),)), recipient_identity(
+            {"sync_fields": {"CustomerId": "7"}}))
+        self.assertIsNone(recipient_identity({"columns": {"Name": "Ann"}}))
+
+
+class TestWriteBehindBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.requests = []
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+        self.release.set()
+
+        def record(request):
+            self.release.wait(5)
+            with self.lock:
+                self.requests.append((request.tag, request.findtext("LIST_ID"),
+                                      columns_of(request)))
+            return (("RecipientId", "1"),)
+
+        self.server = FakeSilverpopServer(
+            handlers={"AddRecipient": record, "UpdateRecipient": record})
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.client = self.server.client()
+
+    def buffer(self, **kwargs):
+        kwargs.setdefault("max_age", 60)
+        buffered = self.client.write_behind(**kwargs)
+        self.addCleanup(buffered.close)
+        self.addCleanup(self.release.set)
+        return buffered
+
+    def test_merge_last_write_wins(self):
+        buffered = self.buffer()
+        futures = [
+            buffered.update_recipient(1, old_email="a@example.com", columns={"Name": "Ann"}),
+            buffered.update_recipient(1, old_email="a@example.com",
+                                      columns={"Name": "Anna", "City": "Oslo"}),
+            buffered.update_recipient(1, old_email="a@example.com", columns={"Zip": "0150"}),
+            buffered.update_recipient(2, old_email="a@example.com", columns={"Name": "Other"}),
+        ]
+        self.assertIsNot(futures[0], futures[2])
+        self.assertEqual(2, buffered.pending())
+        self.assertTrue(buffered.flush(timeout=5))
+
+        self.assertEqual({"UpdateRecipient": 2}, self.server.calls)
+        self.assertEqual([
+            ("UpdateRecipient", "1", {"Name": "Anna", "City": "Oslo", "Zip": "0150"}),
+            ("UpdateRecipient", "2", {"Name": "Other"}),
+        ], sorted(self.requests))
+        self.assertEqual("1", futures[0].result().RecipientId)
+        self.assertIs(futures[0].result(), futures[2].result())
+        self.assertEqual((4, 2), (buffered.calls, buffered.requests))
+
+    def test_different_arguments_kept_in_order(self):
+        self.release.clear()
+        buffered = self.buffer(max_in_flight=8)
+        first = buffered.add_recipient(1, 2, columns={"EMAIL": "a@example.com", "Name": "Ann"})
+        second = buffered.update_recipient(1, old_email="a@example.com", columns={"Name": "B"})
+        third = buffered.add_recipient(1, 2, columns={"EMAIL": "a@example.com", "City": "X"})
+        self.assertEqual(3, len(set([first, second, third])))
+
+        self.release.set()
+        buffered.flush(timeout=5)
+        self.assertEqual(
+            ["AddRecipient", "UpdateRecipient", "AddRecipient"],
+            [tag for tag, list_id, columns in self.requests])
+
+    def test_flush_on_size_and_age(self):
+        buffered = self.buffer(max_size=3)
+        futures = [buffered.update_recipient(1, old_email="%d@example.com" % i, columns={"A": i})
+                   for i in range(3)]
+        for future in futures:
+            future.result(timeout=5)
+
+        buffered = self.buffer(max_age=0.05)
+        buffered.update_recipient(1, old_email="a@example.com").result(timeout=5)
+        self.assertEqual(4, self.server.calls["UpdateRecipient"])
+
+    def test_backpressure(self):
+        self.release.clear()
+        buffered = self.buffer(max_pending=2, put_timeout=0.1)
+        buffered.update_recipient(1, old_email="a@example.com")
+        buffered.update_recipient(1, old_email="b@example.com")
+        # Merging doesn't take up room.
+        buffered.update_recipient(1, old_email="a@example.com", columns={"A": "1"})
+        with self.assertRaises(BufferFull):
+            buffered.update_recipient(1, old_email="c@example.com")
+
+        self.release.set()
+        buffered.update_recipient(1, old_email="c@example.com", columns={"A": "1"})
+        self.assertTrue(buffered.flush(timeout=5))
+        self.assertEqual(3, self.server.calls["UpdateRecipient"])
+
+    def test_cancel_and_close(self):
+        buffered = self.buffer()
+        withdrawn = buffered.update_recipient(1, old_email="a@example.com")
+        kept = buffered.update_recipient(1, old_email="b@example.com")
+        self.assertTrue(withdrawn.cancel())
+        buffered.close()
+
+        self.assertEqual("1", kept.result(timeout=0).RecipientId)
+        self.assertEqual({"UpdateRecipient": 1}, self.server.calls)
+        with self.assertRaises(RuntimeError):
+            buffered.update_recipient(1, old_email="a@example.com")
+
+    def test_cancel_merged_call(self):
+        buffered = self.buffer()
+        withdrawn = buffered.update_recipient(1, old_email="a@example.com", columns={"A": "1"})
+        kept = buffered.update_recipient(1, old_email="a@example.com", columns={"B": "2"})
+        self.assertTrue(withdrawn.cancel())
+        self.assertFalse(kept.cancelled())
+        buffered.flush(timeout=5)
+
+        self.assertEqual("1", kept.result(timeout=0).RecipientId)
+        self.assertEqual([("UpdateRecipient", "1", {"B": "2"})], self.requests)
+
+    def test_no_merge_into_withdrawn_or_running(self):
+        self.release.clear()
+        buffered = self.buffer()
+        buffered.update_recipient(1, old_email="a@example.com", columns={"A": "1"}).cancel()
+        first = buffered.update_recipient(1, old_email="a@example.com", columns={"B": "2"})
+        self.assertEqual(2, buffered.pending())
+        buffered.flush(timeout=0)
+        deadline = time.time() + 5
+        while not first.running() and time.time() < deadline:
+            time.sleep(0.01)
+
+        # The first write is being sent, so this one is buffered after it.
+        second = buffered.update_recipient(1, old_email="a@example.com", columns={"C": "3"})
+        self.assertEqual(3, buffered.pending())
+        self.assertTrue(second.cancel())
+        self.release.set()
+        self.assertTrue(buffered.flush(timeout=5))
+        self.assertEqual("1", first.result(timeout=0).RecipientId)
+        self.assertEqual([("UpdateRecipient", "1", {"B": "2"})], self.requests)
+
+    def test_other_methods_pass_through(self):
+        buffered = self.buffer()
+        self.assertEqual("5", buffered.get_list_meta_data(5).ID)
+
+    def test_bulk_import(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        transfer = LocalDirectoryTransfer(root)
+        buffered = self.buffer(transfer=transfer, bulk_threshold=3)
+
+        futures = [buffered.update_recipient(1, old_email="%d@example.com" % i,
+                                             columns={"Name": str(i)}) for i in range(3)]
+        futures.append(buffered.update_recipient(1, old_email="x@example.com",
+                                                 columns={"City": "Oslo"}))
+        buffered.flush(timeout=5)
+
+        self.assertEqual({"ImportList": 1, "UpdateRecipient": 1}, self.server.calls)
+        self.assertTrue(futures[0].result().JOB_ID)
+        self.assertIs(futures[0].result(), futures[2].result())
+        self.assertEqual(1, len([name for name in os.listdir(transfer.upload_directory)
+                                 if name.endswith(".csv")]))
+
+    def test_bulk_threshold_requires_transfer(self):
+        with self.assertRaises(ValueError):
+            WriteBehindBuffer(self.client, bulk_threshold=10)
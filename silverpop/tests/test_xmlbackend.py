@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import pickle
+import unittest
+
+from silverpop import xmlbackend
+from silverpop.api import (
+    ApiResponse, LazyApiResponse, SilverpopResponseException, StreamingApiResponse)
+from silverpop.tests.helpers import FakeResponse
+
+
+LIST_RESPONSE = (
+    u"<?xml version='1.0' encoding='UTF-8'?>"
+    u"<Envelope><Body><RESULT><SUCCESS>TRUE</SUCCESS><!-- note -->"
+    u"<LIST><ID>1</ID><NAME>Zoë &amp; co</NAME></LIST><LIST><ID>2</ID><NAME>B</NAME></LIST>"
+    u"<COLUMNS><COLUMN><NAME>A</NAME><VALUE>b</VALUE></COLUMN></COLUMNS>"
+    u"</RESULT></Body></Envelope>").encode("utf-8")
+
+FAULT_RESPONSE = (
+    b"<Envelope><Body><RESULT><SUCCESS>false</SUCCESS></RESULT>"
+    b"<Fault><FaultString>Invalid</FaultString><detail><error><errorid>12</errorid>"
+    b"</error></detail></Fault></Body></Envelope>")
+
+
+def parse_all(content):
+    eager = ApiResponse(FakeResponse(content))
+    lazy = LazyApiResponse(FakeResponse(content))
+    stream = StreamingApiResponse(FakeResponse(content), "LIST")
+    return {
+        "eager": (eager.SUCCESS, eager.LIST, eager.COLUMNS),
+        "lazy": (lazy.SUCCESS, lazy.LIST, lazy.COLUMNS),
+        "stream": (list(stream), stream.fields),
+    }
+
+
+class TestBackends(unittest.TestCase):
+
+    def setUp(self):
+        previous = xmlbackend.backend
+        self.addCleanup(setattr, xmlbackend, "backend", previous)
+
+    def backends(self):
+        names = ["stdlib"]
+        if xmlbackend.lxml_installed():
+            names.append("lxml")
+        return names
+
+    def test_backends_parse_identically(self):
+        results = {}
+        for name in self.backends():
+            xmlbackend.set_backend(name)
+            results[name] = parse_all(LIST_RESPONSE)
+
+        expected = results["stdlib"]
+        self.assertEqual(
+            [{"ID": "1", "NAME": u"Zoë & co"}, {"ID": "2", "NAME": "B"}], expected["eager"][1])
+        self.assertEqual(expected["eager"], expected["lazy"])
+        for name, result in results.items():
+            self.assertEqual(expected, result, name)
+
+    def test_faults(self):
+        for name in self.backends():
+            xmlbackend.set_backend(name)
+            for parse in (ApiResponse, LazyApiResponse,
+                          lambda response: list(StreamingApiResponse(response, "LIST"))):
+                with self.assertRaises(SilverpopResponseException) as context:
+                    parse(FakeResponse(FAULT_RESPONSE))
+                self.assertEqual("Invalid", context.exception.fault_string, name)
+
+    def test_parse_errors(self):
+        for name in self.backends():
+            backend = xmlbackend.set_backend(name)
+            with self.assertRaises(backend.ParseError):
+                backend.fromstring(b"<Envelope>")
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            xmlbackend.get_backend("expat")
+
+    def test_stdlib_by_default(self):
+        self.assertEqual("stdlib", xmlbackend.get_backend().name)
+
+    @unittest.skipIf(not xmlbackend.lxml_installed(), "lxml is not installed")
+    def test_auto_prefers_lxml(self):
+        self.assertEqual("lxml", xmlbackend.get_backend("auto").name)
+
+    def test_responses_picklable(self):
+        for name in self.backends():
+            xmlbackend.set_backend(name)
+            responses = [ApiResponse(FakeResponse(LIST_RESPONSE)),
+                         LazyApiResponse(FakeResponse(LIST_RESPONSE)),
+                         LazyApiResponse(FakeResponse(LIST_RESPONSE), keep_tree=True)]
+            for response in responses:
+                copy = pickle.loads(pickle.dumps(response, pickle.HIGHEST_PROTOCOL))
+                self.assertEqual(response.LIST, copy.LIST, name)
+            self.assertEqual("Envelope", copy.response.tag)
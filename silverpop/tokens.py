@@ -0,0 +1,122 @@
+"""
+Storage for OAuth access tokens, so that several :class:`silverpop.api.Silverpop`
+clients, threads or processes can share one valid token instead of each
+requesting their own.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from .utils import file_lock
+
+
+def token_key(client_id, refresh_token, server_number):
+    """
+    Build the key a token is stored under. The credentials are hashed so
+    they never end up in file names or cache keys.
+    """
+    digest = hashlib.sha256(
+        ("%s\0%s" % (client_id, refresh_token)).encode("utf-8")).hexdigest()
+    return "%s-%s" % (server_number, digest[:32])
+
+
+class TokenStore(object):
+    """
+    The interface for token stores. Subclasses implement `get` and `set`;
+    `lock` should be overridden by stores shared between processes, so only
+    one of them refreshes a token at a time.
+    """
+
+    def get(self, key):
+        """
+        Return the stored token ``dict`` for ``key``, or ``None``.
+        """
+        raise NotImplementedError
+
+    def set(self, key, token):
+        """
+        Store the token ``dict`` under ``key``.
+        """
+        raise NotImplementedError
+
+    @contextmanager
+    def lock(self, key):
+        """
+        Hold the refresh lock for ``key``. The default does not lock
+        anything, which is enough for stores owned by a single client.
+        """
+        yield
+
+
+class MemoryTokenStore(TokenStore):
+    """
+    Keep tokens in a dict. Sharing one instance between clients in the same
+    process lets them share tokens and refreshes.
+    """
+
+    def __init__(self):
+        self._tokens = {}
+        self._locks = {}
+        self._mutex = threading.Lock()
+
+    def get(self, key):
+        return self._tokens.get(key)
+
+    def set(self, key, token):
+        self._tokens[key] = dict(token)
+
+    @contextmanager
+    def lock(self, key):
+        with self._mutex:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            yield
+
+
+class FileTokenStore(TokenStore):
+    """
+    :param str directory: The directory to keep token files in.
+
+    Keep each token in a JSON file readable only by the current user. A
+    refresh holds an exclusive file lock, so processes on the same host (and
+    forked workers) refresh a token once and then all reuse it.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        self._thread_locks = MemoryTokenStore()
+
+    def _path(self, key):
+        return os.path.join(self.directory, "%s.json" % key)
+
+    def get(self, key):
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def set(self, key, token):
+        # Write to a temporary file and rename it into place so readers
+        # never see a partially written token.
+        fd, path = tempfile.mkstemp(dir=self.directory, prefix=".%s." % key)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(token, f)
+            os.rename(path, self._path(key))
+        except Exception:
+            os.unlink(path)
+            raise
+
+    @contextmanager
+    def lock(self, key):
+        # flock is per open file description, so threads of this process
+        # need their own lock on top of it.
+        with self._thread_locks.lock(key):
+            with file_lock(self._path(key) + ".lock"):
+                yield
@@ -0,0 +1,86 @@
+"""
+Moving data job files to and from Acoustic.
+
+Data jobs (:mod:`silverpop.imports`, :mod:`silverpop.exports`) read their
+input from, and write their output to, the org's FTP/SFTP server: files to
+import go in its ``upload`` folder and exports appear in its ``download``
+folder. A :class:`FileTransfer` hides how that server is reached, so the
+jobs can run against a local directory instead (see
+:class:`LocalDirectoryTransfer`).
+"""
+import os
+import shutil
+import uuid
+
+
+class FileTransfer(object):
+    """
+    The interface of a file transfer. Subclass it to reach the SFTP server
+    with the library of your choice.
+    """
+
+    def upload(self, local_path, remote_name):
+        """
+        Copy the file at ``local_path`` to ``remote_name`` in the upload
+        folder.
+        """
+        raise NotImplementedError
+
+    def open(self, remote_name):
+        """
+        Open ``remote_name`` in the download folder for reading, as a binary
+        file object.
+        """
+        raise NotImplementedError
+
+    def download(self, remote_name, local_path):
+        """
+        Copy ``remote_name`` from the download folder to ``local_path``.
+        """
+        with self.open(remote_name) as source:
+            with open(local_path, "wb") as destination:
+                shutil.copyfileobj(source, destination)
+        return local_path
+
+    def local_path(self, remote_name):
+        """
+        Return a local path ``remote_name`` can be read from directly
+        (memory-mapped, say), or ``None`` if it has to be downloaded first.
+        """
+        return None
+
+
+class LocalDirectoryTransfer(FileTransfer):
+    """
+    :param str root: A directory standing in for the server, holding
+        ``upload`` and ``download`` folders (created if missing).
+
+    Uploads are copied into ``root/upload``, and reads are served from
+    ``root/download``.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.upload_directory = os.path.join(root, "upload")
+        self.download_directory = os.path.join(root, "download")
+        for directory in (self.upload_directory, self.download_directory):
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+    def _path(self, directory, remote_name):
+        if os.path.basename(remote_name) != remote_name or remote_name in ("", ".", ".."):
+            raise ValueError("Invalid remote file name %r" % remote_name)
+        return os.path.join(directory, remote_name)
+
+    def upload(self, local_path, remote_name):
+        destination = self._path(self.upload_directory, remote_name)
+        # Copy under a temporary name so the file never appears half written.
+        partial = "%s.%s.part" % (destination, uuid.uuid4().hex)
+        shutil.copyfile(local_path, partial)
+        os.rename(partial, destination)
+
+    def open(self, remote_name):
+        return open(self._path(self.download_directory, remote_name), "rb")
+
+    def local_path(self, remote_name):
+        return self._path(self.download_directory, remote_name)
@@ -0,0 +1,437 @@
+"""
+Buffering recipient writes.
+
+Event streams tend to update the same contact several times within seconds,
+and each ``add_recipient`` or ``update_recipient`` call is its own request.
+A :class:`WriteBehindBuffer` holds those calls for a moment and merges the
+ones for the same recipient of the same list before sending them from a
+background thread::
+
+    with client.write_behind(max_age=2.0) as buffered:
+        for event in events:
+            buffered.update_recipient(
+                event.list_id, old_email=event.email, columns=event.changes)
+
+Calls return a ``concurrent.futures.Future`` for the response of the
+(merged) request that carried them. Calls for the same recipient are merged
+when they use the same method and the same arguments apart from
+``columns``, whose values are combined with later calls winning. Anything
+else about the client (``buffered.get_lists(...)``) goes straight through.
+
+With a ``transfer`` and a ``bulk_threshold``, writes that only set columns
+are sent as a single ``ImportList`` job per list and set of columns instead
+(see :mod:`silverpop.imports`) once a flush holds enough of them.
+"""
+import collections
+import logging
+import threading
+import time
+
+from concurrent.futures import Future, wait
+
+from .imports import ADD_AND_UPDATE, ADD_ONLY, UPDATE_ONLY, import_recipients
+
+logger = logging.getLogger(__name__)
+
+#: Arguments that identify a recipient, in order of preference.
+IDENTITY_ARGUMENTS = ("recipient_id", "encoded_recipient_id")
+
+#: Columns that identify a recipient when no identity argument is given.
+EMAIL_COLUMNS = ("EMAIL", "Email", "email")
+
+# The arguments besides ``list_id`` and ``columns`` a write may set and still
+# be sent as part of an import.
+_IMPORT_ARGUMENTS = {
+    "add_recipient": frozenset(["created_from", "update_if_found"]),
+    "update_recipient": frozenset(["old_email"]),
+}
+
+
+class BufferFull(Exception):
+    """
+    Raised when a write couldn't be buffered within ``put_timeout`` seconds
+    because ``max_pending`` writes were already waiting to be sent.
+    """
+
+
+def _email_column(columns):
+    for column in EMAIL_COLUMNS:
+        if columns.get(column):
+            return column
+    return None
+
+
+def recipient_identity(values):
+    """
+    Return a hashable key for the recipient a write with the argument
+    ``values`` is about, or ``None`` if it can't be told.
+    """
+    for name in IDENTITY_ARGUMENTS:
+        if values.get(name):
+            return (name, values[name])
+    if values.get("old_email"):
+        return ("email", values["old_email"])
+
+    sync_fields = values.get("sync_fields")
+    if isinstance(sync_fields, dict) and sync_fields:
+        return ("sync_fields", tuple(sorted(sync_fields.items())))
+
+    columns = values.get("columns")
+    if isinstance(columns, dict):
+        column = _email_column(columns)
+        if column is not None:
+            return ("email", columns[column])
+    return None
+
+
+def _copy_outcome(source, future):
+    # Calls withdrawn before the request was sent are already done.
+    if future.done():
+        return
+    exception = source.exception()
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(source.result())
+
+
+class PendingWrite(object):
+    """
+    One buffered request: the arguments of the calls merged into it, the
+    future of the request, and the future each call was given.
+    """
+    __slots__ = ("method", "values", "future", "created", "round", "calls")
+
+    def __init__(self, method, values, round=0):
+        self.method = method
+        self.values = values
+        self.future = Future()
+        self.created = time.time()
+        self.round = round
+        self.calls = []
+
+    def can_merge(self, method, values):
+        if method != self.method:
+            return False
+        # Calls aren't added to a request being sent, or that every earlier
+        # call has withdrawn from.
+        if self.future.running() or self.future.done():
+            return False
+        if all(future.cancelled() for columns, future in self.calls):
+            return False
+        for name, value in values.items():
+            if name != "columns" and self.values.get(name) != value:
+                return False
+        return True
+
+    def add(self, values):
+        """
+        Add a call with the argument ``values`` and return its future.
+        """
+        future = Future()
+        self.calls.append((values.get("columns"), future))
+        self.future.add_done_callback(lambda done: _copy_outcome(done, future))
+        return future
+
+    def start(self):
+        """
+        Combine the columns of the calls that weren't withdrawn, and mark
+        them and the request as running. Returns ``False``, cancelling the
+        request, if every call was withdrawn.
+        """
+        calls = [(columns, future) for columns, future in self.calls
+                 if future.set_running_or_notify_cancel()]
+        if not calls:
+            self.future.cancel()
+            return False
+
+        if len(calls) == 1:
+            self.values["columns"] = calls[0][0]
+        else:
+            # A plain dict, since only those are serialized as COLUMN pairs.
+            merged = {}
+            for columns, future in calls:
+                merged.update(columns or ())
+            self.values["columns"] = merged or calls[0][0]
+        return self.future.set_running_or_notify_cancel()
+
+    def import_row(self):
+        """
+        Return ``(action, sync_field, record)`` if the write can be sent as
+        part of an ``ImportList`` job, or ``None``.
+        """
+        allowed = _IMPORT_ARGUMENTS[self.method]
+        columns = self.values.get("columns")
+        if not isinstance(columns, dict) or not columns:
+            return None
+        for name, value in self.values.items():
+            if value and name not in allowed and name not in ("list_id", "columns"):
+                return None
+
+        if self.method == "add_recipient":
+            column = _email_column(columns)
+            if column is None:
+                return None
+            action = ADD_AND_UPDATE if self.values.get("update_if_found") else ADD_ONLY
+            return action, column, columns
+
+        # Changing a recipient's address can't be expressed in an import.
+        if not self.values.get("old_email") or _email_column(columns) is not None:
+            return None
+        record = collections.OrderedDict([("EMAIL", self.values["old_email"])])
+        record.update(columns)
+        return UPDATE_ONLY, "EMAIL", record
+
+
+class WriteBehindBuffer(object):
+    """
+    :param client: The :class:`silverpop.api.Silverpop` to send writes with.
+    :param int max_size: Flush once this many requests are buffered.
+    :param float max_age: Flush once the oldest buffered request has waited
+        this many seconds.
+    :param int max_pending: The most requests buffered or being sent at
+        once. Further writes block until a flush makes room.
+    :param float put_timeout: Seconds a write may block for room before
+        :class:`BufferFull` is raised. ``None`` waits forever.
+    :param int max_in_flight: Requests sent concurrently during a flush.
+    :param transfer: A :class:`silverpop.transfer.FileTransfer` to upload
+        import files through.
+    :param int bulk_threshold: Send the writes to one list with the same
+        columns as an ``ImportList`` job when a flush holds at least this
+        many of them. Requires ``transfer``.
+
+    Buffers ``add_recipient`` and ``update_recipient`` calls made through
+    it, merging those about the same recipient, and sends them from a
+    background thread started by the first write.
+
+    Every call gets its own future. Cancelling one before its flush
+    withdraws that call: its columns are left out of the merged request,
+    which is dropped once every call merged into it has been withdrawn.
+    Writes sent as part of an import resolve
+    to the ``ImportList`` response, and don't pass ``created_from`` on.
+    """
+
+    #: The methods whose calls are buffered.
+    buffered_methods = ("add_recipient", "update_recipient")
+
+    def __init__(self, client, max_size=100, max_age=1.0, max_pending=10000, put_timeout=None,
+                 max_in_flight=4, transfer=None, bulk_threshold=None):
+        if bulk_threshold is not None and transfer is None:
+            raise ValueError("bulk_threshold requires a transfer")
+        self.client = client
+        self.max_size = max_size
+        self.max_age = max_age
+        self.max_pending = max_pending
+        self.put_timeout = put_timeout
+        self.max_in_flight = max_in_flight
+        self.transfer = transfer
+        self.bulk_threshold = bulk_threshold
+
+        #: Calls received, and requests sent on their behalf.
+        self.calls = 0
+        self.requests = 0
+
+        self._entries = []
+        self._latest = {}
+        self._in_flight = []
+        self._pending = 0
+        self._flush_requested = False
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def add_recipient(self, *args, **kwargs):
+        return self._put("add_recipient", args, kwargs)
+
+    def update_recipient(self, *args, **kwargs):
+        return self._put("update_recipient", args, kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def pending(self):
+        """
+        The number of requests buffered or being sent.
+        """
+        with self._condition:
+            return self._pending
+
+    def flush(self, timeout=None):
+        """
+        Send everything buffered so far and block until it has been sent,
+        or ``timeout`` seconds have passed. Returns whether it all was.
+        """
+        with self._condition:
+            futures = [future for entry in self._entries + self._in_flight
+                       for columns, future in entry.calls]
+            if self._entries:
+                self._flush_requested = True
+                self._condition.notify_all()
+        done, not_done = wait(futures, timeout)
+        return not not_done
+
+    def close(self, timeout=None):
+        """
+        Stop accepting writes, send the buffered ones and stop the flushing
+        thread.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _put(self, method, args, kwargs):
+        definition = getattr(type(self.client), method).api_method
+        values = definition.bind_arguments(*args, **kwargs)
+        identity = recipient_identity(values)
+        key = (values.get("list_id"), identity) if identity is not None else None
+
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("WriteBehindBuffer is closed")
+            self.calls += 1
+
+            latest = self._latest.get(key) if key is not None else None
+            if latest is not None and latest.can_merge(method, values):
+                return latest.add(values)
+
+            deadline = None if self.put_timeout is None else time.time() + self.put_timeout
+            while self._pending >= self.max_pending:
+                self._flush_requested = True
+                self._condition.notify_all()
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise BufferFull("%d writes are already pending" % self._pending)
+                self._condition.wait(remaining)
+                if self._closed:
+                    raise RuntimeError("WriteBehindBuffer is closed")
+                # The buffer may have been swapped out while waiting.
+                latest = self._latest.get(key) if key is not None else None
+
+            # A call that can't be merged into the recipient's latest write
+            # is sent after it, in a later round of the same flush.
+            entry = PendingWrite(method, values, latest.round + 1 if latest is not None else 0)
+            future = entry.add(values)
+            self._entries.append(entry)
+            if key is not None:
+                self._latest[key] = entry
+            self._pending += 1
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="silverpop-write-behind")
+                self._thread.daemon = True
+                self._thread.start()
+            if len(self._entries) >= self.max_size:
+                self._condition.notify_all()
+            return future
+
+    def _take_entries(self):
+        """
+        Wait until the buffer should be flushed, then swap it out and return
+        its requests. Returns ``None`` once closed and empty.
+        """
+        with self._condition:
+            while True:
+                if self._entries:
+                    if (self._flush_requested or self._closed
+                            or len(self._entries) >= self.max_size
+                            or self._pending >= self.max_pending):
+                        break
+                    age = time.time() - self._entries[0].created
+                    if age >= self.max_age:
+                        break
+                    timeout = self.max_age - age
+                elif self._closed:
+                    return None
+                else:
+                    timeout = None
+                self._condition.wait(timeout)
+
+            entries, self._entries, self._latest = self._entries, [], {}
+            self._in_flight = entries
+            self._flush_requested = False
+            return entries
+
+    def _run(self):
+        while True:
+            entries = self._take_entries()
+            if entries is None:
+                return
+            try:
+                self._send(entries)
+            except Exception as e:
+                logger.exception("Flushing buffered writes failed")
+                for entry in entries:
+                    if not entry.future.done():
+                        entry.future.set_exception(e)
+            with self._condition:
+                self._pending -= len(entries)
+                self._in_flight = []
+                self._condition.notify_all()
+
+    def _send(self, entries):
+        rounds = collections.defaultdict(list)
+        for entry in entries:
+            # Withdrawn writes are dropped; the rest can't be cancelled anymore.
+            if entry.start():
+                rounds[entry.round].append(entry)
+
+        for round in sorted(rounds):
+            batch = rounds[round]
+            if self.bulk_threshold is not None:
+                batch = self._send_imports(batch)
+
+            by_method = collections.OrderedDict()
+            for entry in batch:
+                by_method.setdefault(entry.method, []).append(entry)
+            for method, group in by_method.items():
+                self.requests += len(group)
+                results = self.client.map(
+                    method, [entry.values for entry in group], max_workers=self.max_in_flight)
+                for entry, result in zip(group, results):
+                    if result.ok:
+                        entry.future.set_result(result.response)
+                    else:
+                        logger.warning("Buffered %s failed: %s", method, result.exception)
+                        entry.future.set_exception(result.exception)
+
+    def _send_imports(self, batch):
+        """
+        Send the writes in ``batch`` that are numerous enough as imports.
+        Returns the ones left to send one by one.
+        """
+        groups = collections.OrderedDict()
+        for entry in batch:
+            row = entry.import_row()
+            if row is not None:
+                action, sync_field, record = row
+                key = (action, entry.values["list_id"], sync_field, tuple(record))
+                groups.setdefault(key, []).append((entry, record))
+
+        imported = set()
+        for (action, list_id, sync_field, columns), rows in groups.items():
+            if len(rows) < self.bulk_threshold:
+                continue
+            group = [entry for entry, record in rows]
+            imported.update(group)
+            self.requests += 1
+            try:
+                response = import_recipients(
+                    self.client, self.transfer, list_id, (record for entry, record in rows),
+                    action=action, columns=columns, sync_fields=(sync_field,))
+            except Exception as e:
+                logger.warning("Importing %d buffered writes failed: %s", len(group), e)
+                for entry in group:
+                    entry.future.set_exception(e)
+            else:
+                for entry in group:
+                    entry.future.set_result(response)
+        return [entry for entry in batch if entry not in imported]
@@ -0,0 +1,115 @@
+"""
+The XML parser used for API responses.
+
+The standard library's ``xml.etree.ElementTree`` is used unless ``lxml`` is
+asked for: set the ``SILVERPOP_XML_BACKEND`` environment variable (or call
+`set_backend`) to ``"lxml"``, or to ``"auto"`` to use it whenever it is
+installed. Both produce the same elements as far as response handling is
+concerned: comments and processing instructions are dropped, and external
+entities are never fetched.
+
+lxml only pays off for the up-front check of a
+:class:`silverpop.api.LazyApiResponse`; building a full
+:class:`silverpop.api.ApiResponse` or streaming records is slower with it.
+Documents kept on a response (``ApiResponse.response``, or a lazy response's
+with ``keep_tree``) are always parsed with ElementTree, so responses stay
+picklable and look the same whichever backend is set.
+
+Requests are not built with either: the serializers in
+:mod:`silverpop.utils` write the bytes directly, so the wire output does
+not depend on the backend.
+"""
+import os
+from xml.etree import ElementTree
+
+
+class StdlibBackend(object):
+    """
+    Parses with ``xml.etree.ElementTree``.
+    """
+    name = "stdlib"
+    ParseError = ElementTree.ParseError
+    Element = ElementTree.Element
+
+    def fromstring(self, data):
+        return ElementTree.fromstring(data)
+
+    def iterparse(self, source, events=("end",)):
+        return ElementTree.iterparse(source, events=events)
+
+
+class LxmlBackend(object):
+    """
+    Parses with ``lxml.etree``, which is only imported once one is made.
+    Raises ``ImportError`` if lxml is not installed.
+    """
+    name = "lxml"
+
+    def __init__(self):
+        from lxml import etree
+        self._etree = etree
+        self.ParseError = etree.XMLSyntaxError
+        self.Element = etree.Element
+        # Large exports can hold text nodes over lxml's default 10MB limit.
+        self._parser_options = dict(
+            resolve_entities=False, no_network=True, remove_comments=True, remove_pis=True,
+            huge_tree=True)
+        self._parser = etree.XMLParser(**self._parser_options)
+
+    def fromstring(self, data):
+        return self._etree.fromstring(data, self._parser)
+
+    def iterparse(self, source, events=("end",)):
+        return self._etree.iterparse(source, events=events, **self._parser_options)
+
+
+def lxml_installed():
+    """
+    Whether the ``"lxml"`` backend can be used. Imports lxml to find out.
+    """
+    try:
+        LxmlBackend()
+    except ImportError:
+        return False
+    return True
+
+
+BACKENDS = {
+    "stdlib": StdlibBackend,
+    "lxml": LxmlBackend,
+}
+
+
+def get_backend(name=None):
+    """
+    Return a new backend by name: ``"stdlib"`` (the default, when ``name``
+    is ``None``), ``"lxml"``, or ``"auto"`` for lxml if it is installed.
+    """
+    if name is None:
+        name = "stdlib"
+    elif name == "auto":
+        try:
+            return LxmlBackend()
+        except ImportError:
+            return StdlibBackend()
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError("Unknown XML backend %r, expected one of %s" % (
+            name, ", ".join(sorted(BACKENDS))))
+
+
+#: The backend for documents that are kept on responses.
+stdlib_backend = StdlibBackend()
+
+#: The backend responses are parsed with.
+backend = get_backend(os.environ.get("SILVERPOP_XML_BACKEND"))
+
+
+def set_backend(name):
+    """
+    Switch the backend used from now on, and return it.
+    """
+    global backend
+    backend = get_backend(name)
+    return backend